@@ -2,6 +2,8 @@ import random
 from datetime import datetime, timedelta
 from app import create_app, db
 from app.models import User, Book, BookCopy
+from app.utils.fuzzy_search import index_book_trigrams
+from app.utils.search_cache import catalog_version
 from werkzeug.security import generate_password_hash
 
 def reset_database():
@@ -93,6 +95,8 @@ def add_diverse_books(num_books=100):
         )
         db.session.add(book)
         db.session.commit()  # Commit to get the book ID
+        # Make the book findable by GET /books?mode=fuzzy
+        index_book_trigrams(book)
         
         # Create between 1 and 5 copies for this book
         num_copies = random.randint(1, 5)
@@ -103,6 +107,8 @@ def add_diverse_books(num_books=100):
         db.session.commit()
         print(f"Created book '{book.title}' with {num_copies} copies.")
     
+    # Running servers drop their cached GET /books results
+    catalog_version.bump()
     print("Finished creating diverse books.")
 
 if __name__ == "__main__":
@@ -1,5 +1,7 @@
 from app import create_app, db
 from app.models import Book, BookCopy
+from app.utils.fuzzy_search import index_book_trigrams
+from app.utils.search_cache import catalog_version
 from datetime import datetime
 
 app = create_app()
@@ -23,6 +25,8 @@ book = Book(
 )
 db.session.add(book)
 db.session.commit()
+# Make the book findable by GET /books?mode=fuzzy
+index_book_trigrams(book)
 print(f"Book '{book.title}' added successfully with id {book.id}.")
 
 # Create a single copy for the book with a unique barcode.
@@ -34,4 +38,6 @@ copy = BookCopy(
 )
 db.session.add(copy)
 db.session.commit()
+# Running servers drop their cached GET /books results
+catalog_version.bump()
 print(f"Book copy with barcode '{barcode}' added successfully.")
@@ -2,6 +2,8 @@ import random
 from datetime import datetime
 from app import create_app, db
 from app.models import Book, BookCopy
+from app.utils.fuzzy_search import index_book_trigrams
+from app.utils.search_cache import catalog_version
 
 app = create_app()
 app.app_context().push()
@@ -69,6 +71,8 @@ for i in range(num_books):
     )
     db.session.add(book)
     db.session.commit()  # Commit to get the book ID
+    # Make the book findable by GET /books?mode=fuzzy
+    index_book_trigrams(book)
 
     # Create between 1 and 5 copies for this book
     num_copies = random.randint(1, 5)
@@ -80,4 +84,6 @@ for i in range(num_books):
     db.session.commit()
     print(f"Created book '{book.title}' (Genre: {subject}) by {author} with {num_copies} copies.")
 
+# Running servers drop their cached GET /books results
+catalog_version.bump()
 print("Finished creating diverse books.")
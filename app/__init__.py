@@ -1,4 +1,6 @@
 import atexit
+import os
+import threading
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail
@@ -9,6 +11,13 @@ db = SQLAlchemy()
 mail = Mail()
 
 from app.notify_overdue import notify_overdue_function
+from app.utils.barcode_utils import barcode_cache
+from app.utils.model_loader import start_model_warmup, configure_inference_pool
+from app.utils.prompt_cache import prompt_cache
+from app.utils.schema_upgrade import upgrade_schema
+from app.utils.search_cache import search_cache, catalog_version
+from app.utils.spellcheck import get_corrector
+from app.utils.user_cache import user_status_cache
 
 def start_scheduler(app):
     scheduler = BackgroundScheduler()
@@ -25,11 +34,13 @@ def start_scheduler(app):
     # Ensure the scheduler shuts down when the app exits
     atexit.register(lambda: scheduler.shutdown())
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     
-    # Load configuration
+    # Load configuration; `config` overrides it before the extensions read it (e.g. a test database URI)
     app.config.from_object('app.config.Config')
+    if config:
+        app.config.update(config)
     
     # Initialize extensions with app
     db.init_app(app)
@@ -38,8 +49,31 @@ def create_app():
     # Import and register blueprints/routes
     from app.routes import main
     app.register_blueprint(main)
+
+    # Databases created by an older version lack the newer tables and columns (e.g. book_embeddings)
+    if app.config['SCHEMA_AUTO_UPGRADE']:
+        with app.app_context():
+            upgrade_schema()
     
     # Start the scheduler for background tasks
     start_scheduler(app)
+
+    prompt_cache.configure(app.config['RECOMMENDER_PROMPT_CACHE_SIZE'], app.config['RECOMMENDER_PROMPT_CACHE_TTL'])
+    search_cache.configure(app.config['BOOKS_SEARCH_CACHE_SIZE'], app.config['BOOKS_SEARCH_CACHE_TTL'])
+    catalog_version.configure(
+        os.path.join(app.instance_path, 'catalog_version') if app.config['BOOKS_SEARCH_CACHE_SHARED'] else None
+    )
+    user_status_cache.configure(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+    barcode_cache.configure(app.config['BARCODE_CACHE_SIZE'], os.path.join(app.instance_path, 'barcodes'),
+                            app.config['BARCODE_CACHE_DISK_BYTES'])
+
+    configure_inference_pool(app.config['RECOMMENDER_POOL_WORKERS'],
+                             max_pending=app.config['RECOMMENDER_POOL_MAX_PENDING'],
+                             timeout=app.config['RECOMMENDER_POOL_TIMEOUT'])
+
+    # Load the recommendation model in the background so the first /recommend call does not pay for it
+    if app.config['RECOMMENDER_WARMUP']:
+        start_model_warmup(app.config['RECOMMENDER_MODEL'])
+        threading.Thread(target=get_corrector, name='spellcheck-warmup', daemon=True).start()
     
     return app
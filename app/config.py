@@ -4,6 +4,60 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your_secret_key'# not needed
     SQLALCHEMY_DATABASE_URI = 'sqlite:///library.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Bring an existing database up to the current models when the app starts (see upgrade_db.py): tables,
+    # columns and indexes added since it was created. Off for scripts and tests; run.py turns it on.
+    SCHEMA_AUTO_UPGRADE = os.environ.get('SCHEMA_AUTO_UPGRADE', 'false').lower() == 'true'
+
+    # Page size of GET /books (default and maximum of the limit parameter)
+    BOOKS_PAGE_SIZE = 50
+    BOOKS_MAX_PAGE_SIZE = 200
+    # Maximum number of subject / rack location values returned by GET /books?facets=true
+    BOOKS_FACET_LIMIT = 50
+    # Cache of GET /books responses (entries, seconds). Entries are invalidated by catalog edits and copy
+    # status changes, including those of the bundled scripts (addbook.py, addmanybooks.py, ...); the TTL only
+    # bounds staleness after other writes to the database (e.g. with the sqlite3 shell).
+    # With BOOKS_SEARCH_CACHE_SHARED, worker processes share the catalog version through instance/catalog_version.
+    BOOKS_SEARCH_CACHE_SIZE = 1024
+    BOOKS_SEARCH_CACHE_TTL = 60
+    BOOKS_SEARCH_CACHE_SHARED = True
+    # mode=fuzzy on GET /books: minimum trigram similarity (0-1) and candidates read from the trigram index
+    BOOKS_FUZZY_THRESHOLD = 0.3
+    BOOKS_FUZZY_CANDIDATES = 500
+    # format=ndjson/csv on GET /books, /transactions and /borrowing_history: rows read from the database
+    # cursor per batch and records written per chunk of the streamed response
+    STREAM_CHUNK_SIZE = 500
+
+    # POST /members/bulk and enroll_users.py: processes hashing passwords (0 = in-process), users inserted per
+    # transaction, and the largest number of users per request
+    ENROLL_HASH_WORKERS = int(os.environ.get('ENROLL_HASH_WORKERS', os.cpu_count() or 1))
+    ENROLL_BATCH_SIZE = 1000
+    ENROLL_MAX_ROWS = 50000
+
+    # Maximum number of open loans per member (/checkout and /circulation/batch), and the largest number of
+    # items in one /circulation/batch request
+    MAX_ACTIVE_LOANS = 5
+    CIRCULATION_BATCH_MAX_ITEMS = 100
+
+    # Role and membership status of logged-in users checked by require_active_membership (entries, seconds).
+    # Changes made through the member endpoints apply at once; the TTL bounds how long other worker processes
+    # keep the old status. USER_CACHE_SIZE = 0 reads it once per request instead.
+    USER_CACHE_SIZE = 4096
+    USER_CACHE_TTL = 30
+
+    # Page size of GET /members (default and maximum of the limit parameter)
+    MEMBERS_PAGE_SIZE = 50
+    MEMBERS_MAX_PAGE_SIZE = 200
+
+    # Rendered barcode images: entries kept in memory, and the size limit (bytes) of the store under
+    # instance/barcodes/ that keeps them across restarts and shares them between worker processes
+    BARCODE_CACHE_SIZE = 2048
+    BARCODE_CACHE_DISK_BYTES = 256 * 1024 * 1024
+    # Browser cache lifetime (seconds) of the images served by /barcodes/ (they never change for a code)
+    BARCODE_HTTP_MAX_AGE = 365 * 24 * 3600
+    # POST /labels and print_labels.py: processes rendering label sheet pages (0 = in-process), and the
+    # largest number of labels per request
+    LABEL_SHEET_WORKERS = int(os.environ.get('LABEL_SHEET_WORKERS', os.cpu_count() or 1))
+    LABEL_SHEET_MAX_LABELS = 20000
 
     # Email configuration
     MAIL_SERVER = 'sandbox.smtp.mailtrap.io'
@@ -11,3 +65,46 @@ class Config:
     MAIL_USE_TLS = True
     MAIL_USERNAME = '887d94ff8539c8'
     MAIL_PASSWORD = '0a8005f15672a6'
+
+    # Recommendation model configuration
+    RECOMMENDER_MODEL = 'all-mpnet-base-v2'  # Better performance model. Lighter model : all-MiniLM-L6-v2
+    # Load the model in a background thread when the app starts (set RECOMMENDER_WARMUP=true, run.py does)
+    RECOMMENDER_WARMUP = os.environ.get('RECOMMENDER_WARMUP', 'false').lower() == 'true'
+    # Seconds /recommend waits for the model before answering that it is still warming up
+    RECOMMENDER_LOAD_TIMEOUT = 5
+    # Number of recommendations returned and the minimum cosine similarity for a book to be recommended
+    RECOMMENDER_TOP_K = 3
+    RECOMMENDER_MIN_SIMILARITY = 0.1
+    # Run the model in this many separate processes instead of the web worker (0 = in-process).
+    # Requests submit encode jobs and wait up to RECOMMENDER_POOL_TIMEOUT seconds; once
+    # RECOMMENDER_POOL_MAX_PENDING jobs are queued or running, new requests get a 503 instead of queueing.
+    RECOMMENDER_POOL_WORKERS = int(os.environ.get('RECOMMENDER_POOL_WORKERS', '0'))
+    RECOMMENDER_POOL_MAX_PENDING = 32
+    RECOMMENDER_POOL_TIMEOUT = 10
+
+    # Cache of spell-corrected prompts and their embeddings (entries, seconds)
+    RECOMMENDER_PROMPT_CACHE_SIZE = 2048
+    RECOMMENDER_PROMPT_CACHE_TTL = 3600
+
+    # Seconds between full reloads of the catalog words known to the spell checker (edits made through this
+    # process are applied immediately; the reload picks up edits made by other worker processes)
+    SPELLCHECK_CATALOG_REFRESH = 300
+
+    # Limits for /recommend/batch
+    RECOMMENDER_BATCH_MAX_PROMPTS = 5000
+    RECOMMENDER_BATCH_MAX_TOP_K = 50
+
+    # /recommend/for_me: the weight of a loan in the member's taste profile halves every this many days
+    RECOMMENDER_PROFILE_HALF_LIFE_DAYS = 90
+
+    # Vector index behind /recommend: 'exact' (brute force) or 'ivf' (approximate, sub-linear)
+    RECOMMENDER_INDEX = 'exact'
+    RECOMMENDER_IVF_NLIST = 0  # clusters, 0 = about sqrt(catalog size)
+    RECOMMENDER_IVF_NPROBE = 8  # clusters scanned per query: higher = better recall, slower
+    RECOMMENDER_IVF_MIN_SIZE = 5000  # smaller catalogs always use exact search
+
+    # Book embeddings are memory-mapped from instance/embeddings/ so all worker processes share one copy.
+    # Storage format: 'float32', 'float16' (half the size) or 'int8' (a quarter, per-row scale)
+    RECOMMENDER_STORE_DTYPE = 'float16'
+    # With a quantised store, this many top candidates are re-scored with the exact float32 vectors (0 = off)
+    RECOMMENDER_RERANK_CANDIDATES = 20
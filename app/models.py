@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import text
 from app import db
 
 # Books model
@@ -24,10 +25,55 @@ class BookCopy(db.Model):
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
     unique_barcode = db.Column(db.String(50), unique=True, nullable=False)
     status = db.Column(db.String(20), default='available')  # available, checked-out, reserved
+    # When the copy was added (label sheets for a shipment); NULL for copies added before it was recorded
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        # Finding an available copy of a book (checkout, reserve) and the copies of a book
+        db.Index('ix_book_copies_book_status', 'book_id', 'status'),
+        # Inventory counts per status
+        db.Index('ix_book_copies_status', 'status'),
+    )
 
     def __repr__(self):
         return f"<BookCopy {self.unique_barcode} - {self.status}>"
 
+# Book embeddings model (one stored vector per book, used by /recommend)
+class BookEmbedding(db.Model):
+    __tablename__ = 'book_embeddings'
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)  # sha256 of the embedded text
+    vector = db.Column(db.LargeBinary, nullable=False)  # L2-normalised float32 bytes
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<BookEmbedding {self.book_id}>"
+
+# Trigram index over book titles and authors (one row per distinct trigram of a field, used by fuzzy search)
+class BookTrigram(db.Model):
+    __tablename__ = 'book_trigrams'
+    field = db.Column(db.String(10), primary_key=True)  # title or author
+    trigram = db.Column(db.String(3), primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True, index=True)
+    # Clustered on (field, trigram, book_id) so each trigram's posting list is one contiguous range
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __repr__(self):
+        return f"<BookTrigram {self.field}:{self.trigram} -> {self.book_id}>"
+
+# Taste profiles (recency-weighted sum of the embeddings of the books a member borrowed, used by /recommend/for_me)
+class UserTasteProfile(db.Model):
+    __tablename__ = 'user_taste_profiles'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    vector = db.Column(db.LargeBinary, nullable=False)  # float32 bytes, weights relative to reference_time
+    reference_time = db.Column(db.DateTime, nullable=False)  # a loan issued at this time has weight 1
+    last_transaction_id = db.Column(db.Integer, nullable=False, default=0)  # transactions up to this id are folded in
+    pending_transaction_ids = db.Column(db.JSON)  # ... except these, whose book had no embedding yet
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<UserTasteProfile {self.user_id}>"
+
 # Users model
 class User(db.Model):
     __tablename__ = 'users'
@@ -42,6 +88,13 @@ class User(db.Model):
     transactions = db.relationship('Transaction', backref='user', lazy=True)
     reservations = db.relationship('Reservation', backref='user', lazy=True)
 
+    __table_args__ = (
+        # Case-insensitive prefix search of members by username or email (GET /members?q=), which compares
+        # these expressions against a range
+        db.Index('ix_users_username_lower', db.func.lower(username)),
+        db.Index('ix_users_email_lower', db.func.lower(email)),
+    )
+
     def __repr__(self):
         return f"<User {self.username}>"
 
@@ -60,6 +113,20 @@ class Transaction(db.Model):
     # Relationship to the BookCopy
     book_copy = db.relationship('BookCopy')
 
+    __table_args__ = (
+        # A member's transactions, latest first (borrowing history, /transactions?user_id=)
+        db.Index('ix_transactions_user_issued', 'user_id', 'date_issued'),
+        # The history of a copy
+        db.Index('ix_transactions_book_copy', 'book_copy_id'),
+        # Partial indexes over open loans only, which stay small however long the ledger grows:
+        # a member's open loans (loan limit, duplicate checkout, return) ...
+        db.Index('ix_transactions_open_user_copy', 'user_id', 'book_copy_id',
+                 sqlite_where=text('date_returned IS NULL'), postgresql_where=text('date_returned IS NULL')),
+        # ... and open loans by due date (overdue list and notifications)
+        db.Index('ix_transactions_open_due', 'due_date',
+                 sqlite_where=text('date_returned IS NULL'), postgresql_where=text('date_returned IS NULL')),
+    )
+
     def __repr__(self):
         return f"<Transaction {self.id} - {self.transaction_type}>"
 
@@ -75,5 +142,11 @@ class Reservation(db.Model):
     # Relationship to the Book
     book = db.relationship('Book')
 
+    __table_args__ = (
+        # The queue of a book (fulfilled on return) and a member's reservations
+        db.Index('ix_reservations_book_status', 'book_id', 'status'),
+        db.Index('ix_reservations_user_status', 'user_id', 'status'),
+    )
+
     def __repr__(self):
         return f"<Reservation {self.id} - {self.status}>"
@@ -1,28 +1,27 @@
 from datetime import datetime
 from app import db
-from app.models import Transaction, User
+from app.models import Book, BookCopy, Transaction, User
 from app.notifications import send_email_notification
 
 def notify_overdue_function():
-    # Query all active transactions where the due date has passed
-    overdue_transactions = Transaction.query.filter(
-        Transaction.date_returned == None,
-        Transaction.due_date < datetime.utcnow()
-    ).all()
+    # Query all active transactions where the due date has passed, with their members and book titles in
+    # the same query (transactions of deleted members are skipped by the inner join)
+    overdue_transactions = (db.session.query(Transaction, User, Book.title)
+                            .join(User, User.id == Transaction.user_id)
+                            .join(Transaction.book_copy)
+                            .join(BookCopy.book)
+                            .filter(Transaction.date_returned == None, Transaction.due_date < datetime.utcnow())
+                            .order_by(Transaction.id)
+                            .all())
 
     if not overdue_transactions:
         return
 
-    for tx in overdue_transactions:
-        # Get member details
-        member = User.query.get(tx.user_id)
-        if not member:
-            continue
-
+    for tx, member, book_title in overdue_transactions:
         subject = "Overdue Book Notification"
         body = (
             f"Dear {member.username},\n\n"
-            f"Our records indicate that the book '{tx.book_copy.book.title}' (Transaction ID: {tx.id}) "
+            f"Our records indicate that the book '{book_title}' (Transaction ID: {tx.id}) "
             f"was due on {tx.due_date.strftime('%Y-%m-%d %H:%M:%S')} and is now overdue.\n"
             "Please return or renew the book as soon as possible to avoid further fines.\n\n"
             "Thank you,\nLibrary Management System"
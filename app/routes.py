@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 from app import db
@@ -6,10 +6,28 @@ from app.models import User , Book , BookCopy , Transaction , BookCopy , Reserva
 from app.notifications import send_email_notification
 from flask import session
 from flask import redirect, url_for
-from app.utils.barcode_utils import generate_barcode_base64
+from app.utils.barcode_utils import generate_barcode_base64, barcode_cache, barcode_key, is_valid_code, BARCODE_MIMETYPES
 from functools import wraps
-from sentence_transformers import SentenceTransformer, util
-from app.utils.spellcheck import correct_text
+import numpy as np
+from app.utils.spellcheck import correct_text, set_book_words, remove_book_words
+from app.utils.embedding_index import embedding_index, refresh_book_embedding, delete_book_embedding, normalize, book_text
+from app.utils.model_loader import get_model, get_loaded_model
+from app.utils.inference_pool import InferencePoolBusy, InferenceTimeout
+from app.utils.prompt_cache import prompt_cache, normalize_prompt
+from app.utils.taste_profile import update_taste_profile, taste_vector, borrowed_book_ids
+from app.utils.book_search import search_index_exists, match_terms, match_expression, apply_text_search, relevance_rank
+from app.utils.pagination import parse_limit, keyset_filter, keyset_page, keyset_page_list
+from app.utils.facets import facet_counts, decade_range
+from app.utils.search_cache import catalog_version, search_cache, normalize_search_params
+from app.utils.fuzzy_search import FUZZY_FIELDS, fuzzy_search, index_book_trigrams, delete_book_trigrams
+from app.utils.streaming import streaming_format, streaming_response
+from app.utils.circulation import (LOAN_DAYS, claim_available_copy, claim_next_reservation, close_loan,
+                                   checkout_batch, return_batch)
+from app.utils.bulk_enroll import enroll_users, read_enrollment_csv
+from app.utils.user_cache import get_user_status, invalidate_user_status
+from app.utils.label_sheets import select_labels, write_label_sheets, SHEET_MIMETYPES, SHEET_EXTENSIONS
+from flask import send_file
+import tempfile
 
 
 main = Blueprint('main', __name__, template_folder='../templates')
@@ -32,6 +50,9 @@ def require_active_membership(func):
     """
     Decorator function to check if a user has an active membership before accessing certain routes.
 
+    The user's role and active status come from get_user_status(), which caches them for the request and for
+    USER_CACHE_TTL seconds, so most checks do not query the database.
+
     Args:
     func (function): The function to be decorated.
 
@@ -44,8 +65,8 @@ def require_active_membership(func):
         user_id = session.get('user_id')
         if not user_id:
             return jsonify({'error': 'User not logged in'}), 403
-        user = db.session.get(User, user_id)
-        if not user or not user.is_active:
+        status = get_user_status(user_id)
+        if not status or not status.is_active:
             return jsonify({'error': 'Membership is cancelled. Please contact the library.'}), 403
         return func(*args, **kwargs)
     return wrapper
@@ -72,8 +93,8 @@ def member_dashboard():
     """
     This function handles the member dashboard view. It checks if the user is logged in and has the correct role.
     If the user is not logged in or does not have the 'member' role, it redirects to the login page.
-    Otherwise, it retrieves the user's information from the database and generates a barcode image for the member.
-    The function then renders the 'member_dashboard.html' template with the user's information and the barcode image.
+    Otherwise, it retrieves the user's information from the database and links the member's barcode image.
+    The function then renders the 'member_dashboard.html' template with the user's information and the barcode URL.
 
     Parameters:
     None
@@ -88,8 +109,8 @@ def member_dashboard():
     # Retrieve user from database to get the email
     user = db.session.get(User, user_id)
     email = user.email if user else ""
-    # Generate barcode for the member using a unique code
-    barcode_img = generate_barcode_base64("MEMBER-" + str(user_id)) if user else ""
+    # The browser loads (and caches) the member's barcode from /barcodes/
+    barcode_img = barcode_url("MEMBER-" + str(user_id)) if user else ""
     return render_template('member_dashboard.html', username=username, user_id=user_id, email=email, barcode=barcode_img)
 
 
@@ -264,6 +285,56 @@ def login():
 
 
 
+def after_book_saved(book):
+    """
+    Keeps the indexes derived from the catalog in step with a book that was just added or edited:
+    the fuzzy search trigrams, the recommendation embedding, the spell checker vocabulary and, last,
+    the search result cache.
+    """
+    index_book_trigrams(book)
+    # Re-encode the book only if its title, author or subject changed (deferred to /recommend if the model is not loaded)
+    try:
+        refresh_book_embedding(book, get_loaded_model())
+    except (InferencePoolBusy, InferenceTimeout):
+        # The inference pool is saturated; drop the stale embedding so the next /recommend encodes the book
+        refresh_book_embedding(book)
+    if set_book_words(book.id, book_text(book)):
+        # Cached prompt corrections may depend on the old vocabulary
+        prompt_cache.clear()
+    # Only once every index reflects the edit, or a concurrent search could cache a stale result
+    catalog_version.bump()
+
+
+def fold_taste_profile(user_id):
+    """
+    Folds a member's new loans into their taste profile (see /recommend/for_me) within the checkout or
+    return's own transaction, before it is committed. The update runs in a savepoint: if it fails, only
+    the profile change is undone and logged, never the loan.
+    """
+    try:
+        with db.session.begin_nested():
+            update_taste_profile(int(user_id), commit=False)
+    except Exception:
+        current_app.logger.exception(f"Failed to update the taste profile of user {user_id}")
+
+
+def after_circulation():
+    """
+    Runs after a checkout or return is committed: the status of a copy changed, so cached search results
+    are invalidated.
+    """
+    catalog_version.bump()
+
+
+def after_book_deleted(book_id):
+    """
+    Removes a deleted book from the indexes derived from the catalog.
+    """
+    if remove_book_words(book_id):
+        prompt_cache.clear()
+    catalog_version.bump()
+
+
 # Endpoint for adding a new book
 @main.route('/books', methods=['POST'])
 def add_book():
@@ -320,6 +391,9 @@ def add_book():
         db.session.add(copy)
     db.session.commit()
 
+    # Update the recommendation and spell checker indexes
+    after_book_saved(book)
+
     return jsonify({'message': 'Book added successfully', 'book_id': book.id}), 201
 
 
@@ -363,6 +437,9 @@ def update_book(book_id):
     book.rack_location = data.get('rack_location', book.rack_location)
 
     db.session.commit()
+
+    # Update the recommendation and spell checker indexes
+    after_book_saved(book)
     return jsonify({'message': 'Book updated successfully'}), 200
 
 
@@ -396,28 +473,149 @@ def delete_book(book_id):
 
     # also delete associated copies
     BookCopy.query.filter_by(book_id=book_id).delete()
+    delete_book_embedding(book_id)
+    delete_book_trigrams(book_id)
     db.session.delete(book)
     db.session.commit()
+    after_book_deleted(book_id)
     return jsonify({'message': 'Book deleted successfully'}), 200
 
 
 # Endpoint for searching books
+# Fields of a book in GET /books results (and the CSV columns of its streaming output)
+BOOK_FIELDS = ['id', 'title', 'author', 'subject', 'publication_date', 'rack_location']
+
+
+def serialize_book(book, similarity=None):
+    """
+    Returns a book as listed by GET /books, with its fuzzy match score if there is one.
+    """
+    result = {
+        'id': book.id,
+        'title': book.title,
+        'author': book.author,
+        'subject': book.subject,
+        'publication_date': book.publication_date.strftime('%Y-%m-%d'),
+        'rack_location': book.rack_location
+    }
+    if similarity is not None:
+        result['similarity'] = round(similarity, 4)
+    return result
+
+
 @main.route('/books', methods=['GET'])
 def search_books():
+    """
+    Search the catalog.
+
+    Query parameters (all optional, combined with AND):
+    q (str): Words to find in the title, author or subject.
+    title, author, subject (str): Words to find in that field.
+    from_date, to_date (str): Publication date range, 'YYYY-MM-DD'.
+    subject_facet (str): Exact subject (a value counted by facets=true).
+    decade (int): Publication decade, e.g. 1990.
+    rack_location (str): Exact rack location.
+    facets (str): 'true' to also return facet counts (see below).
+    mode (str): 'fuzzy' for typo-tolerant matching of q, title and author (see below).
+    sort (str): 'relevance' (default for text searches), 'id' (default otherwise) or 'title'.
+    limit (int): Page size, default BOOKS_PAGE_SIZE, at most BOOKS_MAX_PAGE_SIZE.
+    cursor (str): The next_cursor of the previous page.
+    format (str): 'ndjson' or 'csv' to stream every matching book (see below), 'json' (default) for a page.
+
+    Text filters use the FTS5 full-text index (see app.utils.book_search): every word must match the
+    start of a word in the field ("tolk" finds "Tolkien"), and results are ranked by relevance with
+    title matches first. On a database whose index has not been built yet (run build_search_index.py)
+    the filters fall back to substring matching and relevance sorting falls back to id; so does a filter
+    without any word characters (e.g. '!!!'), which the index cannot match.
+
+    With mode=fuzzy, q (over title and author), title and author are matched with the trigram index
+    (see app.utils.fuzzy_search), so "Tolkein" finds "Tolkien". Candidates come from the index and only
+    those are scored; books scoring at least BOOKS_FUZZY_THRESHOLD are returned best first, each with a
+    'similarity' between 0 and 1. Subject and dates are still exact filters and sort is ignored.
+
+    Results are paginated with a keyset cursor on (sort key, id), so each page costs the same however
+    deep it is and the order is stable between requests.
+
+    With facets=true the response also counts the matching books (all pages) per subject, publication
+    decade and rack location, computed by one small aggregate query per facet (see app.utils.facets). Pass the
+    counted values back as subject_facet, decade and rack_location to narrow the search: they are exact
+    filters, so the results agree with the counts (subject=Science would also match "Computer Science").
+
+    Responses are cached per normalised set of parameters until the catalog changes (books added, edited
+    or deleted, or copies checked out or returned), so polling dashboards do not query the database.
+
+    With format=ndjson or format=csv (or an Accept: application/x-ndjson / text/csv header) all matching
+    books from the cursor on are streamed in the same order, one per line, instead of one page; limit
+    and facets are ignored and nothing is cached. Rows are read from a server-side cursor in batches of
+    STREAM_CHUNK_SIZE, so memory use does not grow with the size of the result.
+
+    Returns:
+    JSON: {'books': [{'id', 'title', 'author', 'subject', 'publication_date', 'rack_location'}, ...],
+           'next_cursor': <cursor of the next page, or null on the last page>,
+           'facets': {'subject': [{'value', 'count'}, ...], 'decade': [...], 'rack_location': [...]}  (with facets=true)}
+    NDJSON / CSV: The books, with the fields above (and 'similarity' in fuzzy mode), when streaming.
+    JSON: An error message with status 400 if a date, decade, limit, mode, sort, cursor or format is invalid.
+    """
+    try:
+        stream = streaming_format(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    chunk_size = current_app.config['STREAM_CHUNK_SIZE']
+
+    # Read the version before querying, so a result is never cached under a version newer than its data
+    cache_key = (catalog_version.current(), normalize_search_params(request.args))
+    cached = search_cache.get(cache_key) if not stream else None
+    if cached is not None:
+        return jsonify(cached), 200
+
     # Retrieve query parameters
+    q = request.args.get('q')
     title = request.args.get('title')
     author = request.args.get('author')
     subject = request.args.get('subject')
     from_date_str = request.args.get('from_date')
     to_date_str = request.args.get('to_date')
+    decade_str = request.args.get('decade')
+    rack_location = request.args.get('rack_location')
+    subject_facet = request.args.get('subject_facet')
+    with_facets = request.args.get('facets', '').lower() in ('true', '1', 'yes')
+
+    sort = request.args.get('sort')
+    try:
+        limit = parse_limit(request.args.get('limit'), current_app.config['BOOKS_PAGE_SIZE'],
+                            current_app.config['BOOKS_MAX_PAGE_SIZE'])
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    if sort not in (None, 'relevance', 'id', 'title'):
+        return jsonify({'error': "sort must be 'relevance', 'id' or 'title'"}), 400
+    mode = request.args.get('mode')
+    if mode not in (None, 'fuzzy'):
+        return jsonify({'error': "mode must be 'fuzzy' or omitted"}), 400
+
+    # In fuzzy mode q, title and author go to the trigram index instead of the filters below
+    fuzzy_searches = []
+    if mode == 'fuzzy':
+        fuzzy_searches = [(text, fields) for text, fields in ((q, FUZZY_FIELDS), (title, ('title',)), (author, ('author',)))
+                          if text and text.strip()]
+        q = title = author = None
 
     # Build query dynamically based on provided filters
     query = Book.query
-    if title:
+    ranked = False
+    use_index = bool(q or title or author or subject) and search_index_exists()
+    if use_index:
+        expression = match_expression(q, title=title, author=author, subject=subject)
+        if expression:
+            query = apply_text_search(query, expression)
+            ranked = True
+    # Substring matching without the index, and for filters the index cannot express (no word characters, e.g. '!!!')
+    if q and not (use_index and match_terms(q)):
+        query = query.filter(Book.title.ilike(f'%{q}%') | Book.author.ilike(f'%{q}%') | Book.subject.ilike(f'%{q}%'))
+    if title and not (use_index and match_terms(title)):
         query = query.filter(Book.title.ilike(f'%{title}%'))
-    if author:
+    if author and not (use_index and match_terms(author)):
         query = query.filter(Book.author.ilike(f'%{author}%'))
-    if subject:
+    if subject and not (use_index and match_terms(subject)):
         query = query.filter(Book.subject.ilike(f'%{subject}%'))
     # Filter by publication date range if provided
     if from_date_str:
@@ -434,18 +632,193 @@ def search_books():
         except ValueError:
             return jsonify({'error': 'Invalid to_date format. Use YYYY-MM-DD.'}), 400
 
-    books = query.all()
-    results = []
-    for book in books:
-        results.append({
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'subject': book.subject,
-            'publication_date': book.publication_date.strftime('%Y-%m-%d'),
-            'rack_location': book.rack_location
-        })
-    return jsonify({'books': results}), 200
+    # Facet filters (a decade is a plain date range, so it can use an index on publication_date)
+    if decade_str:
+        try:
+            decade = int(decade_str)
+            if decade % 10 or not 0 < decade < 9990:
+                raise ValueError
+        except ValueError:
+            return jsonify({'error': 'Invalid decade. Use a year ending in 0, e.g. 1990.'}), 400
+        first_day, last_day = decade_range(decade)
+        query = query.filter(Book.publication_date >= first_day, Book.publication_date <= last_day)
+    if subject_facet:
+        query = query.filter(Book.subject == subject_facet)
+    if rack_location:
+        query = query.filter(Book.rack_location == rack_location)
+
+    similarities = {}
+    if fuzzy_searches:
+        all_matches = fuzzy_search(query, fuzzy_searches,
+                                   threshold=current_app.config['BOOKS_FUZZY_THRESHOLD'],
+                                   candidates=current_app.config['BOOKS_FUZZY_CANDIDATES'])
+        try:
+            matches, next_cursor = keyset_page_list(all_matches, lambda match: [-match[1], match[0].id],
+                                                    len(all_matches) if stream else limit,
+                                                    request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        if stream:
+            # Matches are already bounded by BOOKS_FUZZY_CANDIDATES, so they are streamed from the list
+            return streaming_response(matches, lambda match: serialize_book(*match), stream,
+                                      BOOK_FIELDS + ['similarity'], 'books', chunk_size)
+        books = [book for book, _ in matches]
+        similarities = {book.id: score for book, score in matches}
+        if with_facets:
+            # Counted by the database over the matched ids, like the other searches
+            query = Book.query.filter(Book.id.in_([book.id for book, _ in all_matches]))
+    else:
+        if sort == 'title':
+            sort_key = Book.title
+        elif ranked and sort in (None, 'relevance'):
+            sort_key = relevance_rank()
+        else:
+            sort_key = Book.id
+        try:
+            if stream:
+                query = keyset_filter(query, sort_key, Book.id, request.args.get('cursor'))
+                return streaming_response(query.order_by(sort_key, Book.id), serialize_book, stream,
+                                          BOOK_FIELDS, 'books', chunk_size)
+            books, next_cursor = keyset_page(query, sort_key, Book.id, limit, request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    results = [serialize_book(book, similarities.get(book.id)) for book in books]
+    response = {'books': results, 'next_cursor': next_cursor}
+    if with_facets:
+        response['facets'] = facet_counts(query, limit=current_app.config['BOOKS_FACET_LIMIT'])
+    search_cache.put(cache_key, response)
+    return jsonify(response), 200
+
+
+# Endpoint for monitoring the search result cache
+@main.route('/books/cache_stats', methods=['GET'])
+def search_cache_stats():
+    """
+    Returns the hit/miss counters and limits of the GET /books result cache.
+
+    Returns:
+    JSON response:
+    {'search_cache': {'size': <int>, 'maxsize': <int>, 'ttl': <seconds>, 'hits': <int>, 'misses': <int>, 'hit_rate': <float>}}
+    """
+    return jsonify({'search_cache': search_cache.stats()}), 200
+
+
+def barcode_url(code_value, fmt='png'):
+    """
+    Returns the URL of a code's barcode image served by barcode_image().
+    """
+    return url_for('main.barcode_image', code=code_value, fmt=fmt)
+
+
+def wants_inline_barcodes():
+    """
+    Returns True if the request opted in to base64 barcode images inside the JSON (barcode_images=true).
+    """
+    return request.args.get('barcode_images', 'false').lower() == 'true'
+
+
+# Endpoint serving barcode images
+@main.route('/barcodes/<code>.<any(png, svg):fmt>', methods=['GET'])
+def barcode_image(code, fmt):
+    """
+    Returns the Code128 barcode of a code (e.g. MEMBER-3 or a copy's unique_barcode) as a PNG or SVG image.
+
+    An image never changes for a given code, so it is served with a strong ETag (its content address, known
+    without rendering) and a one-year immutable Cache-Control lifetime (BARCODE_HTTP_MAX_AGE). Browsers
+    reuse it without asking again; a revalidation with If-None-Match gets a 304 without touching the image.
+    Images come from the barcode cache, so each one is rendered once.
+
+    Parameters:
+    code (str): The encoded text, 1 to 50 printable ASCII characters.
+    fmt (str): 'png' or 'svg' (the URL extension).
+
+    Returns:
+    The image, 304 Not Modified if the ETag matches, or a JSON error with status 404 for an invalid code.
+    """
+    if not is_valid_code(code):
+        return jsonify({'error': 'Invalid barcode'}), 404
+    etag = barcode_key(code, fmt)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(barcode_cache.get(code, fmt), mimetype=BARCODE_MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['BARCODE_HTTP_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
+
+# Endpoint for monitoring the barcode image cache
+@main.route('/barcodes/cache_stats', methods=['GET'])
+def barcode_cache_stats():
+    """
+    Returns the sizes, limits and hit/miss counters of the barcode image cache (memory and disk).
+
+    Returns:
+    JSON response:
+    {'barcode_cache': {'size': <int>, 'maxsize': <int>, 'disk_bytes': <int>, 'max_disk_bytes': <int>,
+                       'memory_hits': <int>, 'disk_hits': <int>, 'misses': <int>, 'hit_rate': <float>}}
+    """
+    return jsonify({'barcode_cache': barcode_cache.stats()}), 200
+
+
+# Endpoint rendering printable barcode label sheets
+@main.route('/labels', methods=['POST'])
+def print_labels():
+    """
+    Renders label sheets (title, Code128 barcode and code of each copy, 24 labels per A4 page) for a
+    selection of book copies, e.g. a new shipment.
+
+    Pages are rendered in parallel by LABEL_SHEET_WORKERS processes and written to a temporary file as they
+    complete, so large runs neither hold the whole document in memory nor render on one core.
+
+    Parameters (JSON body, at least one selector; selectors are combined):
+    book_from, book_to (int, optional): Range of book ids, inclusive.
+    copy_ids (list, optional): BookCopy ids.
+    since (str, optional): Only copies created at or after this time, ISO format (e.g. '2024-05-01T09:00').
+    format (str, optional): 'pdf' (default) for one PDF document, 'png' for a ZIP archive of PNG pages.
+
+    Returns:
+    The PDF or ZIP file as an attachment, or a JSON error with status 400 (invalid selection, or more than
+    LABEL_SHEET_MAX_LABELS labels) or 404 (no matching copies).
+    """
+    data = request.get_json(silent=True) or {}
+    fmt = data.get('format', 'pdf')
+    if fmt not in SHEET_MIMETYPES:
+        return jsonify({'error': 'Invalid format. Use pdf or png.'}), 400
+    book_from, book_to, copy_ids = data.get('book_from'), data.get('book_to'), data.get('copy_ids')
+    if all(value is None for value in (book_from, book_to, copy_ids, data.get('since'))):
+        return jsonify({'error': 'Specify book_from/book_to, copy_ids or since'}), 400
+    try:
+        book_from = int(book_from) if book_from is not None else None
+        book_to = int(book_to) if book_to is not None else None
+        if copy_ids is not None:
+            if not isinstance(copy_ids, list):
+                raise ValueError
+            copy_ids = [int(copy_id) for copy_id in copy_ids]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'book_from, book_to and copy_ids must be integers'}), 400
+    since = None
+    if data.get('since') is not None:
+        try:
+            since = datetime.fromisoformat(str(data['since']))
+        except ValueError:
+            return jsonify({'error': 'Invalid since. Use ISO format, e.g. 2024-05-01T09:00.'}), 400
+
+    labels = select_labels(book_from, book_to, copy_ids, since)
+    if not labels:
+        return jsonify({'error': 'No book copies match the selection'}), 404
+    max_labels = current_app.config['LABEL_SHEET_MAX_LABELS']
+    if len(labels) > max_labels:
+        return jsonify({'error': f'Too many labels ({len(labels)}). The maximum is {max_labels}.'}), 400
+
+    output = tempfile.TemporaryFile()
+    write_label_sheets(labels, output, fmt, workers=current_app.config['LABEL_SHEET_WORKERS'])
+    output.seek(0)
+    return send_file(output, mimetype=SHEET_MIMETYPES[fmt], as_attachment=True,
+                     download_name=f"labels.{SHEET_EXTENSIONS[fmt]}")
 
 
 # Endpoint for checking out a book
@@ -460,6 +833,12 @@ def checkout_book():
     user_id (int): The unique identifier of the user who wants to check out the book.
     book_id (int): The unique identifier of the book that the user wants to check out.
 
+    The copy is claimed with a conditional UPDATE (only if it is still available) in the same transaction as
+    the new loan, so concurrent checkouts of the last copies never hand out the same copy twice; a request
+    that loses a copy to another one moves on to the next available copy. The loan limit is checked again
+    after the loan is inserted, in that transaction, and the checkout is rolled back if concurrent checkouts
+    by the same member took it over MAX_ACTIVE_LOANS (exact where writers are serialized, as on SQLite).
+
     Returns:
     JSON: A JSON response with a message, transaction_id, and due_date if the checkout is successful.
     JSON: A JSON response with an error message if there are any errors.
@@ -483,30 +862,40 @@ def checkout_book():
 
     # Count active (not returned) transactions for the user
     active_transactions = Transaction.query.filter_by(user_id=user_id, date_returned=None).count()
-    if active_transactions >= 5:
-        return jsonify({'error': 'User has reached the maximum number of active checkouts (5).'}), 400
-
-    # Find an available book copy for the given book_id
-    available_copy = BookCopy.query.filter_by(book_id=book_id, status='available').first()
-    if not available_copy:
+    max_loans = current_app.config['MAX_ACTIVE_LOANS']
+    if active_transactions >= max_loans:
+        return jsonify({'error': f'User has reached the maximum number of active checkouts ({max_loans}).'}), 400
+
+    # Claim an available copy: a conditional UPDATE marks it checked-out only if it is still available, so
+    # concurrent checkouts never get the same copy (see app.utils.circulation)
+    copy_id = claim_available_copy(book_id)
+    if not copy_id:
+        db.session.rollback()
         return jsonify({'error': 'No available copies for this book.'}), 404
 
-    # Calculate due date: 10 days from now
-    due_date = datetime.utcnow() + timedelta(days=10)
+    # Calculate due date: LOAN_DAYS from now
+    due_date = datetime.utcnow() + timedelta(days=LOAN_DAYS)
 
-    # Create a new transaction record
+    # Create a new transaction record, committed together with the copy's new status
     transaction = Transaction(
         user_id=user_id,
-        book_copy_id=available_copy.id,
+        book_copy_id=copy_id,
         transaction_type='checkout',
         date_issued=datetime.utcnow(),
         due_date=due_date
     )
     db.session.add(transaction)
+    db.session.flush()
+
+    # Counted again now that this transaction holds the write: a concurrent checkout by the same member may
+    # have committed a loan since the first count
+    if Transaction.query.filter_by(user_id=user_id, date_returned=None).count() > max_loans:
+        db.session.rollback()
+        return jsonify({'error': f'User has reached the maximum number of active checkouts ({max_loans}).'}), 400
 
-    # Update the book copy's status to checked-out
-    available_copy.status = 'checked-out'
+    fold_taste_profile(user_id)
     db.session.commit()
+    after_circulation()
 
     return jsonify({
         'message': 'Book checked out successfully',
@@ -550,8 +939,8 @@ def renew_book():
     if datetime.utcnow() > transaction.due_date:
         return jsonify({'error': 'Cannot renew an overdue transaction. Please return the book instead.'}), 400
 
-    # Add 10 days to the current due date
-    transaction.due_date = transaction.due_date + timedelta(days=10)
+    # Add LOAN_DAYS to the current due date
+    transaction.due_date = transaction.due_date + timedelta(days=LOAN_DAYS)
     transaction.transaction_type = 'renew'
     db.session.commit()
 
@@ -568,9 +957,10 @@ def renew_book():
 def return_book():
     """
     This function handles the process of returning a book. It validates the input parameters,
-    finds the active transaction for the given user and book copy, marks the transaction as returned,
-    calculates the fine if returned after due date, updates the book copy's status to available,
-    and checks for active reservations for the book.
+    closes the active transaction for the given user and book copy with a conditional UPDATE (so a copy
+    returned by concurrent requests is returned and fined once), calculates the fine if returned after due
+    date, updates the book copy's status to available, and notifies the oldest active reservation for the
+    book (claimed atomically, so each reservation is notified once even when copies are returned concurrently).
 
     Parameters:
     - user_id (int): The ID of the user returning the book.
@@ -582,49 +972,38 @@ def return_book():
     data = request.get_json()
     user_id = data.get('user_id')
     book_copy_id = data.get('book_copy_id')
-    print("Return Request - user_id:", user_id, "book_copy_id:", book_copy_id)
 
     # Validate inputs
     if not user_id or not book_copy_id:
         return jsonify({'error': 'Missing user_id or book_copy_id'}), 400
 
-    # Find the active transaction for the given user and book copy
-    transaction = Transaction.query.filter_by(user_id=user_id, book_copy_id=book_copy_id, date_returned=None).first()
-    if not transaction:
+    # Close the active transaction for the given user and book copy, with the fine if returned after the
+    # due date; only one of several concurrent returns of the copy gets it (see app.utils.circulation)
+    closed = close_loan(user_id, book_copy_id, datetime.utcnow())
+    if not closed:
+        db.session.rollback()
         return jsonify({'error': 'No active transaction found for this book copy and user'}), 404
-
-    # Mark the transaction as returned
-    transaction.date_returned = datetime.utcnow()
-    transaction.transaction_type = 'returned'  # Set transaction type to returned
-
-    # Calculate fine if returned after due date (Here i use the logic of adding $1 per day overdue)
-    fine = 0.0
-    now = datetime.utcnow()
-    if now > transaction.due_date:
-        overdue_days = (now - transaction.due_date).days
-        fine = overdue_days * 1.0
-        transaction.fine_amount = fine
+    _, fine = closed
 
     # Update the book copy's status to available
     book_copy = BookCopy.query.get(book_copy_id)
     book_copy.status = 'available'
 
+    # Also picks up loans whose book had no embedding yet at checkout time
+    fold_taste_profile(user_id)
     db.session.commit()
+    after_circulation()
 
-    # Check if there is an active reservation for this book
-    book_id = book_copy.book_id
-    reservation = Reservation.query.filter_by(book_id=book_id, status='active').first()
-    if reservation:
-        # Send email notification
-        recipient_email = reservation.user.email
+    # Fulfil the oldest active reservation for this book. It is claimed with a conditional UPDATE and
+    # committed before the email is sent, so concurrent returns never notify the same reservation twice.
+    claimed = claim_next_reservation(book_copy.book_id)
+    if claimed:
+        db.session.commit()
+        _, username, recipient_email = claimed
         subject = "Book Available Notification"
-        body = f"Hello {reservation.user.username},\n\nThe book you reserved is now available for checkout."
+        body = f"Hello {username},\n\nThe book you reserved is now available for checkout."
         send_email_notification(subject, recipient_email, body)
 
-        # Update reservation status to 'notified'
-        reservation.status = 'notified'
-        db.session.commit()
-
     return jsonify({
         'message': 'Book returned successfully',
         'fine_amount': fine
@@ -672,7 +1051,105 @@ def reserve_book():
 
 
 
+# Endpoint for checking out or returning a stack of books at the circulation desk
+@main.route('/circulation/batch', methods=['POST'])
+@require_active_membership
+def batch_circulation():
+    """
+    Checks out or returns many books for one member in a single request, e.g. a stack scanned at the desk.
+
+    The member is checked once, their open loans are read once (loan limit, books already borrowed), all
+    items are resolved with one query and everything is applied in one transaction, instead of one request
+    with its own checks and commit per book. Checkouts claim copies with conditional UPDATEs, like /checkout,
+    so concurrent requests never get the same copy. Each item gets its own result; items that fail (no
+    available copy, loan limit reached, unknown barcode...) do not stop the others.
+
+    Parameters (JSON body):
+    user_id (int): The member.
+    action (str): 'checkout' or 'return'.
+    items (list): Up to CIRCULATION_BATCH_MAX_ITEMS items, each {'book_id': <int>} (checkout: any available
+                  copy; return: the member's loan of that book) or {'barcode': <str>} (that copy).
+
+    Returns:
+    JSON response:
+    {'user_id', 'action', 'succeeded': <int>, 'failed': <int>,
+     'results': [{'index', 'book_id' or 'barcode', 'status': 'ok' or 'error', ...}, ...]}
+    Successful checkouts include 'transaction_id', 'book_copy_id', 'copy_barcode' and 'due_date'; successful
+    returns 'transaction_id', 'book_copy_id' and 'fine_amount'; failed items an 'error' message.
+    An error with status 400 for an invalid request, 404 if the member does not exist, or 403 when checking
+    out to a member whose membership is cancelled.
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    action = data.get('action')
+    items = data.get('items')
+    if not isinstance(user_id, int) or isinstance(user_id, bool) or action not in ('checkout', 'return'):
+        return jsonify({'error': "Provide user_id and an action ('checkout' or 'return')"}), 400
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Provide a non-empty list of items'}), 400
+    max_items = current_app.config['CIRCULATION_BATCH_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({'error': f'Too many items ({len(items)}). The maximum is {max_items}.'}), 400
+
+    member = get_user_status(user_id)
+    if not member or member.role != 'member':
+        return jsonify({'error': 'Member not found'}), 404
+
+    notifications = []
+    if action == 'checkout':
+        if not member.is_active:
+            return jsonify({'error': 'Membership is cancelled. Please contact the library.'}), 403
+        results = checkout_batch(user_id, items, current_app.config['MAX_ACTIVE_LOANS'])
+    else:
+        results, notifications = return_batch(user_id, items)
+    succeeded = sum(1 for result in results if result['status'] == 'ok')
+    if succeeded:
+        fold_taste_profile(user_id)
+    db.session.commit()
+
+    if succeeded:
+        after_circulation()
+    for username, recipient_email in notifications:
+        body = f"Hello {username},\n\nThe book you reserved is now available for checkout."
+        send_email_notification("Book Available Notification", recipient_email, body)
+
+    return jsonify({
+        'user_id': user_id,
+        'action': action,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    }), 200
+
+
 #Endpoint to return loans of a certain user
+# Fields of a transaction in GET /transactions (and the CSV columns of its streaming output)
+TRANSACTION_FIELDS = ['transaction_id', 'book_title', 'user_id', 'book_copy_id', 'username', 'email',
+                      'membership_status', 'date_issued', 'due_date', 'date_returned', 'fine_amount',
+                      'transaction_type']
+
+
+def serialize_transaction(row):
+    """
+    Returns a (transaction, book title, user) row as listed by GET /transactions.
+    """
+    tx, book_title, user = row
+    return {
+        'transaction_id': tx.id,
+        'book_title': book_title,
+        'user_id': tx.user_id,
+        'book_copy_id': tx.book_copy_id,
+        'username': user.username if user else "",
+        'email': user.email if user else "",
+        'membership_status': "Active" if user and user.is_active else "Cancelled" if user else "",
+        'date_issued': tx.date_issued.strftime('%Y-%m-%d %H:%M:%S'),
+        'due_date': tx.due_date.strftime('%Y-%m-%d %H:%M:%S'),
+        'date_returned': tx.date_returned.strftime('%Y-%m-%d %H:%M:%S') if tx.date_returned else None,
+        'fine_amount': tx.fine_amount,
+        'transaction_type': tx.transaction_type
+    }
+
+
 @main.route('/transactions', methods=['GET'])
 def get_transactions():
     """
@@ -682,48 +1159,42 @@ def get_transactions():
     - all (str): If 'true', retrieve all transactions. If 'false' or not provided, filter by user_id.
     - user_id (str): Retrieve transactions for a specific user.
     - active (str): If 'true', filter for active transactions only. If 'false' or not provided, include all transactions.
+    - format (str): 'ndjson' or 'csv' to stream the transactions one per line (also selected by an
+      Accept: application/x-ndjson / text/csv header), 'json' (default) for a single JSON document.
+
+    The book title and user of every transaction are read by the same query, and a streamed response
+    reads the rows in batches of STREAM_CHUNK_SIZE from a server-side cursor, so pulling the whole ledger
+    takes constant memory.
 
     Returns:
     - JSON response containing a list of transactions. Each transaction includes detailed user information.
+    - NDJSON / CSV: The same transaction fields, when streaming.
     """
+    try:
+        stream = streaming_format(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = (db.session.query(Transaction, Book.title, User)
+             .join(Transaction.book_copy)
+             .join(BookCopy.book)
+             .outerjoin(User, User.id == Transaction.user_id))
     # Check if 'all=true' parameter is provided, otherwise filter by user_id
-    if request.args.get('all', 'false').lower() == 'true':
-        query = Transaction.query
-    else:
+    if request.args.get('all', 'false').lower() != 'true':
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({'error': 'user_id parameter is required'}), 400
-        query = Transaction.query.filter_by(user_id=user_id)
+        query = query.filter(Transaction.user_id == user_id)
 
     # filter for active transactions only
     if request.args.get('active', 'false').lower() == 'true':
         query = query.filter(Transaction.date_returned == None)
+    query = query.order_by(Transaction.id)
 
-    transactions = query.all()
-    results = []
-    for tx in transactions:
-        # Retrieve the user associated with the transaction
-        user = User.query.get(tx.user_id)
-        # Prepare detailed user info if available
-        user_details = {
-            'username': user.username if user else "",
-            'email': user.email if user else "",
-            'membership_status': "Active" if user and user.is_active else "Cancelled" if user else ""
-        }
-
-        results.append({
-            'transaction_id': tx.id,
-            'book_title': tx.book_copy.book.title,
-            'user_id': tx.user_id,
-            'book_copy_id': tx.book_copy_id,
-            **user_details,
-            'date_issued': tx.date_issued.strftime('%Y-%m-%d %H:%M:%S'),
-            'due_date': tx.due_date.strftime('%Y-%m-%d %H:%M:%S'),
-            'date_returned': tx.date_returned.strftime('%Y-%m-%d %H:%M:%S') if tx.date_returned else None,
-            'fine_amount': tx.fine_amount,
-            'transaction_type': tx.transaction_type
-        })
-
+    if stream:
+        return streaming_response(query, serialize_transaction, stream, TRANSACTION_FIELDS, 'transactions',
+                                  current_app.config['STREAM_CHUNK_SIZE'])
+    results = [serialize_transaction(row) for row in query]
     return jsonify({'transactions': results}), 200
 
 
@@ -741,27 +1212,28 @@ def get_reservations():
     - user_id (str): Retrieve reservations for a specific user.
     - active (str): If 'true', filter for active reservations only. If 'false' or not provided, include all reservations.
 
+    The book title and user of every reservation are read by the same query, so a request costs one query
+    however many reservations it returns.
+
     Returns:
     - JSON response containing a list of reservations. Each reservation includes detailed user information.
     """
+    query = (db.session.query(Reservation, Book.title, User)
+             .join(Reservation.book)
+             .outerjoin(User, User.id == Reservation.user_id))
     # Check if 'all=true' is provided (librarian usage); otherwise, filter by user_id (member usage)
-    if request.args.get('all', 'false').lower() == 'true':
-        query = Reservation.query
-    else:
+    if request.args.get('all', 'false').lower() != 'true':
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({'error': 'user_id parameter is required'}), 400
-        query = Reservation.query.filter_by(user_id=user_id)
+        query = query.filter(Reservation.user_id == user_id)
 
     # filter for active reservations
     if request.args.get('active', 'false').lower() == 'true':
-        query = query.filter_by(status='active')
+        query = query.filter(Reservation.status == 'active')
 
-    reservations = query.all()
     results = []
-    for res in reservations:
-        # Retrieve the user associated with the reservation
-        user = User.query.get(res.user_id)
+    for res, book_title, user in query.order_by(Reservation.id):
         user_details = {
             'username': user.username if user else "",
             'email': user.email if user else "",
@@ -770,7 +1242,7 @@ def get_reservations():
 
         results.append({
             'reservation_id': res.id,
-            'book_title': res.book.title,
+            'book_title': book_title,
             'user_id': res.user_id,
             **user_details,
             'reservation_date': res.reservation_date.strftime('%Y-%m-%d %H:%M:%S'),
@@ -817,31 +1289,117 @@ def get_inventory():
     }), 200
 
 
-#returns all users with the role "member"
+#returns the users with the role "member", one page at a time
 @main.route('/members', methods=['GET'])
 def get_members():
     """
-    Retrieve all members from the library.
+    Retrieve the library's members, one page at a time.
 
     Parameters:
-    None
+    q (str, optional): Case-insensitive prefix of the username or email to search for.
+    limit (int, optional): Page size, default MEMBERS_PAGE_SIZE, at most MEMBERS_MAX_PAGE_SIZE.
+    cursor (str, optional): The next_cursor of the previous page.
+    barcode_images (str, optional): 'true' to also embed each member's barcode as a base64 PNG.
+
+    Members are listed by id with a keyset cursor, so every page costs the same however many members
+    there are. The q search compares lower(username) and lower(email) against the range of strings
+    starting with the prefix, which the expression indexes ix_users_username_lower and ix_users_email_lower
+    answer directly (a LIKE pattern could not use them).
 
     Returns:
-    JSON response containing a list of members. Each member includes detailed user information.
-    The 'barcode_image' field is generated using a unique code for each member.
+    JSON response: {'members': [{'id', 'username', 'email', 'is_active', 'barcode_url'}, ...],
+                    'next_cursor': <cursor of the next page, or null on the last page>}
+    The 'barcode_url' field links the member's barcode image (served with HTTP caching by /barcodes/),
+    and 'barcode_image' carries the image itself only when barcode_images=true.
+    An error message with status 400 if limit or cursor is invalid.
     """
-    members = User.query.filter_by(role='member').all()
+    try:
+        limit = parse_limit(request.args.get('limit'), current_app.config['MEMBERS_PAGE_SIZE'],
+                            current_app.config['MEMBERS_MAX_PAGE_SIZE'])
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    inline_barcodes = wants_inline_barcodes()
+
+    query = User.query.filter_by(role='member')
+    q = request.args.get('q', '').strip()
+    if q:
+        query = query.filter(db.or_(prefix_condition(db.func.lower(User.username), q),
+                                    prefix_condition(db.func.lower(User.email), q)))
+    try:
+        members, next_cursor = keyset_page(query, User.id, User.id, limit, request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
     results = []
     for member in members:
+        code = "MEMBER-" + str(member.id)
         results.append({
             'id': member.id,
             'username': member.username,
             'email': member.email,
             'is_active': member.is_active,
-            # Generate a barcode image using a unique code
-            'barcode_image': generate_barcode_base64("MEMBER-" + str(member.id))
+            'barcode_url': barcode_url(code)
         })
-    return jsonify({'members': results}), 200
+        if inline_barcodes:
+            results[-1]['barcode_image'] = generate_barcode_base64(code)
+    return jsonify({'members': results, 'next_cursor': next_cursor}), 200
+
+
+def prefix_condition(expression, prefix):
+    """
+    Returns the condition "expression starts with prefix" as a range (prefix <= expression < the prefix with
+    its last character incremented), which an index on the expression can answer. The prefix is lowercased
+    like SQLite's lower(), which only folds ASCII letters.
+    """
+    prefix = ''.join(char.lower() if char.isascii() else char for char in prefix)
+    if ord(prefix[-1]) == 0x10FFFF:
+        return expression >= prefix
+    return db.and_(expression >= prefix, expression < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+# Endpoint for enrolling many users at once
+@main.route('/members/bulk', methods=['POST'])
+def bulk_enroll():
+    """
+    Enrolls users in bulk from a CSV or JSON list, e.g. when onboarding a school. Only a logged-in librarian
+    may enroll users, so members cannot create accounts, least of all librarian ones.
+
+    Records are checked for missing fields, invalid roles and duplicate usernames or emails (within the
+    input and against existing users, with set-based queries). The passwords of the valid records are hashed
+    by ENROLL_HASH_WORKERS processes, and users are inserted ENROLL_BATCH_SIZE at a time, one transaction per
+    batch. Invalid records do not stop the others; they are listed in the report.
+
+    Request body (one of):
+    - JSON: a list of {'username', 'email', 'password', 'role' (optional, 'member' or 'librarian')} objects,
+      or {'users': [...]}.
+    - CSV: a text/csv body, or a multipart upload in the 'file' field, with a header row naming the columns.
+
+    Returns:
+    JSON response: {'created': <int>, 'failed': <int>, 'errors': [{'row', 'username', 'email', 'error'}, ...]}
+    where row is the record's position in the input, from 1. An error message with status 403 if the caller
+    is not a logged-in librarian, or 400 if the body cannot be read, has no records or more than ENROLL_MAX_ROWS.
+    """
+    if 'user_id' not in session or session.get('role') != 'librarian':
+        return jsonify({'error': 'Only librarians can enroll users'}), 403
+    try:
+        if 'file' in request.files:
+            records = read_enrollment_csv(request.files['file'].read().decode('utf-8-sig'))
+        elif request.mimetype == 'text/csv':
+            records = read_enrollment_csv(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True)
+            records = data.get('users') if isinstance(data, dict) else data
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': f'Invalid CSV: {e}'}), 400
+    if not isinstance(records, list) or not records:
+        return jsonify({'error': 'Provide a non-empty list of users as JSON or CSV'}), 400
+    max_rows = current_app.config['ENROLL_MAX_ROWS']
+    if len(records) > max_rows:
+        return jsonify({'error': f'Too many users ({len(records)}). The maximum is {max_rows}.'}), 400
+
+    report = enroll_users(records, workers=current_app.config['ENROLL_HASH_WORKERS'],
+                          batch_size=current_app.config['ENROLL_BATCH_SIZE'])
+    return jsonify(report), 200
 
 
 #Update Member Details
@@ -872,6 +1430,7 @@ def update_member(member_id):
         member.is_active = data.get('is_active')
 
     db.session.commit()
+    invalidate_user_status(member_id)
     return jsonify({'message': 'Member updated successfully'}), 200
 
 
@@ -896,6 +1455,7 @@ def cancel_member(member_id):
 
     member.is_active = False
     db.session.commit()
+    invalidate_user_status(member_id)
     return jsonify({'message': 'Membership cancelled successfully'}), 200
 
 
@@ -907,17 +1467,20 @@ def get_book_details(book_id):
 
     Parameters:
     book_id (int): The unique identifier of the book.
+    barcode_images (str, optional): 'true' to also embed each copy's barcode as a base64 PNG.
 
     Returns:
     JSON response:
-    - If the book is found: A dictionary containing detailed information about the book.
+    - If the book is found: A dictionary containing detailed information about the book. Each copy has a
+      'barcode_url' linking its barcode image, and a 'barcode_image' only when barcode_images=true.
     - If the book is not found: A JSON object with an 'error' key indicating 'Book not found'.
     """
     book = Book.query.get(book_id)
     if not book:
         return jsonify({'error': 'Book not found'}), 404
 
-    # Build a list of copies for this book with barcode images.
+    # Build a list of copies for this book with links to their barcode images.
+    inline_barcodes = wants_inline_barcodes()
     copies_list = []
     if book.copies:
         for copy in book.copies:
@@ -925,8 +1488,10 @@ def get_book_details(book_id):
                 'id': copy.id,
                 'unique_barcode': copy.unique_barcode,
                 'status': copy.status,
-                'barcode_image': generate_barcode_base64(copy.unique_barcode)
+                'barcode_url': barcode_url(copy.unique_barcode)
             })
+            if inline_barcodes:
+                copies_list[-1]['barcode_image'] = generate_barcode_base64(copy.unique_barcode)
 
     book_details = {
         'id': book.id,
@@ -966,6 +1531,7 @@ def cancel_membership():
 
     user.is_active = False
     db.session.commit()
+    invalidate_user_status(user.id)
     # clear session to log out the user
     session.clear()
     return jsonify({'message': 'Your membership has been canceled.'}), 200
@@ -988,24 +1554,43 @@ def borrowing_history():
 
     The borrowing history includes details such as transaction_id, book_title, transaction_type, date_issued, due_date,
     date_returned, and fine_amount.
+
+    With format=ndjson or format=csv (or the matching Accept header) the history is streamed one
+    transaction per line, read in batches of STREAM_CHUNK_SIZE, instead of returned as one JSON document.
     """
+    try:
+        stream = streaming_format(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id parameter is required'}), 400
 
-    # Get all transactions for the user, ordered by date_issued descending (latest first)
-    transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.date_issued.desc()).all()
-    history = []
-    for tx in transactions:
-        history.append({
+    # Get all transactions for the user with their book titles, ordered by date_issued descending (latest first)
+    query = (db.session.query(Transaction, Book.title)
+             .join(Transaction.book_copy)
+             .join(BookCopy.book)
+             .filter(Transaction.user_id == user_id)
+             .order_by(Transaction.date_issued.desc(), Transaction.id.desc()))
+
+    def serialize(row):
+        tx, book_title = row
+        return {
             'transaction_id': tx.id,
-            'book_title': tx.book_copy.book.title,
+            'book_title': book_title,
             'transaction_type': tx.transaction_type,
             'date_issued': tx.date_issued.strftime('%Y-%m-%d %H:%M:%S'),
             'due_date': tx.due_date.strftime('%Y-%m-%d %H:%M:%S'),
             'date_returned': tx.date_returned.strftime('%Y-%m-%d %H:%M:%S') if tx.date_returned else None,
             'fine_amount': tx.fine_amount
-        })
+        }
+
+    if stream:
+        return streaming_response(query, serialize, stream,
+                                  ['transaction_id', 'book_title', 'transaction_type', 'date_issued', 'due_date',
+                                   'date_returned', 'fine_amount'],
+                                  'borrowing_history', current_app.config['STREAM_CHUNK_SIZE'])
+    history = [serialize(row) for row in query]
     return jsonify({'borrowing_history': history}), 200
 
 
@@ -1030,19 +1615,21 @@ def overdue_transactions():
       - 'due_date': The date and time when the book was due to be returned.
       - 'fine_amount': The amount of fine charged for late return.
 
-    The function queries all transactions where the book has not been returned and the due_date is in the past.
+    The function queries all transactions where the book has not been returned and the due_date is in the past,
+    together with their book titles in a single query (served by the partial index on open loans' due dates).
     """
     # Query all transactions where the book has not been returned and due_date is in the past
-    transactions = Transaction.query.filter(
-        Transaction.date_returned == None,
-        Transaction.due_date < datetime.utcnow()
-    ).all()
+    transactions = (db.session.query(Transaction, Book.title)
+                    .join(Transaction.book_copy)
+                    .join(BookCopy.book)
+                    .filter(Transaction.date_returned == None, Transaction.due_date < datetime.utcnow())
+                    .order_by(Transaction.due_date, Transaction.id))
 
     results = []
-    for tx in transactions:
+    for tx, book_title in transactions:
         results.append({
             'transaction_id': tx.id,
-            'book_title': tx.book_copy.book.title,
+            'book_title': book_title,
             'user_id': tx.user_id,
             'date_issued': tx.date_issued.strftime('%Y-%m-%d %H:%M:%S'),
             'due_date': tx.due_date.strftime('%Y-%m-%d %H:%M:%S'),
@@ -1120,13 +1707,95 @@ def reactivate_member(member_id):
 
     member.is_active = True
     db.session.commit()
+    invalidate_user_status(member_id)
     return jsonify({'message': 'Membership reactivated successfully'}), 200
 
 
 
-# Load a pre-trained model
-model = SentenceTransformer('all-mpnet-base-v2') # Better performance model
-# Lighter model : all-MiniLM-L6-v2
+@main.errorhandler(InferencePoolBusy)
+def inference_pool_busy(error):
+    """
+    Returned by the recommendation endpoints when the inference pool already has its maximum number of
+    pending jobs (back-pressure instead of an unbounded queue).
+    """
+    response = jsonify({'message': 'BookBot is busy right now. Please try again in a few seconds.'})
+    response.headers['Retry-After'] = '2'
+    return response, 503
+
+
+@main.errorhandler(InferenceTimeout)
+def inference_timeout(error):
+    """
+    Returned when an encode job in the inference pool did not finish within RECOMMENDER_POOL_TIMEOUT.
+    """
+    return jsonify({'error': 'Recommendation request timed out.'}), 504
+
+
+def load_recommendation_model():
+    """
+    Returns the recommendation model, waiting a bounded time for it to finish loading.
+
+    Returns:
+    tuple: (model, None) when the model is ready, or (None, error_response) with a 503 response when the
+    model is still warming up or could not be loaded.
+    """
+    try:
+        model = get_model(current_app.config['RECOMMENDER_MODEL'],
+                          timeout=current_app.config['RECOMMENDER_LOAD_TIMEOUT'])
+    except RuntimeError:
+        return None, (jsonify({'error': 'Recommendation engine is unavailable.'}), 503)
+    if model is None:
+        response = jsonify({'message': 'BookBot is warming up. Please try again in a few seconds.'})
+        response.headers['Retry-After'] = '5'
+        return None, (response, 503)
+    return model, None
+
+
+def encode_prompts(model, prompts):
+    """
+    Spell-corrects and encodes prompts. Prompts seen recently are served from the prompt cache and skip
+    both the spell checker and the model; the remaining ones are encoded with a single batched call.
+
+    Returns:
+    ndarray: (len(prompts), dim) matrix of L2-normalised prompt embeddings.
+    """
+    embeddings = [None] * len(prompts)
+    misses = {}
+    for i, prompt in enumerate(prompts):
+        cached = prompt_cache.get(prompt)
+        if cached:
+            embeddings[i] = cached[1]
+        else:
+            # Identical prompts within one batch are encoded once
+            misses.setdefault(normalize_prompt(prompt), []).append(i)
+    if misses:
+        first = [positions[0] for positions in misses.values()]
+        corrected = [correct_text(prompts[i]) for i in first]
+        encoded = normalize(model.encode(corrected, convert_to_numpy=True))
+        for positions, corrected_prompt, embedding in zip(misses.values(), corrected, encoded):
+            prompt_cache.put(prompts[positions[0]], corrected_prompt, embedding)
+            for i in positions:
+                embeddings[i] = embedding
+    return np.vstack(embeddings)
+
+
+def serialize_recommendations(matches_per_prompt):
+    """
+    Turns the (book_id, similarity) matches of one or more prompts into JSON-ready lists, loading all
+    recommended books with a single query.
+    """
+    book_ids = {book_id for matches in matches_per_prompt for book_id, _ in matches}
+    books = {book.id: book for book in Book.query.filter(Book.id.in_(book_ids))} if book_ids else {}
+    return [
+        [{
+            'id': book_id,
+            'title': books[book_id].title,
+            'subject': books[book_id].subject,
+            'similarity': score
+        } for book_id, score in matches if book_id in books]
+        for matches in matches_per_prompt
+    ]
+
 
 @main.route('/recommend', methods=['POST'])
 def recommend_books():
@@ -1146,53 +1815,157 @@ def recommend_books():
       {'message': 'No matching books found based on your interest.'}
     - If no books are available in the library:
       {'message': 'No books available in the library.'}
+    - If the recommendation model is still loading (503, with a Retry-After header):
+      {'message': 'BookBot is warming up. Please try again in a few seconds.'}
+    - If the recommendation model could not be loaded (503):
+      {'error': 'Recommendation engine is unavailable.'}
     """
     data = request.get_json()
     prompt = data.get('prompt', '').strip()
     if not prompt:
         return jsonify({'message': 'Please provide a prompt.'}), 400
 
-    # Correct spelling mistakes in the prompt
-    corrected_prompt = correct_text(prompt)
+    # The model is loaded lazily; wait a bounded time for it instead of blocking the worker indefinitely
+    model, error_response = load_recommendation_model()
+    if error_response:
+        return error_response
 
-    # Retrieve all books from the database
-    books = Book.query.all()
-    if not books:
+    # Bring the stored book embeddings up to date (only new or changed books are encoded)
+    embedding_index.sync(model)
+    if not embedding_index.size:
         return jsonify({'message': 'No books available in the library.'}), 200
 
-    # Prepare documents: combine title and subject for each book
-    book_texts = [f"{book.title} {book.author} {book.subject}" for book in books]
-    book_ids = [book.id for book in books]
+    # Correct spelling mistakes and encode the prompt (repeated prompts come from the prompt cache)
+    prompt_embedding = encode_prompts(model, [prompt])
+
+    # Vectorised top-k search (exact or approximate, see RECOMMENDER_INDEX) above the similarity threshold
+    recommendations = embedding_index.search(
+        prompt_embedding,
+        k=current_app.config['RECOMMENDER_TOP_K'],
+        threshold=current_app.config['RECOMMENDER_MIN_SIMILARITY']
+    )[0]
+
+    if not recommendations:
+        return jsonify({'message': 'No matching books found based on your interest.'}), 200
 
-    # Compute embeddings for the books and for the corrected prompt
-    book_embeddings = model.encode(book_texts, convert_to_tensor=True)
-    prompt_embedding = model.encode(corrected_prompt, convert_to_tensor=True)
+    return jsonify({'recommendations': serialize_recommendations([recommendations])[0]}), 200
 
-    # Compute cosine similarity between the prompt and each book
-    cosine_scores = util.cos_sim(prompt_embedding, book_embeddings)[0]
 
-    # Set a similarity threshold and pick top 3 if above threshold
-    threshold = 0.1
-    recommendations = []
-    for idx, score in enumerate(cosine_scores):
-        if score >= threshold:
-            recommendations.append((book_ids[idx], score.item()))
+@main.route('/recommend/batch', methods=['POST'])
+def recommend_books_batch():
+    """
+    Recommend books for many prompts at once (e.g. nightly personalised reading lists).
+    All prompts are encoded with one batched model call and scored with one matrix product.
+
+    Expected JSON payload, either a list of prompts or prompts keyed by an id of the caller's choice (e.g. user id):
+    {
+      "prompts": ["fantasy", "science fiction"] | {"<key>": "<prompt>", ...},
+      "top_k": <int, optional, defaults to RECOMMENDER_TOP_K, at most RECOMMENDER_BATCH_MAX_TOP_K>
+    }
 
+    Returns:
+    JSON response with the same shape as "prompts":
+    - {'recommendations': [[{'id', 'title', 'subject', 'similarity'}, ...], ...]} for a list of prompts
+    - {'recommendations': {'<key>': [...], ...}} for keyed prompts
+    Empty prompts and prompts without a match get an empty list.
+
+    Errors:
+    - 400 if prompts is missing, not a list/object of strings, or larger than RECOMMENDER_BATCH_MAX_PROMPTS
+    - 400 if top_k is not a positive integer
+    - 503 if the recommendation model is warming up or unavailable
+    """
+    data = request.get_json()
+    prompts = data.get('prompts')
+    if isinstance(prompts, dict):
+        keys, texts = list(prompts.keys()), list(prompts.values())
+    elif isinstance(prompts, list):
+        keys, texts = None, prompts
+    else:
+        return jsonify({'error': 'prompts must be a list of strings or an object mapping keys to strings'}), 400
+    if not all(isinstance(text, str) for text in texts):
+        return jsonify({'error': 'prompts must be a list of strings or an object mapping keys to strings'}), 400
+    if len(texts) > current_app.config['RECOMMENDER_BATCH_MAX_PROMPTS']:
+        return jsonify({'error': f"At most {current_app.config['RECOMMENDER_BATCH_MAX_PROMPTS']} prompts per batch"}), 400
+
+    top_k = data.get('top_k', current_app.config['RECOMMENDER_TOP_K'])
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1:
+        return jsonify({'error': 'top_k must be a positive integer'}), 400
+    top_k = min(top_k, current_app.config['RECOMMENDER_BATCH_MAX_TOP_K'])
+
+    model, error_response = load_recommendation_model()
+    if error_response:
+        return error_response
+
+    results = [[] for _ in texts]
+    positions = [i for i, text in enumerate(texts) if text.strip()]
+    embedding_index.sync(model)
+    if positions and embedding_index.size:
+        # One batched encode for every uncached prompt, then one search over the whole query matrix
+        prompt_embeddings = encode_prompts(model, [texts[i].strip() for i in positions])
+        matches = embedding_index.search(
+            prompt_embeddings,
+            k=top_k,
+            threshold=current_app.config['RECOMMENDER_MIN_SIMILARITY']
+        )
+        for i, recs in zip(positions, serialize_recommendations(matches)):
+            results[i] = recs
+
+    if keys is not None:
+        return jsonify({'recommendations': dict(zip(keys, results))}), 200
+    return jsonify({'recommendations': results}), 200
+
+
+@main.route('/recommend/for_me', methods=['GET'])
+@require_active_membership
+def recommend_for_me():
+    """
+    Recommend books for the logged-in member based on their borrowing history instead of a prompt.
+
+    The member's taste profile (a recency-weighted sum of the embeddings of the books they borrowed, see
+    app.utils.taste_profile) is kept up to date on every checkout and return, so this request only
+    normalises one stored vector and runs one search. Books the member has already borrowed are excluded.
+    No prompt is encoded: the model is only used, if already loaded, to encode books that have no
+    stored embedding yet.
+
+    Returns:
+    JSON response:
+    - {'recommendations': [{'id': book_id, 'title': book_title, 'subject': book_subject, 'similarity': similarity_score}]}
+    - {'message': 'Borrow a few books first and BookBot will suggest similar ones.'} if the member has no loans yet
+    - {'message': 'No new books match your reading history yet.'} if every match was already borrowed
+    - {'message': 'No books available in the library.'}
+    """
+    user_id = session['user_id']
+
+    embedding_index.sync(get_loaded_model())
+    if not embedding_index.size:
+        return jsonify({'message': 'No books available in the library.'}), 200
+
+    profile = update_taste_profile(user_id)
+    if profile is None:
+        return jsonify({'message': 'Borrow a few books first and BookBot will suggest similar ones.'}), 200
+
+    # Ask for enough extra matches to still have top_k after dropping the books already borrowed
+    borrowed = borrowed_book_ids(user_id)
+    top_k = current_app.config['RECOMMENDER_TOP_K']
+    matches = embedding_index.search(
+        taste_vector(profile)[None, :],
+        k=top_k + len(borrowed),
+        threshold=current_app.config['RECOMMENDER_MIN_SIMILARITY']
+    )[0]
+    recommendations = [match for match in matches if match[0] not in borrowed][:top_k]
     if not recommendations:
-        return jsonify({'message': 'No matching books found based on your interest.'}), 200
+        return jsonify({'message': 'No new books match your reading history yet.'}), 200
 
-    # Sort recommendations by similarity descending and take top 3
-    recommendations = sorted(recommendations, key=lambda x: x[1], reverse=True)[:3]
-
-    # Retrieve book details for recommended books
-    rec_books = []
-    for book_id, score in recommendations:
-        book = Book.query.get(book_id)
-        rec_books.append({
-            'id': book.id,
-            'title': book.title,
-            'subject': book.subject,
-            'similarity': score
-        })
+    return jsonify({'recommendations': serialize_recommendations([recommendations])[0]}), 200
+
+
+@main.route('/recommend/cache_stats', methods=['GET'])
+def recommendation_cache_stats():
+    """
+    Returns the hit/miss counters and limits of the prompt cache used by the recommendation endpoints.
 
-    return jsonify({'recommendations': rec_books}), 200
+    Returns:
+    JSON response:
+    {'prompt_cache': {'size': <int>, 'maxsize': <int>, 'ttl': <seconds>, 'hits': <int>, 'misses': <int>, 'hit_rate': <float>}}
+    """
+    return jsonify({'prompt_cache': prompt_cache.stats()}), 200
@@ -1,16 +1,241 @@
 import io
+import os
 import base64
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
 import barcode
-from barcode.writer import ImageWriter
+from barcode.writer import ImageWriter, SVGWriter
 
-def generate_barcode_base64(code_value):
+# Identifies how images are rendered; part of every cache key, so changing the symbology or writer
+# settings makes the cache render fresh images instead of serving stale ones
+RENDER_VERSION = f"code128-python-barcode-{barcode.version}"
+# Image formats and their media types
+BARCODE_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+# Longest code served by /barcodes/ (the length of BookCopy.unique_barcode)
+MAX_CODE_LENGTH = 50
+
+
+def is_valid_code(code_value):
     """
-    Generates a barcode image for the given code_value and returns it as a base64 string.
+    Returns True if the code can be rendered: 1 to MAX_CODE_LENGTH printable ASCII characters.
+    """
+    return 0 < len(code_value) <= MAX_CODE_LENGTH and all(' ' <= char <= '~' for char in code_value)
+
+
+def render_barcode(code_value, fmt='png'):
+    """
+    Renders a Code128 barcode for the given code_value and returns the image bytes ('png' or 'svg').
     """
     # Using Code128 as the barcode format.
     CODE128 = barcode.get_barcode_class('code128')
     rv = io.BytesIO()
-    barcode_obj = CODE128(code_value, writer=ImageWriter())
+    barcode_obj = CODE128(code_value, writer=ImageWriter() if fmt == 'png' else SVGWriter())
     barcode_obj.write(rv)
-    base64_str = base64.b64encode(rv.getvalue()).decode('utf-8')
-    return base64_str
+    return rv.getvalue()
+
+
+def barcode_key(code_value, fmt='png'):
+    """
+    Returns the content address of a barcode image: the sha256 of the render version, format and code.
+    It changes whenever the image would, so it doubles as the image's HTTP ETag.
+    """
+    return hashlib.sha256(f"{RENDER_VERSION}\0{fmt}\0{code_value}".encode('utf-8')).hexdigest()
+
+
+class BarcodeCache:
+    """
+    Two-level cache of rendered barcode images: an in-memory LRU in front of a content-addressed store on
+    disk (one file per image, <directory>/<first 2 hex digits>/<sha256>.<png|svg>).
+
+    The codes shown by the app (MEMBER-<id>, copy barcodes) never change, so each image is rendered once
+    and then served from memory, or from disk after a restart and in other worker processes. Concurrent
+    misses for the same code wait for a single render. When the store grows past its byte limit the least
+    recently written files are removed.
+    """
+
+    def __init__(self, maxsize=2048, directory=None, max_disk_bytes=256 * 1024 * 1024, render=render_barcode):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._rendering = {}
+        self._render = render
+        self.maxsize = maxsize
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._disk_bytes = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize, directory, max_disk_bytes):
+        """
+        Changes the memory limit (entries), the store directory (None keeps images in memory only) and the
+        store size limit (bytes), and empties the in-memory cache.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.directory = directory
+            self.max_disk_bytes = max_disk_bytes
+            self._disk_bytes = None
+            self._entries.clear()
+
+    def get(self, code_value, fmt='png'):
+        """
+        Returns the image bytes of a code's barcode in the given format, rendering it only if neither level
+        has it.
+        """
+        key = barcode_key(code_value, fmt)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return image
+            render_lock = self._rendering.setdefault(key, threading.Lock())
+
+        try:
+            with render_lock:
+                # Another thread may have rendered it while this one waited
+                with self._lock:
+                    image = self._entries.get(key)
+                if image is not None:
+                    counter = 'memory_hits'
+                else:
+                    image = self._read(key, fmt)
+                    counter = 'disk_hits'
+                if image is None:
+                    image = self._render(code_value, fmt)
+                    self._write(key, fmt, image)
+                    counter = 'misses'
+                with self._lock:
+                    setattr(self, counter, getattr(self, counter) + 1)
+                self._remember(key, image)
+        finally:
+            with self._lock:
+                self._rendering.pop(key, None)
+        return image
+
+    def clear(self):
+        """
+        Empties the in-memory cache (the disk store is kept).
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache sizes, limits and hit/miss counters as a dictionary.
+        """
+        disk_bytes = self._disk_usage()
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'disk_bytes': disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes if self.directory else 0,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+    def _remember(self, key, image):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _path(self, key, fmt):
+        return os.path.join(self.directory, key[:2], f"{key}.{fmt}")
+
+    def _read(self, key, fmt):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key, fmt), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, key, fmt, image):
+        if not self.directory:
+            return
+        path = self._path(key, fmt)
+        usage = self._disk_usage()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written to a temporary file and renamed, so other processes never read a partial image
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(image)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not store barcode image: {e}")
+            return
+        usage += len(image)
+        with self._lock:
+            self._disk_bytes = usage
+        if usage > self.max_disk_bytes:
+            self._prune()
+
+    def _files(self):
+        """
+        Returns (mtime, size, path) of every image in the store.
+        """
+        files = []
+        if not self.directory or not os.path.isdir(self.directory):
+            return files
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.rpartition('.')[2] in BARCODE_MIMETYPES:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return files
+
+    def _disk_usage(self):
+        with self._lock:
+            if self._disk_bytes is not None:
+                return self._disk_bytes
+        usage = sum(size for _, size, _ in self._files())
+        with self._lock:
+            self._disk_bytes = usage
+        return usage
+
+    def _prune(self):
+        """
+        Removes the oldest files until the store is at 90% of its limit.
+        """
+        files = sorted(self._files())
+        usage = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * 0.9
+        for _, size, path in files:
+            if usage <= target:
+                break
+            try:
+                os.remove(path)
+                usage -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = usage
+
+
+# Process-wide barcode image cache (configured by create_app to store images under instance/barcodes/)
+barcode_cache = BarcodeCache()
+
+
+def generate_barcode_base64(code_value):
+    """
+    Returns the barcode image of the given code_value as a base64 PNG string (cached, see BarcodeCache).
+    """
+    return base64.b64encode(barcode_cache.get(code_value)).decode('utf-8')
@@ -0,0 +1,116 @@
+import re
+from sqlalchemy import DDL, column, event, func, literal_column, table, text
+from app import db
+from app.models import Book
+
+# FTS5 index over the searchable book columns. It is an external-content table: it stores only the
+# inverted index and reads title/author/subject from `books`, and triggers keep it in sync with every
+# insert, update and delete on `books` (including those made by scripts that bypass the routes).
+FTS_TABLE = 'books_fts'
+FTS_COLUMNS = ('title', 'author', 'subject')
+# bm25 column weights for relevance ranking: a match in the title counts more than one in the subject
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+_CREATE_STATEMENTS = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author, subject,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON books BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, subject) VALUES (new.id, new.title, new.author, new.subject);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, subject)
+        VALUES ('delete', old.id, old.title, old.author, old.subject);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, author, subject ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, subject)
+        VALUES ('delete', old.id, old.title, old.author, old.subject);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, subject) VALUES (new.id, new.title, new.author, new.subject);
+    END""",
+)
+
+# Created and dropped together with the books table by db.create_all() / db.drop_all()
+for _statement in _CREATE_STATEMENTS:
+    event.listen(Book.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(Book.__table__, 'before_drop', DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect='sqlite'))
+
+
+def search_index_exists():
+    """
+    Returns True if the full-text index exists in the current database. Databases created before the
+    index was introduced need a one-off backfill (see rebuild_search_index / build_search_index.py).
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first() is not None
+
+
+def rebuild_search_index():
+    """
+    Creates the full-text index and its triggers if they are missing and re-indexes every book.
+
+    Returns:
+    int: The number of indexed books.
+    """
+    for statement in _CREATE_STATEMENTS:
+        db.session.execute(text(statement))
+    db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    db.session.commit()
+    return db.session.query(func.count(Book.id)).scalar()
+
+
+def match_terms(query_text):
+    """
+    Turns free text into an FTS5 expression that requires every word as a term prefix, e.g.
+    'lord of the ri' -> '"lord"* "of"* "the"* "ri"*'. Words are quoted, so FTS5 operators and
+    punctuation in user input are never interpreted.
+
+    Returns:
+    str: The expression, or None if the text has no searchable words.
+    """
+    words = re.findall(r'\w+', query_text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def match_expression(q=None, **columns):
+    """
+    Builds the MATCH expression for a search over all indexed columns (`q`) and/or per-column
+    filters (title=..., author=..., subject=...). All given filters must match.
+
+    Returns:
+    str: The expression, or None if no filter has searchable words.
+    """
+    parts = []
+    terms = match_terms(q)
+    if terms:
+        parts.append(f'({terms})')
+    for name in FTS_COLUMNS:
+        terms = match_terms(columns.get(name))
+        if terms:
+            parts.append(f'{name} : ({terms})')
+    return ' AND '.join(parts) or None
+
+
+# The hidden column named after the table is what MATCH and bm25() operate on
+_fts_column = literal_column(FTS_TABLE)
+
+
+def apply_text_search(query, expression):
+    """
+    Restricts a Book query to the books matching an FTS5 expression. Order the result by relevance_rank().
+    """
+    fts = table(FTS_TABLE, column('rowid'))
+    return query.join(fts, fts.c.rowid == Book.id).filter(_fts_column.op('MATCH')(expression))
+
+
+def relevance_rank():
+    """
+    Returns the bm25 rank of a row in a query built by apply_text_search (lower is more relevant).
+    """
+    return func.bm25(_fts_column, *RANK_WEIGHTS)
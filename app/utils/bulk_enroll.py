@@ -0,0 +1,150 @@
+import csv
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User
+
+# Columns of an enrollment file (CSV header or JSON keys); role is optional and defaults to 'member'
+ENROLL_FIELDS = ('username', 'email', 'password', 'role')
+ENROLL_ROLES = ('member', 'librarian')
+# Usernames / emails looked up per duplicate-check query (SQLite allows 32766 bound parameters per statement)
+DUPLICATE_CHECK_CHUNK = 10000
+
+
+def read_enrollment_csv(text):
+    """
+    Parses an enrollment CSV (a header row naming the ENROLL_FIELDS columns, in any order) into a list of
+    dictionaries.
+
+    Raises:
+    ValueError: If the header lacks the username, email or password column.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    header = [name.strip().lower() for name in reader.fieldnames or []]
+    missing = [name for name in ('username', 'email', 'password') if name not in header]
+    if missing:
+        raise ValueError(f"CSV header must include: {', '.join(missing)}")
+    reader.fieldnames = header
+    return list(reader)
+
+
+def validate_enrollment(records):
+    """
+    Checks enrollment records and returns (accepted, errors).
+
+    Each record must have a username, email and password and a valid role, and its username and email must
+    be unique both within the input and among existing users. Existing users are found with one set-based
+    query per DUPLICATE_CHECK_CHUNK records instead of one query per record.
+
+    Returns:
+    tuple: (accepted, errors) where accepted is a list of (row, fields) pairs (row is the record's position
+           in the input, from 1) and errors a list of {'row', 'username', 'email', 'error'} dictionaries.
+    """
+    accepted, errors = [], []
+    seen_usernames, seen_emails = set(), set()
+    for row, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            errors.append({'row': row, 'username': None, 'email': None, 'error': 'Record must be an object'})
+            continue
+        fields = {name: str(record.get(name) or '').strip() for name in ENROLL_FIELDS if name != 'password'}
+        # Passwords are kept exactly as given, spaces included, as /register does
+        fields['password'] = str(record.get('password') or '')
+        fields['role'] = fields['role'].lower() or 'member'
+        error = None
+        if not fields['username'] or not fields['email'] or not fields['password']:
+            error = 'Missing required fields'
+        elif fields['role'] not in ENROLL_ROLES:
+            error = f"Invalid role '{fields['role']}'"
+        elif fields['username'] in seen_usernames:
+            error = 'Duplicate username in the input'
+        elif fields['email'] in seen_emails:
+            error = 'Duplicate email in the input'
+        if error:
+            errors.append({'row': row, 'username': fields['username'], 'email': fields['email'], 'error': error})
+            continue
+        seen_usernames.add(fields['username'])
+        seen_emails.add(fields['email'])
+        accepted.append((row, fields))
+
+    existing_usernames, existing_emails = set(), set()
+    for start in range(0, len(accepted), DUPLICATE_CHECK_CHUNK):
+        chunk = accepted[start:start + DUPLICATE_CHECK_CHUNK]
+        usernames = [fields['username'] for _, fields in chunk]
+        emails = [fields['email'] for _, fields in chunk]
+        rows = db.session.query(User.username, User.email).filter(
+            User.username.in_(usernames) | User.email.in_(emails)).all()
+        existing_usernames.update(username for username, _ in rows)
+        existing_emails.update(email for _, email in rows)
+
+    new = []
+    for row, fields in accepted:
+        if fields['username'] in existing_usernames or fields['email'] in existing_emails:
+            errors.append({'row': row, 'username': fields['username'], 'email': fields['email'],
+                           'error': 'User with that username or email already exists'})
+        else:
+            new.append((row, fields))
+    return new, errors
+
+
+def hash_passwords(passwords, workers=0):
+    """
+    Returns generate_password_hash() of each password, in order. The hashing is deliberately slow (scrypt),
+    so with workers > 0 it is spread over a pool of that many processes.
+    """
+    if workers <= 0 or len(passwords) < 2:
+        return [generate_password_hash(password) for password in passwords]
+    workers = min(workers, len(passwords))
+    # 'spawn' so the workers do not inherit the web server's threads, sockets or database connections
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(generate_password_hash, passwords,
+                                 chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def enroll_users(records, workers=0, batch_size=1000):
+    """
+    Enrolls users in bulk: validates the records (see validate_enrollment()), hashes the passwords of the
+    valid ones in a process pool, and inserts them with one multi-row INSERT and commit per `batch_size`
+    users. If a batch fails (e.g. a user registered meanwhile took a username), it is retried one user at a
+    time so only the conflicting rows are rejected.
+
+    Parameters:
+    records (list): Dictionaries with the ENROLL_FIELDS keys, e.g. from read_enrollment_csv() or JSON.
+    workers (int): Processes hashing passwords (0 hashes in this process).
+    batch_size (int): Users inserted per transaction.
+
+    Returns:
+    dict: {'created': <int>, 'failed': <int>, 'errors': [{'row', 'username', 'email', 'error'}, ...]}
+          with the errors in input order.
+    """
+    new, errors = validate_enrollment(records)
+    hashes = hash_passwords([fields['password'] for _, fields in new], workers)
+    users = [{'username': fields['username'], 'email': fields['email'], 'password': password_hash,
+              'role': fields['role'], 'is_active': True}
+             for (_, fields), password_hash in zip(new, hashes)]
+
+    created = 0
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        try:
+            db.session.execute(insert(User), batch)
+            db.session.commit()
+            created += len(batch)
+            continue
+        except IntegrityError:
+            db.session.rollback()
+        for (row, _), user in zip(new[start:start + batch_size], batch):
+            try:
+                db.session.execute(insert(User), [user])
+                db.session.commit()
+                created += 1
+            except IntegrityError:
+                db.session.rollback()
+                errors.append({'row': row, 'username': user['username'], 'email': user['email'],
+                               'error': 'User with that username or email already exists'})
+
+    errors.sort(key=lambda error: error['row'])
+    return {'created': created, 'failed': len(errors), 'errors': errors}
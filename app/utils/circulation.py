@@ -0,0 +1,352 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, insert, or_, update
+from app import db
+from app.models import BookCopy, Reservation, Transaction, User
+
+# Candidates read per attempt to claim a copy or reservation, and the number of attempts before giving up
+# (each attempt only fails if every candidate was claimed by concurrent requests in the meantime)
+CLAIM_CANDIDATES = 5
+CLAIM_ATTEMPTS = 10
+# Length of a loan, and the fine per day overdue
+LOAN_DAYS = 10
+FINE_PER_DAY = 1.0
+
+
+def claim_row(model, row_id, from_status, to_status):
+    """
+    Changes a row's status with a conditional UPDATE (... WHERE id = :id AND status = :from_status) and
+    returns True if this call made the change, False if the row no longer had from_status.
+
+    The check and the change are one statement, so two concurrent requests can never both claim the same
+    row. The change is part of the session's transaction and is committed (or rolled back) with it.
+    """
+    result = db.session.execute(
+        update(model)
+        .where(model.id == row_id, model.status == from_status)
+        .values(status=to_status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def claim_available_copy(book_id, status='checked-out'):
+    """
+    Atomically moves an available copy of a book to `status` and returns its id, or None if the book has
+    no available copy.
+
+    Candidates are read without locking; if a concurrent request claims one first, the conditional UPDATE
+    matches no row and the next candidate is tried, re-reading the candidates when all of them are gone.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        candidates = [copy_id for copy_id, in db.session.query(BookCopy.id)
+                      .filter(BookCopy.book_id == book_id, BookCopy.status == 'available')
+                      .order_by(BookCopy.id)
+                      .limit(CLAIM_CANDIDATES)]
+        if not candidates:
+            return None
+        for copy_id in candidates:
+            if claim_row(BookCopy, copy_id, 'available', status):
+                return copy_id
+    return None
+
+
+def claim_copies(copy_ids, status='checked-out'):
+    """
+    Atomically moves the given copies to `status` if they are still available and returns the set of ids
+    this call claimed. On databases with UPDATE ... RETURNING (SQLite 3.35+, PostgreSQL) that is a single
+    statement for all of them.
+    """
+    if not copy_ids:
+        return set()
+    if not db.engine.dialect.update_returning:
+        return {copy_id for copy_id in copy_ids if claim_row(BookCopy, copy_id, 'available', status)}
+    result = db.session.execute(
+        update(BookCopy)
+        .where(BookCopy.id.in_(copy_ids), BookCopy.status == 'available')
+        .values(status=status)
+        .returning(BookCopy.id)
+        .execution_options(synchronize_session=False)
+    )
+    return {copy_id for copy_id, in result}
+
+
+def claim_next_reservation(book_id):
+    """
+    Atomically moves the oldest active reservation of a book to 'notified' and returns (reservation id,
+    username, email) of the member to notify, or None if the book has no active reservation.
+
+    Each reservation is fulfilled once, even when copies of the book are returned concurrently.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        candidates = (db.session.query(Reservation.id, User.username, User.email)
+                      .join(User, User.id == Reservation.user_id)
+                      .filter(Reservation.book_id == book_id, Reservation.status == 'active')
+                      .order_by(Reservation.id)
+                      .limit(CLAIM_CANDIDATES)
+                      .all())
+        if not candidates:
+            return None
+        for reservation_id, username, email in candidates:
+            if claim_row(Reservation, reservation_id, 'active', 'notified'):
+                return reservation_id, username, email
+    return None
+
+
+def claim_reservations(book_ids):
+    """
+    claim_next_reservation() for several returned copies at once (a book id per returned copy): the active
+    reservations of all the books are read with one query, then claimed in order. Returns the (username,
+    email) of the members to notify.
+    """
+    if not book_ids:
+        return []
+    queues = {}
+    for reservation_id, book_id, username, email in (
+            db.session.query(Reservation.id, Reservation.book_id, User.username, User.email)
+            .join(User, User.id == Reservation.user_id)
+            .filter(Reservation.book_id.in_(set(book_ids)), Reservation.status == 'active')
+            .order_by(Reservation.id)):
+        queues.setdefault(book_id, []).append((reservation_id, username, email))
+
+    notifications = []
+    for book_id in book_ids:
+        queue = queues.get(book_id)
+        while queue:
+            reservation_id, username, email = queue.pop(0)
+            if claim_row(Reservation, reservation_id, 'active', 'notified'):
+                notifications.append((username, email))
+                break
+        else:
+            # Every reservation read was fulfilled by a concurrent return; look for newer ones
+            if queue is not None:
+                claimed = claim_next_reservation(book_id)
+                if claimed:
+                    notifications.append(claimed[1:])
+    return notifications
+
+
+def close_loan(user_id, book_copy_id, returned):
+    """
+    Atomically closes a member's open loan of a copy and returns (transaction id, fine), or None if the
+    member has no open loan of that copy (e.g. a concurrent request returned it first).
+
+    The loan is closed with a conditional UPDATE (... AND date_returned IS NULL), so a copy returned by two
+    requests at once is returned, and fined, once. On databases with UPDATE ... RETURNING that one statement
+    also reads the due date for the fine; elsewhere the loan is read first and the UPDATE checks its row
+    count, like claim_row().
+    """
+    open_loan = and_(Transaction.user_id == user_id, Transaction.book_copy_id == book_copy_id,
+                     Transaction.date_returned == None)
+    close = (update(Transaction)
+             .values(date_returned=returned, transaction_type='returned')
+             .execution_options(synchronize_session=False))
+    if db.engine.dialect.update_returning:
+        loan = db.session.execute(close.where(open_loan).returning(Transaction.id, Transaction.due_date)).first()
+    else:
+        loan = db.session.query(Transaction.id, Transaction.due_date).filter(open_loan).first()
+        if loan and db.session.execute(close.where(Transaction.id == loan.id,
+                                                   Transaction.date_returned == None)).rowcount != 1:
+            loan = None
+    if loan is None:
+        return None
+    fine = calculate_fine(loan.due_date, returned)
+    if fine:
+        db.session.execute(update(Transaction).where(Transaction.id == loan.id).values(fine_amount=fine)
+                           .execution_options(synchronize_session=False))
+    return loan.id, fine
+
+
+def calculate_fine(due_date, returned):
+    """
+    Returns the fine of a loan returned at `returned`: FINE_PER_DAY per full day after the due date.
+    """
+    if returned <= due_date:
+        return 0.0
+    return (returned - due_date).days * FINE_PER_DAY
+
+
+def batch_item_error(result, message):
+    result.update(status='error', error=message)
+    return result
+
+
+def batch_result(index, item):
+    """
+    Returns the result skeleton of a batch item (its position and what identified it), or None if the item
+    is neither {'book_id': <int>} nor {'barcode': <str>}.
+    """
+    if not isinstance(item, dict):
+        return None
+    book_id, code = item.get('book_id'), item.get('barcode')
+    if isinstance(book_id, int) and not isinstance(book_id, bool) and code is None:
+        return {'index': index, 'book_id': book_id}
+    if isinstance(code, str) and code.strip() and book_id is None:
+        return {'index': index, 'barcode': code.strip()}
+    return None
+
+
+def checkout_batch(user_id, items, max_loans):
+    """
+    Checks out several books or copies to one member within the session's transaction (the caller commits).
+
+    The member's open loans are read once (for the loan limit and books already borrowed), all requested
+    copies are resolved with one query, and the chosen copies are claimed together with one conditional
+    UPDATE (see claim_copies()). A copy lost to a concurrent checkout is replaced by another available copy
+    of the same book when the item named a book. The loans are inserted with one multi-row INSERT ...
+    RETURNING where the database supports it, else with one INSERT per loan. Items are applied in order; the
+    ones that cannot be checked out get an error and do not affect the others.
+
+    Parameters:
+    user_id (int): The member.
+    items (list): {'book_id': <int>} (any available copy) or {'barcode': <str>} (that copy) dictionaries.
+    max_loans (int): Maximum number of open loans per member.
+
+    Returns:
+    list: One result per item, in order: {'index', 'book_id' or 'barcode', 'status': 'ok', 'transaction_id',
+          'book_copy_id', 'copy_barcode', 'due_date'} or {..., 'status': 'error', 'error'}.
+    """
+    held_books = [book_id for book_id, in db.session.query(BookCopy.book_id)
+                  .join(Transaction, Transaction.book_copy_id == BookCopy.id)
+                  .filter(Transaction.user_id == user_id, Transaction.date_returned == None)]
+    slots = max_loans - len(held_books)
+    held_books = set(held_books)
+
+    results = [batch_result(index, item) for index, item in enumerate(items)]
+    book_ids = {result['book_id'] for result in results if result and 'book_id' in result}
+    codes = {result['barcode'] for result in results if result and 'barcode' in result}
+    available_by_book, copies_by_code = {}, {}
+    for copy_id, book_id, code, status in (
+            db.session.query(BookCopy.id, BookCopy.book_id, BookCopy.unique_barcode, BookCopy.status)
+            .filter(or_(and_(BookCopy.book_id.in_(book_ids), BookCopy.status == 'available'),
+                        BookCopy.unique_barcode.in_(codes)))
+            .order_by(BookCopy.id)):
+        if book_id in book_ids and status == 'available':
+            available_by_book.setdefault(book_id, []).append((copy_id, code))
+        copies_by_code[code] = (copy_id, book_id, status)
+
+    # Choose a copy for every item that can be checked out
+    chosen, taken = [], set()
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = {'index': index, 'status': 'error', 'error': 'Item needs a book_id or a barcode'}
+            continue
+        if 'book_id' in result:
+            book_id = result['book_id']
+            candidates = [copy for copy in available_by_book.get(book_id, []) if copy[0] not in taken]
+            if book_id in held_books:
+                batch_item_error(result, 'You already have an active transaction for this book.')
+                continue
+            if not candidates:
+                batch_item_error(result, 'No available copies for this book.')
+                continue
+            copy_id, code = candidates[0]
+        else:
+            code = result['barcode']
+            if code not in copies_by_code:
+                batch_item_error(result, 'Unknown barcode')
+                continue
+            copy_id, book_id, status = copies_by_code[code]
+            if book_id in held_books:
+                batch_item_error(result, 'You already have an active transaction for this book.')
+                continue
+            if status != 'available' or copy_id in taken:
+                batch_item_error(result, 'This copy is not available.')
+                continue
+        if slots <= 0:
+            batch_item_error(result, f'User has reached the maximum number of active checkouts ({max_loans}).')
+            continue
+        slots -= 1
+        held_books.add(book_id)
+        taken.add(copy_id)
+        chosen.append((result, copy_id, code))
+
+    claimed = claim_copies([copy_id for _, copy_id, _ in chosen])
+    now = datetime.utcnow()
+    due_date = now + timedelta(days=LOAN_DAYS)
+    loans = []
+    for result, copy_id, code in chosen:
+        if copy_id not in claimed:
+            # Checked out by another request since it was read
+            copy_id = claim_available_copy(result['book_id']) if 'book_id' in result else None
+            if not copy_id:
+                batch_item_error(result, 'This copy is not available.' if 'barcode' in result
+                                 else 'No available copies for this book.')
+                continue
+            code = db.session.get(BookCopy, copy_id).unique_barcode
+        loans.append((result, copy_id, code))
+    rows = [{'user_id': user_id, 'book_copy_id': copy_id, 'transaction_type': 'checkout', 'date_issued': now,
+             'due_date': due_date} for _, copy_id, _ in loans]
+    if not rows:
+        return results
+    if db.engine.dialect.insert_executemany_returning:
+        # One multi-row INSERT for all loans; the returned ids are matched by copy (each copy is lent once)
+        transaction_ids = dict(db.session.execute(
+            insert(Transaction).returning(Transaction.book_copy_id, Transaction.id), rows
+        ).all())
+    else:
+        transactions = [Transaction(**row) for row in rows]
+        db.session.add_all(transactions)
+        db.session.flush()
+        transaction_ids = {transaction.book_copy_id: transaction.id for transaction in transactions}
+    for result, copy_id, code in loans:
+        result.update(status='ok', transaction_id=transaction_ids[copy_id], book_copy_id=copy_id,
+                      copy_barcode=code, due_date=due_date.strftime('%Y-%m-%d %H:%M:%S'))
+    return results
+
+
+def return_batch(user_id, items):
+    """
+    Returns several loans of one member within the session's transaction (the caller commits).
+
+    The member's open loans and their copies are read with one query and matched to the items; each
+    returned copy becomes available and fulfils the oldest active reservation of its book, if any (see
+    claim_next_reservation()).
+
+    Parameters:
+    user_id (int): The member.
+    items (list): {'book_id': <int>} or {'barcode': <str>} dictionaries naming borrowed books or copies.
+
+    Returns:
+    tuple: (results, notifications) where results has one entry per item, in order: {'index', 'book_id' or
+           'barcode', 'status': 'ok', 'transaction_id', 'book_copy_id', 'fine_amount'} or {..., 'status':
+           'error', 'error'}, and notifications lists the (username, email) of the reservations to notify
+           once the transaction is committed.
+    """
+    loans_by_book, loans_by_code = {}, {}
+    for transaction, copy in (db.session.query(Transaction, BookCopy)
+                              .join(BookCopy, BookCopy.id == Transaction.book_copy_id)
+                              .filter(Transaction.user_id == user_id, Transaction.date_returned == None)
+                              .order_by(Transaction.id)):
+        loans_by_book.setdefault(copy.book_id, []).append((transaction, copy))
+        loans_by_code[copy.unique_barcode] = (transaction, copy)
+
+    results, returned = [], []
+    now = datetime.utcnow()
+    for index, item in enumerate(items):
+        result = batch_result(index, item)
+        results.append(result)
+        if result is None:
+            results[index] = {'index': index, 'status': 'error', 'error': 'Item needs a book_id or a barcode'}
+            continue
+        if 'book_id' in result:
+            open_loans = [loan for loan in loans_by_book.get(result['book_id'], []) if loan[0].date_returned is None]
+            loan = open_loans[0] if open_loans else None
+        else:
+            loan = loans_by_code.get(result['barcode'])
+            if loan and loan[0].date_returned is not None:
+                loan = None
+        if loan is None:
+            batch_item_error(result, 'No active transaction found for this book and user')
+            continue
+        transaction, copy = loan
+        transaction.date_returned = now
+        transaction.transaction_type = 'returned'
+        fine = calculate_fine(transaction.due_date, now)
+        if fine:
+            transaction.fine_amount = fine
+        copy.status = 'available'
+        returned.append(copy.book_id)
+        result.update(status='ok', transaction_id=transaction.id, book_copy_id=copy.id, fine_amount=fine)
+    db.session.flush()
+
+    return results, claim_reservations(returned)
@@ -0,0 +1,226 @@
+import hashlib
+import os
+import threading
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models import Book, BookEmbedding
+from app.utils.vector_search import build_vector_index, top_k
+from app.utils.embedding_store import load_store, write_store
+
+# Number of books encoded per model.encode call when (re)building the index
+ENCODE_BATCH_SIZE = 256
+
+
+def book_text(book):
+    """
+    Returns the text that is embedded for a book (title, author and subject).
+    """
+    return f"{book.title} {book.author} {book.subject}"
+
+
+def content_hash(text):
+    """
+    Returns a stable hash of the embedded text, used to detect books whose embedding is stale.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def normalize(vectors):
+    """
+    L2-normalises a vector or a matrix of row vectors so cosine similarity becomes a dot product.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def upsert_book_embeddings(books, model):
+    """
+    Stores embeddings for the given books, encoding only those whose text changed since the last run.
+
+    Returns:
+    int: The number of books that were (re)encoded.
+    """
+    if not books:
+        return 0
+    texts = [book_text(book) for book in books]
+    hashes = [content_hash(text) for text in texts]
+    existing = {
+        row.book_id: row
+        for row in BookEmbedding.query.filter(BookEmbedding.book_id.in_([book.id for book in books]))
+    }
+    stale = [i for i, book in enumerate(books)
+             if book.id not in existing or existing[book.id].content_hash != hashes[i]]
+    if not stale:
+        return 0
+
+    vectors = normalize(model.encode([texts[i] for i in stale], convert_to_numpy=True))
+    now = datetime.utcnow()
+    for i, vector in zip(stale, vectors):
+        row = existing.get(books[i].id)
+        if row is None:
+            row = BookEmbedding(book_id=books[i].id)
+            db.session.add(row)
+        row.content_hash = hashes[i]
+        row.vector = vector.tobytes()
+        row.updated_at = now
+    db.session.commit()
+    return len(stale)
+
+
+def refresh_book_embedding(book, model=None):
+    """
+    Keeps the stored embedding of a book current after it was added or edited. If the model is not
+    loaded yet, a stale embedding is dropped instead so that the next sync() encodes the book.
+    """
+    if model is not None:
+        upsert_book_embeddings([book], model)
+        return
+    row = db.session.get(BookEmbedding, book.id)
+    if row is not None and row.content_hash != content_hash(book_text(book)):
+        db.session.delete(row)
+        db.session.commit()
+
+
+def delete_book_embedding(book_id):
+    """
+    Removes the stored embedding of a book. The caller is responsible for committing.
+    """
+    BookEmbedding.query.filter_by(book_id=book_id).delete()
+
+
+class EmbeddingIndex:
+    """
+    Matrix of all book embeddings plus the vector search structure built over it (see
+    app.utils.vector_search and RECOMMENDER_INDEX).
+
+    The matrix is a memory-mapped, optionally quantised copy of the book_embeddings table stored under
+    instance/embeddings/ (see app.utils.embedding_store and RECOMMENDER_STORE_DTYPE). It is reloaded only
+    when the table changes (row count or latest update time); the first worker to notice a change writes
+    the new store version and the others map it, so the OS page cache holds one copy for all workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signature = None
+        empty = np.empty((0, 0), dtype=np.float32)
+        self._snapshot = (np.empty(0, dtype=np.int64), empty, build_vector_index(empty))
+
+    def sync(self, model):
+        """
+        Encodes books that have no stored embedding yet (e.g. added by a script) and reloads the
+        matrix if the table changed since the last call. Without a model only the reload is done.
+        """
+        while model is not None:
+            missing = (Book.query
+                       .outerjoin(BookEmbedding, BookEmbedding.book_id == Book.id)
+                       .filter(BookEmbedding.book_id == None)
+                       .limit(ENCODE_BATCH_SIZE)
+                       .all())
+            if not missing:
+                break
+            upsert_book_embeddings(missing, model)
+        self._reload_if_changed()
+
+    def snapshot(self):
+        """
+        Returns the current (book_ids, matrix) pair. Row i of the matrix is the embedding of book_ids[i].
+        """
+        return self._snapshot[:2]
+
+    @property
+    def size(self):
+        return len(self._snapshot[0])
+
+    def search(self, queries, k, threshold=None):
+        """
+        Finds the books most similar to each query vector. With a quantised store the top
+        RECOMMENDER_RERANK_CANDIDATES candidates are re-scored with the exact float32 vectors.
+
+        Parameters:
+        queries (ndarray): (num_queries, dim) L2-normalised query vectors.
+        k (int): Maximum number of books per query.
+        threshold (float, optional): Minimum cosine similarity.
+
+        Returns:
+        list: For each query, a list of (book_id, similarity) tuples, best first.
+        """
+        book_ids, matrix, vector_index = self._snapshot
+        queries = np.atleast_2d(queries)
+        rerank = current_app.config.get('RECOMMENDER_RERANK_CANDIDATES', 0)
+        if not rerank or str(matrix.dtype) == 'float32':
+            return [
+                [(int(book_ids[row]), float(score)) for row, score in zip(rows, scores)]
+                for rows, scores in vector_index.search(queries, k, threshold)
+            ]
+
+        candidates = [[int(book_ids[row]) for row in rows] for rows, _ in vector_index.search(queries, max(k, rerank))]
+        wanted = {book_id for ids in candidates for book_id in ids}
+        exact = {
+            row.book_id: np.frombuffer(row.vector, dtype=np.float32)
+            for row in db.session.query(BookEmbedding.book_id, BookEmbedding.vector)
+                                 .filter(BookEmbedding.book_id.in_(wanted))
+        } if wanted else {}
+        results = []
+        for query, ids in zip(queries, candidates):
+            ids = [book_id for book_id in ids if book_id in exact]
+            if not ids:
+                results.append([])
+                continue
+            positions, scores = top_k(np.vstack([exact[book_id] for book_id in ids]) @ query, k, threshold)
+            results.append([(ids[p], float(score)) for p, score in zip(positions, scores)])
+        return results
+
+    def _reload_if_changed(self):
+        signature = db.session.query(func.count(BookEmbedding.book_id), func.max(BookEmbedding.updated_at)).one()
+        signature = tuple(signature)
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            config = current_app.config
+            book_ids, matrix = self._load_matrix(signature, config.get('RECOMMENDER_STORE_DTYPE', 'float32'))
+            vector_index = build_vector_index(
+                matrix,
+                kind=config.get('RECOMMENDER_INDEX', 'exact'),
+                nlist=config.get('RECOMMENDER_IVF_NLIST', 0),
+                nprobe=config.get('RECOMMENDER_IVF_NPROBE', 8),
+                min_size=config.get('RECOMMENDER_IVF_MIN_SIZE', 0),
+                previous=self._snapshot[2],
+            )
+            self._snapshot = (book_ids, matrix, vector_index)
+            self._signature = signature
+
+    def _load_matrix(self, signature, dtype):
+        """
+        Maps the on-disk store of this table version, writing it first if no worker has done so yet.
+        Falls back to an in-memory float32 matrix if the instance folder is not writable.
+        """
+        if signature[0] == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+        directory = os.path.join(current_app.instance_path, 'embeddings')
+        try:
+            stored = load_store(directory, signature, dtype)
+            if stored is None:
+                stored = write_store(directory, signature, dtype, *self._read_table())
+            if stored is not None:
+                return stored
+        except OSError as e:
+            print(f"Embedding store unavailable, keeping embeddings in memory: {e}")
+        return self._read_table()
+
+    @staticmethod
+    def _read_table():
+        rows = db.session.query(BookEmbedding.book_id, BookEmbedding.vector).order_by(BookEmbedding.book_id).all()
+        book_ids = np.array([row.book_id for row in rows], dtype=np.int64)
+        matrix = np.vstack([np.frombuffer(row.vector, dtype=np.float32) for row in rows])
+        return book_ids, matrix
+
+
+# Process-wide index shared by all requests
+embedding_index = EmbeddingIndex()
@@ -0,0 +1,131 @@
+import glob
+import hashlib
+import os
+import uuid
+import numpy as np
+
+# On-disk formats of the embedding store
+STORE_DTYPES = ('float32', 'float16', 'int8')
+STORE_PREFIX = 'book_embeddings'
+
+
+class QuantizedMatrix:
+    """
+    Read-only matrix of book embeddings backed by memory-mapped .npy files.
+
+    float32/float16 rows are stored as-is; int8 rows are stored with one float32 scale per row
+    (row ~= data[row] * scales[row]). Every worker process maps the same files, so the pages are shared
+    through the OS page cache instead of each worker holding its own copy.
+
+    Indexing (matrix[rows]) returns dequantised float32 rows; score_rows() scores queries directly against
+    the stored rows one block at a time.
+    """
+
+    def __init__(self, data, scales=None):
+        self.data = data
+        self.scales = scales
+        self.dtype = str(data.dtype)
+        self.shape = data.shape
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __getitem__(self, rows):
+        block = np.asarray(self.data[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][..., None]
+        return block
+
+    def score_rows(self, queries, rows):
+        """
+        Returns queries @ matrix[rows].T, applying the int8 scales after the product instead of
+        dequantising the rows first.
+        """
+        scores = queries @ np.asarray(self.data[rows], dtype=np.float32).T
+        if self.scales is not None:
+            scores *= self.scales[rows]
+        return scores
+
+
+def quantize(matrix, dtype):
+    """
+    Converts a float32 matrix to the storage dtype.
+
+    Returns:
+    tuple: (data, scales) where scales is None unless dtype is 'int8'.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unknown embedding store dtype: {dtype}")
+    if dtype != 'int8':
+        return matrix.astype(dtype), None
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    data = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return data, scales.astype(np.float32)
+
+
+def store_key(signature, dtype):
+    """
+    Returns the file-name key of a store version. A version is identified by the embedding table
+    signature and the dtype, so files are immutable once written.
+    """
+    return hashlib.sha1(repr((tuple(str(part) for part in signature), dtype)).encode('utf-8')).hexdigest()[:16]
+
+
+def _paths(directory, key):
+    base = os.path.join(directory, f"{STORE_PREFIX}-{key}")
+    return {'data': base + '.data.npy', 'ids': base + '.ids.npy', 'scales': base + '.scales.npy', 'done': base + '.done'}
+
+
+def load_store(directory, signature, dtype):
+    """
+    Memory-maps the store written for this signature and dtype.
+
+    Returns:
+    tuple: (book_ids, QuantizedMatrix), or None if no complete store exists for this version.
+    """
+    paths = _paths(directory, store_key(signature, dtype))
+    if not os.path.exists(paths['done']):
+        return None
+    book_ids = np.load(paths['ids'])
+    data = np.load(paths['data'], mmap_mode='r')
+    scales = np.load(paths['scales']) if dtype == 'int8' else None
+    return book_ids, QuantizedMatrix(data, scales)
+
+
+def write_store(directory, signature, dtype, book_ids, matrix):
+    """
+    Writes a new store version and removes older ones, then memory-maps the new version.
+
+    Each file is written to a temporary name and renamed into place; the '.done' marker is written last,
+    so readers in other processes never map a half-written store.
+
+    Returns:
+    tuple: (book_ids, QuantizedMatrix)
+    """
+    os.makedirs(directory, exist_ok=True)
+    key = store_key(signature, dtype)
+    paths = _paths(directory, key)
+    data, scales = quantize(matrix, dtype)
+    arrays = [('ids', book_ids), ('data', data)] + ([('scales', scales)] if scales is not None else [])
+    for name, array in arrays:
+        tmp = f"{paths[name]}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, paths[name])
+    with open(paths['done'], 'w') as f:
+        f.write(dtype)
+
+    # Drop older versions. Processes that still map them keep their pages (on POSIX); on Windows the
+    # removal fails while a file is mapped and is retried on the next write.
+    for path in glob.glob(os.path.join(directory, f"{STORE_PREFIX}-*")):
+        if not os.path.basename(path).startswith(f"{STORE_PREFIX}-{key}.") and not path.endswith('.tmp'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return load_store(directory, signature, dtype)
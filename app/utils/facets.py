@@ -0,0 +1,57 @@
+from datetime import date
+from sqlalchemy import Integer, cast, func, select
+from app import db
+from app.models import Book
+
+# Facets returned by GET /books?facets=true
+FACETS = ('subject', 'decade', 'rack_location')
+
+
+def decade_of(column):
+    """
+    SQL expression for the decade of a date column (2001-10-30 -> 2000). Dates are stored as
+    'YYYY-MM-DD' text in SQLite, so the year is the first four characters.
+    """
+    return cast(func.substr(column, 1, 4), Integer) // 10 * 10
+
+
+def decade_range(decade):
+    """
+    Returns the first and last day of a decade, for filtering with a plain range on publication_date.
+    """
+    return date(decade, 1, 1), date(decade + 9, 12, 31)
+
+
+def facet_counts(query, limit=None):
+    """
+    Counts the books of a filtered Book query per subject, publication decade and rack location. The counted
+    values are exact: GET /books filters on them with subject_facet, decade and rack_location.
+
+    Each facet is one small aggregate (GROUP BY the facet's value) over the same filtered subquery, so the
+    database returns one row per distinct value; the most frequent subjects and rack locations are picked
+    with ORDER BY count DESC ... LIMIT in SQL. The books themselves are never loaded.
+
+    Parameters:
+    query: The filtered Book query (ordering and pagination are ignored).
+    limit (int, optional): Maximum number of subjects and rack locations (the most frequent ones).
+
+    Returns:
+    dict: {'subject': [{'value', 'count'}, ...], 'decade': [...], 'rack_location': [...]}. Subjects and
+    rack locations are sorted by count (then value), decades chronologically.
+    """
+    filtered = (query.order_by(None)
+                .with_entities(Book.subject.label('subject'),
+                               decade_of(Book.publication_date).label('decade'),
+                               Book.rack_location.label('rack_location'))
+                .subquery())
+    facets = {}
+    for name in FACETS:
+        value = filtered.c[name]
+        count = func.count()
+        statement = select(value, count).group_by(value)
+        if name == 'decade':
+            statement = statement.order_by(value)
+        else:
+            statement = statement.order_by(count.desc(), value).limit(limit)
+        facets[name] = [{'value': row[0], 'count': row[1]} for row in db.session.execute(statement)]
+    return facets
@@ -0,0 +1,150 @@
+import re
+import unicodedata
+from sqlalchemy import func
+from app import db
+from app.models import Book, BookTrigram
+
+# Fields covered by the trigram index
+FUZZY_FIELDS = ('title', 'author')
+
+
+def normalize_words(text):
+    """
+    Returns the lower-cased words of a text with accents removed ("Misérables" -> ["miserables"]).
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r'\w+', text.lower())
+
+
+def word_trigrams(word):
+    """
+    Returns the trigrams of a word padded like PostgreSQL's pg_trgm ("  w" at the start, "d " at the end),
+    so the beginning and end of a word weigh more than its middle.
+    """
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def text_trigrams(text):
+    """
+    Returns the union of the trigrams of every word of a text.
+    """
+    trigrams = set()
+    for word in normalize_words(text):
+        trigrams |= word_trigrams(word)
+    return trigrams
+
+
+def similarity(query_words, text):
+    """
+    Scores how well a text matches the query words, between 0 and 1: for every query word the best trigram
+    similarity (Jaccard) with a word of the text, averaged over the query words. "tolkein" vs "J.R.R. Tolkien"
+    scores 0.33, an exact word match scores 1.
+    """
+    text_words = [word_trigrams(word) for word in normalize_words(text)]
+    if not query_words or not text_words:
+        return 0.0
+    total = 0.0
+    for query_word in query_words:
+        wanted = word_trigrams(query_word)
+        total += max(len(wanted & candidate) / len(wanted | candidate) for candidate in text_words)
+    return total / len(query_words)
+
+
+def index_book_trigrams(book, commit=True):
+    """
+    Replaces the trigram rows of a book after it was added or edited.
+    """
+    BookTrigram.query.filter_by(book_id=book.id).delete()
+    db.session.add_all(
+        BookTrigram(field=field, trigram=trigram, book_id=book.id)
+        for field in FUZZY_FIELDS
+        for trigram in text_trigrams(getattr(book, field))
+    )
+    if commit:
+        db.session.commit()
+
+
+def delete_book_trigrams(book_id):
+    """
+    Removes the trigram rows of a deleted book. The caller is responsible for committing.
+    """
+    BookTrigram.query.filter_by(book_id=book_id).delete()
+
+
+def rebuild_trigram_index(batch_size=500):
+    """
+    Re-indexes every book, in batches of `batch_size` books per transaction (backfill for existing databases
+    and for books added or edited outside the app, see build_search_index.py).
+
+    Returns:
+    int: The number of books indexed.
+    """
+    BookTrigram.query.delete()
+    db.session.commit()
+    indexed, last_id = 0, 0
+    while True:
+        books = Book.query.filter(Book.id > last_id).order_by(Book.id).limit(batch_size).all()
+        if not books:
+            return indexed
+        for book in books:
+            index_book_trigrams(book, commit=False)
+        db.session.commit()
+        indexed += len(books)
+        last_id = books[-1].id
+
+
+def candidate_book_ids(text, fields, limit):
+    """
+    Returns the ids of the books whose `fields` share the most trigrams with the text, best first.
+
+    Only the posting lists of the query's trigrams are read, never the whole catalog.
+    """
+    trigrams = text_trigrams(text)
+    if not trigrams:
+        return []
+    shared = func.count(func.distinct(BookTrigram.trigram))
+    rows = (db.session.query(BookTrigram.book_id)
+            .filter(BookTrigram.field.in_(fields), BookTrigram.trigram.in_(trigrams))
+            .group_by(BookTrigram.book_id)
+            .order_by(shared.desc(), BookTrigram.book_id)
+            .limit(limit)
+            .all())
+    return [book_id for (book_id,) in rows]
+
+
+def fuzzy_search(query, searches, threshold, candidates):
+    """
+    Typo-tolerant search over titles and authors.
+
+    Candidates are generated from the trigram index (the `candidates` books sharing the most trigrams
+    with each search text), then only those candidates are scored with similarity(). The search only reads:
+    the index is written when books are saved (index_book_trigrams) or rebuilt (rebuild_trigram_index). A book must score at
+    least `threshold` on every search text; its score is the mean over the texts.
+
+    Parameters:
+    query: Book query carrying the non-fuzzy filters (dates, subject).
+    searches (list): (text, fields) pairs, e.g. [('tolkein', ('author',))].
+    threshold (float): Minimum similarity per search text.
+    candidates (int): Candidates taken from the index per search text.
+
+    Returns:
+    list: (book, score) pairs, best first (ties by id).
+    """
+    ids = None
+    for text, fields in searches:
+        found = set(candidate_book_ids(text, fields, candidates))
+        ids = found if ids is None else ids & found
+    if not ids:
+        return []
+
+    results = []
+    for book in query.filter(Book.id.in_(ids)):
+        scores = []
+        for text, fields in searches:
+            scores.append(similarity(normalize_words(text), ' '.join(getattr(book, field) for field in fields)))
+        if min(scores) >= threshold:
+            results.append((book, sum(scores) / len(scores)))
+    results.sort(key=lambda result: (-result[1], result[0].id))
+    return results
@@ -0,0 +1,100 @@
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Model loaded once by each pool process (see _init_worker)
+_worker_model = None
+
+
+class InferencePoolBusy(Exception):
+    """
+    Raised when the pool already has its maximum number of pending jobs.
+    """
+
+
+class InferenceTimeout(Exception):
+    """
+    Raised when an encode job does not finish within the pool's timeout.
+    """
+
+
+def load_sentence_transformer(model_name):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def _init_worker(load_model):
+    global _worker_model
+    _worker_model = load_model()
+
+
+def _encode(texts, kwargs):
+    return _worker_model.encode(texts, **kwargs)
+
+
+class InferencePool:
+    """
+    Pool of worker processes that each load the embedding model once and run encode jobs, so the heavy,
+    GIL-holding model work never runs on a web worker's request threads.
+
+    encode() has the same signature as SentenceTransformer.encode, so the pool can be used wherever the
+    model is. A request submits its job and waits at most `timeout` seconds for the result. At most
+    `max_pending` jobs may be queued or running; beyond that encode() fails fast with InferencePoolBusy
+    (back-pressure) instead of letting the queue grow without bound. A job that takes longer than `timeout`
+    makes encode() raise InferenceTimeout.
+    """
+
+    def __init__(self, load_model, workers=1, max_pending=32, timeout=10):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # 'spawn' so the workers do not inherit the web server's threads, sockets or database connections
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(load_model,)
+        )
+        # Each worker loads the model when it starts; this first job finishes once one of them has, which
+        # tells callers the pool can serve requests (the other workers may still be loading)
+        self.warmup = self._executor.submit(_encode, ['warm up'], {})
+
+    @classmethod
+    def for_model(cls, model_name, **kwargs):
+        return cls(functools.partial(load_sentence_transformer, model_name), **kwargs)
+
+    def submit(self, texts, **kwargs):
+        """
+        Queues an encode job and returns its future.
+
+        Raises:
+        InferencePoolBusy: If max_pending jobs are already queued or running.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise InferencePoolBusy(f"Inference pool has {self.max_pending} pending jobs")
+        try:
+            future = self._executor.submit(_encode, texts, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def encode(self, texts, **kwargs):
+        """
+        Encodes texts in a pool process and waits for the result.
+
+        Raises:
+        InferencePoolBusy: If the pool is saturated.
+        InferenceTimeout: If the job does not finish within `timeout` seconds (it keeps its slot until it does).
+        """
+        future = self.submit(texts, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise InferenceTimeout(f"Encode job did not finish within {self.timeout} seconds") from None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,232 @@
+import io
+import multiprocessing
+import os
+import struct
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import barcode
+from barcode.writer import ImageWriter
+from PIL import Image, ImageDraw, ImageFont
+from app import db
+from app.models import Book, BookCopy
+
+# Sheet layout: A4 pages rendered at 200 dpi with 3 x 8 labels (the common 24-up 63.5 x 33.9 mm sheet)
+DPI = 200
+PAGE_SIZE = (1654, 2339)  # pixels
+PAGE_MARGINS = (57, 102)  # left/right and top/bottom, pixels
+COLUMNS, ROWS = 3, 8
+LABELS_PER_PAGE = COLUMNS * ROWS
+LABEL_PADDING = 12
+FONT_SIZE = 22
+# Barcode settings (python-barcode writer options; sizes in mm). The code is printed by render_label.
+BARCODE_OPTIONS = {'dpi': DPI, 'module_width': 0.25, 'module_height': 9, 'quiet_zone': 2, 'write_text': False}
+# The monospaced font shipped with python-barcode: every character has the same width, so titles are
+# truncated without measuring them
+FONT_PATH = os.path.join(os.path.dirname(barcode.__file__), 'fonts', 'DejaVuSansMono.ttf')
+
+# Output formats: one PDF, or a ZIP archive with one PNG per page
+SHEET_MIMETYPES = {'pdf': 'application/pdf', 'png': 'application/zip'}
+SHEET_EXTENSIONS = {'pdf': 'pdf', 'png': 'zip'}
+
+
+def select_labels(book_from=None, book_to=None, copy_ids=None, since=None):
+    """
+    Returns the (unique_barcode, book title) of the copies to label, in book and copy order.
+
+    Parameters (combined with AND):
+    book_from, book_to (int, optional): Range of book ids, inclusive.
+    copy_ids (list, optional): Copy ids.
+    since (datetime, optional): Only copies created at or after this time.
+    """
+    query = db.session.query(BookCopy.unique_barcode, Book.title).join(Book, Book.id == BookCopy.book_id)
+    if book_from is not None:
+        query = query.filter(BookCopy.book_id >= book_from)
+    if book_to is not None:
+        query = query.filter(BookCopy.book_id <= book_to)
+    if copy_ids is not None:
+        query = query.filter(BookCopy.id.in_(copy_ids))
+    if since is not None:
+        query = query.filter(BookCopy.created_at >= since)
+    return [(code, title) for code, title in query.order_by(BookCopy.book_id, BookCopy.id)]
+
+
+@lru_cache(maxsize=None)
+def label_font():
+    """
+    Returns the label font and the width of one character, loaded once per process.
+    """
+    font = ImageFont.truetype(FONT_PATH, FONT_SIZE)
+    return font, font.getlength('M')
+
+
+def render_label(code_value, title, size):
+    """
+    Returns one label (the book title, the copy's Code128 barcode and its code) as a grayscale image of
+    `size` pixels.
+    """
+    width, height = size
+    font, char_width = label_font()
+    max_chars = int((width - 2 * LABEL_PADDING) // char_width)
+    if len(title) > max_chars:
+        title = title[:max_chars - 3] + '...'
+    label = Image.new('L', size, 255)
+    draw = ImageDraw.Draw(label)
+    draw.text((LABEL_PADDING, LABEL_PADDING), title, fill=0, font=font)
+
+    image = barcode.get_barcode_class('code128')(code_value, writer=ImageWriter(mode='L')).render(BARCODE_OPTIONS)
+    top = 2 * LABEL_PADDING + FONT_SIZE
+    # Long codes are scaled down to the label width
+    image.thumbnail((width - 2 * LABEL_PADDING, height - top - 2 * LABEL_PADDING - FONT_SIZE), Image.LANCZOS)
+    label.paste(image, ((width - image.width) // 2, top))
+    code_left = (width - len(code_value) * char_width) // 2
+    draw.text((max(code_left, LABEL_PADDING), top + image.height + LABEL_PADDING // 2), code_value, fill=0, font=font)
+    return label
+
+
+def render_page(labels):
+    """
+    Renders up to LABELS_PER_PAGE (code, title) labels onto one page and returns it as a grayscale PNG.
+    Runs in the worker processes of write_label_sheets().
+    """
+    page = Image.new('L', PAGE_SIZE, 255)
+    cell = ((PAGE_SIZE[0] - 2 * PAGE_MARGINS[0]) // COLUMNS, (PAGE_SIZE[1] - 2 * PAGE_MARGINS[1]) // ROWS)
+    for position, (code_value, title) in enumerate(labels):
+        row, column = divmod(position, COLUMNS)
+        page.paste(render_label(code_value, title, cell),
+                   (PAGE_MARGINS[0] + column * cell[0], PAGE_MARGINS[1] + row * cell[1]))
+    output = io.BytesIO()
+    page.save(output, 'PNG')
+    return output.getvalue()
+
+
+def png_image_data(png):
+    """
+    Returns (width, height, compressed image data) of an 8-bit grayscale, non-interlaced PNG.
+
+    Raises:
+    ValueError: If the PNG is of another kind.
+    """
+    if png[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError("Not a PNG image")
+    position, data, header = 8, [], None
+    while position < len(png):
+        length, kind = struct.unpack('>I4s', png[position:position + 8])
+        chunk = png[position + 8:position + 8 + length]
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'IDAT':
+            data.append(chunk)
+        position += 12 + length
+    if header is None or header[2:5] != (8, 0, 0) or header[6] != 0:
+        raise ValueError("Only 8-bit grayscale non-interlaced PNGs are supported")
+    return header[0], header[1], b''.join(data)
+
+
+class PdfPageWriter:
+    """
+    Minimal PDF writer with one full-page image per page.
+
+    PNG image data is a zlib stream with per-row filters, which PDF reads as is (FlateDecode with PNG
+    predictors), so the rendered pages are copied into the PDF without being decoded. Each page is written
+    as soon as it is added and only the object offsets are kept, so memory does not grow with the number of
+    pages. (Pillow's PDF writer keeps every decoded page, and its append mode re-reads the whole file.)
+    """
+
+    # Objects 1 and 2 are the catalog and the page tree, written last when all pages are known
+    _FIRST_PAGE_OBJECT = 3
+
+    def __init__(self, fp, dpi=DPI):
+        self._fp = fp
+        self._dpi = dpi
+        self._position = 0
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = self._FIRST_PAGE_OBJECT
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self._fp.write(data)
+        self._position += len(data)
+
+    def _object(self, number, dictionary, stream=None):
+        self._offsets[number] = self._position
+        data = f"{number} 0 obj\n{dictionary}".encode('ascii')
+        if stream is not None:
+            data += b'\nstream\n' + stream + b'\nendstream'
+        self._write(data + b'\nendobj\n')
+
+    def add_png_page(self, png):
+        """
+        Adds a page showing an 8-bit grayscale PNG at the writer's resolution.
+        """
+        width, height, image_data = png_image_data(png)
+        page_width, page_height = width * 72 / self._dpi, height * 72 / self._dpi
+        image_id, content_id, page_id = self._next_id, self._next_id + 1, self._next_id + 2
+        self._next_id += 3
+        self._object(image_id,
+                     f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray "
+                     f"/BitsPerComponent 8 /Filter /FlateDecode "
+                     f"/DecodeParms << /Predictor 15 /Colors 1 /BitsPerComponent 8 /Columns {width} >> "
+                     f"/Length {len(image_data)} >>", image_data)
+        content = f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Page Do Q".encode('ascii')
+        self._object(content_id, f"<< /Length {len(content)} >>", content)
+        self._object(page_id,
+                     f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+                     f"/Resources << /XObject << /Page {image_id} 0 R >> >> /Contents {content_id} 0 R >>")
+        self._page_ids.append(page_id)
+
+    def close(self):
+        """
+        Writes the page tree, cross-reference table and trailer. The file object is left open.
+        """
+        self._object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>")
+        xref_position = self._position
+        size = self._next_id
+        entries = ''.join(f"{self._offsets[number]:010d} 00000 n \n" for number in range(1, size))
+        self._write(f"xref\n0 {size}\n0000000000 65535 f \n{entries}".encode('ascii'))
+        self._write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n".encode('ascii'))
+
+
+def write_label_sheets(labels, fp, fmt='pdf', workers=0):
+    """
+    Renders label sheets for (code, title) pairs and writes them to a binary file object.
+
+    Pages are rendered in parallel by `workers` processes (0 renders in this process) and written in order
+    as they complete, so only a few pages are in memory at a time.
+
+    Parameters:
+    labels (list): (unique_barcode, title) pairs, e.g. from select_labels().
+    fp: Binary file object to write to.
+    fmt (str): 'pdf' for one PDF document, 'png' for a ZIP archive of PNG pages.
+    workers (int): Size of the process pool.
+
+    Returns:
+    int: The number of pages.
+    """
+    pages = [labels[start:start + LABELS_PER_PAGE] for start in range(0, len(labels), LABELS_PER_PAGE)]
+    executor = None
+    if workers > 0 and len(pages) > 1:
+        # 'spawn' so the workers do not inherit the web server's threads, sockets or database connections
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(pages)),
+                                       mp_context=multiprocessing.get_context('spawn'))
+        rendered = executor.map(render_page, pages)
+    else:
+        rendered = map(render_page, pages)
+    try:
+        if fmt == 'pdf':
+            writer = PdfPageWriter(fp)
+            for png in rendered:
+                writer.add_png_page(png)
+            writer.close()
+        else:
+            # PNG data is already compressed
+            with zipfile.ZipFile(fp, 'w', zipfile.ZIP_STORED) as archive:
+                for number, png in enumerate(rendered, 1):
+                    archive.writestr(f"labels_{number:04d}.png", png)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    return len(pages)
@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from app.utils.inference_pool import InferencePool
+
+# State of the (single) sentence-transformers model shared by the whole process
+_lock = threading.Lock()
+_ready = threading.Event()
+_loader = None
+_model = None
+_load_error = None
+
+# Inference pool settings (see configure_inference_pool) and the pool itself once started
+_pool_settings = None
+_pool = None
+
+
+def _load(model_name):
+    global _model, _load_error
+    try:
+        # Imported here so that torch is only loaded by processes that actually recommend books
+        from sentence_transformers import SentenceTransformer
+        _model = SentenceTransformer(model_name)
+    except Exception as e:
+        _load_error = e
+        print(f"Failed to load recommendation model '{model_name}': {e}")
+    finally:
+        _ready.set()
+
+
+def configure_inference_pool(workers, max_pending=32, timeout=10):
+    """
+    Makes the model run in a pool of `workers` separate processes instead of this process (0 disables
+    the pool). The pool itself is started on first use or by start_model_warmup().
+    """
+    global _pool_settings
+    _pool_settings = {'workers': workers, 'max_pending': max_pending, 'timeout': timeout} if workers > 0 else None
+
+
+def start_model_warmup(model_name):
+    """
+    Starts loading the model in a background thread, or starts the inference pool if one is configured.
+    Does nothing if the model is already loaded or loading; a previous failed load is retried.
+
+    Returns:
+    threading.Thread or concurrent.futures.Future: The loader thread, or the pool's warm-up job.
+    """
+    global _loader, _load_error, _pool
+    with _lock:
+        if _pool_settings:
+            if _pool is None or (_pool.warmup.done() and _pool.warmup.exception()):
+                if _pool is not None:
+                    _pool.shutdown()
+                _pool = InferencePool.for_model(model_name, **_pool_settings)
+            return _pool.warmup
+        if _loader is None or (_ready.is_set() and _model is None):
+            _load_error = None
+            _ready.clear()
+            _loader = threading.Thread(target=_load, args=(model_name,), name='model-warmup', daemon=True)
+            _loader.start()
+        return _loader
+
+
+def get_model(model_name, timeout=None):
+    """
+    Returns the loaded model (or the inference pool, which has the same encode() method), starting the
+    load if needed and waiting at most `timeout` seconds for it.
+
+    Returns:
+    The model or InferencePool, or None if it is still loading after `timeout` seconds.
+
+    Raises:
+    RuntimeError: If loading the model failed.
+    """
+    started = start_model_warmup(model_name)
+    if _pool_settings:
+        try:
+            started.result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+        except Exception as e:
+            raise RuntimeError(f"Recommendation model could not be loaded in the inference pool: {e}")
+        return _pool
+    if not _ready.wait(timeout):
+        return None
+    if _model is None:
+        raise RuntimeError(f"Recommendation model could not be loaded: {_load_error}")
+    return _model
+
+
+def get_loaded_model():
+    """
+    Returns the model (or the inference pool) if it has finished loading, otherwise None.
+    Never triggers a load.
+    """
+    if _pool_settings:
+        if _pool is not None and _pool.warmup.done() and not _pool.warmup.exception():
+            return _pool
+        return None
+    return _model
@@ -0,0 +1,111 @@
+import base64
+import binascii
+import json
+from sqlalchemy import and_, or_
+
+
+def parse_limit(value, default, maximum):
+    """
+    Parses a `limit` query parameter. Values above `maximum` are clamped to it.
+
+    Raises:
+    ValueError: If the value is not a positive integer.
+    """
+    if value is None or value == '':
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, maximum)
+
+
+def encode_cursor(values):
+    """
+    Encodes the sort key of the last row of a page as an opaque URL-safe cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor produced by encode_cursor.
+
+    Raises:
+    ValueError: If the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list) or len(values) != 2 \
+            or not all(isinstance(value, (str, int, float)) for value in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_page_list(rows, key, limit, cursor=None):
+    """
+    keyset_page for rows that were ranked in Python (e.g. by a similarity score): `rows` are sorted by
+    key(row), which returns a [sort value, id] pair, and the page starts after the cursor's pair.
+
+    Returns:
+    tuple: (rows, next_cursor) where next_cursor is None on the last page.
+
+    Raises:
+    ValueError: If the cursor is malformed.
+    """
+    if cursor:
+        last = decode_cursor(cursor)
+        try:
+            rows = [row for row in rows if key(row) > last]
+        except TypeError:
+            raise ValueError("Cursor does not belong to this result ordering")
+    next_cursor = encode_cursor(key(rows[limit - 1])) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def keyset_filter(query, sort_key, id_column, cursor=None):
+    """
+    Restricts a query to the rows after the cursor in (sort_key, id_column) order.
+
+    Raises:
+    ValueError: If the cursor is malformed.
+    """
+    if not cursor:
+        return query
+    last_key, last_id = decode_cursor(cursor)
+    return query.filter(or_(sort_key > last_key, and_(sort_key == last_key, id_column > last_id)))
+
+
+def keyset_page(query, sort_key, id_column, limit, cursor=None):
+    """
+    Returns one page of a query ordered by (sort_key, id_column), starting after the row the cursor points to.
+
+    Unlike OFFSET, the cursor turns into a WHERE condition on the sort key, so every page costs the same no
+    matter how deep it is, and rows added or deleted meanwhile do not shift later pages. id_column breaks
+    ties so the order is total and stable.
+
+    Parameters:
+    query: The filtered query (its entities are returned).
+    sort_key: Column or SQL expression to sort by, ascending.
+    id_column: Unique column used as the tie-breaker.
+    limit (int): Page size.
+    cursor (str, optional): next_cursor of the previous page.
+
+    Returns:
+    tuple: (rows, next_cursor) where next_cursor is None on the last page.
+
+    Raises:
+    ValueError: If the cursor is malformed.
+    """
+    query = keyset_filter(query, sort_key, id_column, cursor)
+    rows = (query
+            .add_columns(sort_key.label('sort_key'), id_column.label('sort_id'))
+            .order_by(sort_key, id_column)
+            .limit(limit + 1)
+            .all())
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].sort_key, rows[-1].sort_id])
+    return [row[0] for row in rows], next_cursor
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    """
+    Returns the cache key of a prompt: lower-cased with runs of whitespace collapsed.
+    """
+    return ' '.join(prompt.lower().split())
+
+
+class PromptCache:
+    """
+    Bounded LRU cache of spell-corrected prompts and their embeddings, keyed on the normalised prompt.
+
+    Entries expire `ttl` seconds after they were stored; when the cache is full the least recently used
+    entry is evicted. Hit and miss counters are kept for monitoring (see stats()).
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._clock = clock
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize, ttl):
+        """
+        Changes the size and TTL limits, evicting entries if the cache shrank.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._evict()
+
+    def get(self, prompt):
+        """
+        Returns the cached (corrected_prompt, embedding) pair of a prompt, or None on a miss.
+        """
+        key = normalize_prompt(prompt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, prompt, corrected_prompt, embedding):
+        if self.maxsize <= 0:
+            return
+        key = normalize_prompt(prompt)
+        with self._lock:
+            self._entries[key] = (self._clock(), corrected_prompt, embedding)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache size, limits and hit/miss counters as a dictionary.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def _evict(self):
+        while len(self._entries) > max(self.maxsize, 0):
+            self._entries.popitem(last=False)
+
+
+# Process-wide cache used by the recommendation endpoints
+prompt_cache = PromptCache()
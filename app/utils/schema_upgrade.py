@@ -0,0 +1,85 @@
+from sqlalchemy import inspect, text
+from app import db
+from app.models import BookTrigram
+from app.utils.book_search import rebuild_search_index, search_index_exists
+from app.utils.fuzzy_search import rebuild_trigram_index
+
+
+def index_names(inspector, table_name):
+    """
+    Returns the names of the indexes of a table in the current database.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        # SQLAlchemy does not reflect SQLite expression indexes (e.g. on lower(username)), so read the catalog
+        with db.engine.connect() as connection:
+            rows = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                                      {'table': table_name})
+            return {row[0] for row in rows}
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def missing_indexes():
+    """
+    Returns the indexes declared on the models that the current database does not have yet
+    (db.create_all() only creates the indexes of tables it creates).
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = index_names(inspector, table.name)
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def missing_columns():
+    """
+    Returns the columns declared on the models that the tables of the current database do not have yet.
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(column for column in table.columns if column.name not in existing)
+    return missing
+
+
+def upgrade_schema():
+    """
+    Brings an existing database up to the current models without touching its data: creates missing
+    tables, adds missing columns (as nullable columns, NULL in existing rows), creates missing indexes, then
+    refreshes the query planner statistics so the new indexes are used. The search indexes derived from the
+    catalog are filled for the existing books when they are created: the full-text index (books_fts) and
+    the trigram index (book_trigrams). Book embeddings need the recommendation model, so the first
+    /recommend request encodes the books that have none. On an up-to-date database it only reads the catalog.
+
+    Returns:
+    list: The created tables, the added columns ('table.column') and the names of the created indexes.
+    """
+    existing_tables = set(inspect(db.engine).get_table_names())
+    db.create_all()
+    created = [table.name for table in db.metadata.sorted_tables if table.name not in existing_tables]
+    with db.engine.begin() as connection:
+        for column in missing_columns():
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            connection.execute(text(f'ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column_type}'))
+            created.append(f'{column.table.name}.{column.name}')
+    with db.engine.begin() as connection:
+        for index in missing_indexes():
+            index.create(connection)
+            created.append(index.name)
+    # Fill the new search indexes for the books already in the catalog
+    if db.engine.dialect.name == 'sqlite' and not search_index_exists():
+        rebuild_search_index()
+        created.append('books_fts')
+    if BookTrigram.__tablename__ in created:
+        rebuild_trigram_index()
+    if created and db.engine.dialect.name == 'sqlite':
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+    return created
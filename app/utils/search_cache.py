@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Query parameters of GET /books that select the result (anything else is ignored by the endpoint)
+SEARCH_PARAMS = ('q', 'title', 'author', 'subject', 'from_date', 'to_date', 'subject_facet', 'decade',
+                 'rack_location', 'mode', 'sort', 'limit', 'cursor', 'facets')
+# Free-text parameters: matching is case-insensitive, so their case and spacing do not change the result
+TEXT_PARAMS = ('q', 'title', 'author', 'subject')
+
+
+def normalize_search_params(args):
+    """
+    Returns the cache key of a GET /books request: its search parameters with text lower-cased and
+    whitespace collapsed, in a fixed order.
+    """
+    key = []
+    for name in SEARCH_PARAMS:
+        value = args.get(name)
+        if not value:
+            continue
+        if name in TEXT_PARAMS:
+            value = ' '.join(value.lower().split())
+        key.append((name, value.strip()))
+    return tuple(key)
+
+
+class CatalogVersion:
+    """
+    Counter that changes whenever the catalog (books or the status of their copies) changes.
+
+    Cached search results are keyed on the version, so bumping it invalidates all of them at once. Each
+    process counts its own changes; with a shared file (see configure()) every bump also replaces that file,
+    and other worker processes notice the new file (its inode and mtime) on their next lookup with a single
+    stat() call instead of a database query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = 0
+        self._path = None
+
+    def configure(self, path=None):
+        """
+        Shares the version with other processes through the file at `path` (None keeps it per process).
+        """
+        self._path = path
+
+    def bump(self):
+        """
+        Marks the catalog as changed. Call after the change is committed.
+        """
+        with self._lock:
+            self._local += 1
+            if self._path:
+                try:
+                    os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                    tmp = f"{self._path}.{uuid.uuid4().hex}.tmp"
+                    with open(tmp, 'w') as f:
+                        f.write(str(self._local))
+                    os.replace(tmp, self._path)
+                except OSError as e:
+                    print(f"Could not update the shared catalog version: {e}")
+
+    def current(self):
+        """
+        Returns an opaque value that differs from every earlier one once the catalog has changed.
+        """
+        if not self._path:
+            return self._local
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return self._local, None
+        return self._local, stat.st_ino, stat.st_mtime_ns
+
+
+class SearchCache:
+    """
+    Bounded LRU cache of GET /books responses keyed on (catalog version, normalised search parameters).
+
+    Entries of older catalog versions are never returned again and age out of the LRU. The TTL only
+    matters for changes that do not bump the version (writes that bypass the app and its scripts, e.g.
+    the sqlite3 shell), whose results can be stale for up to `ttl` seconds.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._clock = clock
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize, ttl):
+        """
+        Changes the size and TTL limits and empties the cache.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, key):
+        """
+        Returns the cached response of a key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, response):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache size, limits and hit/miss counters as a dictionary.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+# Process-wide catalog version and search result cache used by GET /books
+catalog_version = CatalogVersion()
+search_cache = SearchCache()
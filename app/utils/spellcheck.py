@@ -1,16 +1,263 @@
+import re
+import threading
+import time
+from flask import current_app, has_app_context
 from spellchecker import SpellChecker
 
+# Corrections are at most this many edits (insert, delete, substitute, transpose) away from the typed word
+MAX_EDIT_DISTANCE = 2
+# Only the first PREFIX_LENGTH characters of a word are indexed (SymSpell prefix optimisation)
+PREFIX_LENGTH = 7
+# Dictionary words at or below this frequency are recognised as correct but never suggested as corrections.
+# This drops the long tail of the pyspellchecker dictionary (~110k of its 160k words) from the delete index.
+MIN_SUGGESTION_FREQUENCY = 50
+# Frequency given to words from the catalog so they win against ordinary words at the same edit distance
+CATALOG_WORD_FREQUENCY = 10 ** 9
+
+WORD_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+def tokenize(text):
+    """
+    Returns the lower-cased words of a text (apostrophes inside words are kept).
+    """
+    return WORD_PATTERN.findall(text.lower())
+
+
+def _deletes(word, max_distance):
+    """
+    Returns every string obtained by deleting up to max_distance characters from word (word included).
+    """
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Optimal string alignment (restricted Damerau-Levenshtein) distance between a and b.
+    Returns max_distance + 1 as soon as the distance is known to exceed max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SymSpellCorrector:
+    """
+    Spelling corrector using symmetric-delete lookup (SymSpell).
+
+    Every suggestable word is indexed under all strings obtained by deleting up to MAX_EDIT_DISTANCE
+    characters from its prefix. A lookup generates the deletes of the typed word and only verifies the
+    words sharing one of them, instead of generating and checking every edit of the typed word.
+    """
+
+    def __init__(self, frequencies, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH,
+                 min_suggestion_frequency=MIN_SUGGESTION_FREQUENCY):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_suggestion_frequency = min_suggestion_frequency
+        self._base = frequencies
+        self._extra = {}
+        self._index = {}
+        for word, frequency in frequencies.items():
+            if frequency > min_suggestion_frequency:
+                self._add_to_index(word)
+
+    def frequency(self, word):
+        """
+        Returns the frequency of a known word, or None for unknown words.
+        """
+        return self._extra.get(word) or self._base.get(word)
+
+    def add_word(self, word, frequency):
+        if word not in self._extra and (word not in self._base or self._base[word] <= self.min_suggestion_frequency):
+            self._add_to_index(word)
+        self._extra[word] = frequency
+
+    def remove_word(self, word):
+        # Delete index entries are left in place; lookup() skips words that can no longer be suggested
+        self._extra.pop(word, None)
+
+    def lookup(self, word):
+        """
+        Returns the best correction of a lower-cased word (smallest edit distance, then highest frequency),
+        the word itself if it is known, or None if nothing is within MAX_EDIT_DISTANCE.
+        """
+        if self.frequency(word):
+            return word
+        best, best_key = None, None
+        seen = set()
+        prefix = word[:self.prefix_length]
+        for delete in sorted(_deletes(prefix, self.max_distance), key=len, reverse=True):
+            # Deletes are visited by increasing number of removed characters; stop once they cannot beat the best
+            if best_key and len(prefix) - len(delete) > best_key[0]:
+                break
+            candidates = self._index.get(delete)
+            if candidates is None:
+                continue
+            for candidate in (candidates if isinstance(candidates, list) else (candidates,)):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                frequency = self._suggestion_frequency(candidate)
+                if not frequency:
+                    continue
+                distance = edit_distance(word, candidate, self.max_distance)
+                if distance > self.max_distance:
+                    continue
+                key = (distance, -frequency)
+                if best_key is None or key < best_key:
+                    best, best_key = candidate, key
+        return best
+
+    def _suggestion_frequency(self, word):
+        frequency = self._extra.get(word)
+        if frequency:
+            return frequency
+        frequency = self._base.get(word)
+        return frequency if frequency and frequency > self.min_suggestion_frequency else None
+
+    def _add_to_index(self, word):
+        for delete in _deletes(word[:self.prefix_length], self.max_distance):
+            entry = self._index.get(delete)
+            if entry is None:
+                self._index[delete] = word
+            elif isinstance(entry, list):
+                entry.append(word)
+            else:
+                self._index[delete] = [entry, word]
+
+
+# Process-wide corrector and the catalog vocabulary merged into it
+_lock = threading.RLock()
+_corrector = None
+_book_words = {}
+_catalog_counts = {}
+_catalog_loaded_at = None
+
+
+def get_corrector():
+    """
+    Returns the process-wide corrector, building it on first use (a few seconds, once per process).
+    """
+    global _corrector
+    if _corrector is None:
+        with _lock:
+            if _corrector is None:
+                _corrector = SymSpellCorrector(SpellChecker().word_frequency.dictionary)
+    return _corrector
+
+
+def set_book_words(book_id, text):
+    """
+    Merges the words of a book (title, author, subject) into the vocabulary, replacing the words it
+    contributed before. Does nothing until the catalog vocabulary has been loaded by a first correction.
+
+    Returns:
+    bool: True if the vocabulary changed.
+    """
+    if _catalog_loaded_at is None:
+        return False
+    with _lock:
+        return _replace_book_words(book_id, set(tokenize(text)))
+
+
+def remove_book_words(book_id):
+    """
+    Removes the words contributed by a deleted book.
+
+    Returns:
+    bool: True if the vocabulary changed.
+    """
+    if _catalog_loaded_at is None:
+        return False
+    with _lock:
+        return _replace_book_words(book_id, set())
+
+
+def _replace_book_words(book_id, words):
+    old = _book_words.get(book_id, set())
+    if words == old:
+        return False
+    if words:
+        _book_words[book_id] = words
+    else:
+        _book_words.pop(book_id, None)
+    corrector = get_corrector()
+    for word in words - old:
+        _catalog_counts[word] = _catalog_counts.get(word, 0) + 1
+        if _catalog_counts[word] == 1:
+            corrector.add_word(word, CATALOG_WORD_FREQUENCY)
+    for word in old - words:
+        _catalog_counts[word] -= 1
+        if _catalog_counts[word] == 0:
+            del _catalog_counts[word]
+            corrector.remove_word(word)
+    return True
+
+
+def load_catalog_vocabulary():
+    """
+    (Re)reads the title, author and subject of every book into the vocabulary. Called on first use and
+    then every SPELLCHECK_CATALOG_REFRESH seconds, so edits made by other worker processes are picked up.
+    """
+    global _catalog_loaded_at
+    # Imported here so that the corrector itself does not depend on the app package
+    from app import db
+    from app.models import Book
+    rows = db.session.query(Book.id, Book.title, Book.author, Book.subject).all()
+    with _lock:
+        current = set()
+        for row in rows:
+            current.add(row.id)
+            _replace_book_words(row.id, set(tokenize(f"{row.title} {row.author} {row.subject}")))
+        for book_id in set(_book_words) - current:
+            _replace_book_words(book_id, set())
+        _catalog_loaded_at = time.monotonic()
+
+
 def correct_text(text):
-    spell = SpellChecker()
-    # Tokenize text into words (this is a simple split; you might use a more advanced tokenizer)
-    words = text.split()
-    # Find misspelled words
-    misspelled = spell.unknown(words)
+    """
+    Corrects misspelled words in a text. Words that are in the dictionary or in the library catalog
+    (titles, authors, subjects) are left untouched; corrected words are returned in lower case.
+    """
+    corrector = get_corrector()
+    if has_app_context():
+        refresh = current_app.config.get('SPELLCHECK_CATALOG_REFRESH', 300)
+        if _catalog_loaded_at is None or time.monotonic() - _catalog_loaded_at > refresh:
+            load_catalog_vocabulary()
+
     corrected_words = []
-    for word in words:
-        if word in misspelled:
-            corrected = spell.correction(word)
-            corrected_words.append(corrected)
+    for token in text.split():
+        match = WORD_PATTERN.search(token.lower())
+        # Tokens without letters (numbers, ISBNs, punctuation) and digit-letter mixes are kept as typed
+        if not match or any(ch.isdigit() for ch in token):
+            corrected_words.append(token)
+            continue
+        word = match.group(0)
+        if corrector.frequency(word):
+            corrected_words.append(token)
+            continue
+        correction = corrector.lookup(word)
+        if correction is None:
+            corrected_words.append(token)
         else:
-            corrected_words.append(word)
+            # Keep surrounding punctuation, e.g. "fantsy," -> "fantasy,"
+            corrected_words.append(token[:match.start()] + correction + token[match.end():])
     return ' '.join(corrected_words)
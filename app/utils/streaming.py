@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+from flask import Response, stream_with_context
+
+# Streaming output formats and their media types
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def streaming_format(request):
+    """
+    Returns the streaming format a request asks for: 'ndjson', 'csv', or None for a regular JSON response.
+    The format query parameter ('json', 'ndjson' or 'csv') takes precedence over the Accept header.
+
+    Raises:
+    ValueError: If the format parameter is not one of the above.
+    """
+    requested = request.args.get('format')
+    if requested:
+        if requested == 'json':
+            return None
+        if requested not in STREAM_MIMETYPES:
+            raise ValueError("format must be 'json', 'ndjson' or 'csv'")
+        return requested
+    best = request.accept_mimetypes.best_match(['application/json', *STREAM_MIMETYPES.values()])
+    return next((name for name, mimetype in STREAM_MIMETYPES.items() if mimetype == best), None)
+
+
+def encode_records(rows, serialize, fmt, columns, chunk_size):
+    """
+    Serialises rows one at a time and yields the output in chunks of `chunk_size` records, so only one
+    chunk is held in memory however many rows there are. CSV output starts with the header line, which
+    is sent straight away.
+    """
+    buffer = io.StringIO()
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    pending = 0
+    for row in rows:
+        record = serialize(row)
+        if writer:
+            writer.writerow(record)
+        else:
+            buffer.write(json.dumps(record) + '\n')
+        pending += 1
+        if pending == chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def streaming_response(rows, serialize, fmt, columns, filename, chunk_size):
+    """
+    Streams rows as NDJSON (one JSON object per line) or CSV.
+
+    Parameters:
+    rows: An ORM query, read in batches of `chunk_size` from a server-side cursor, or any iterable.
+    serialize: Turns a row into a dict with the keys in `columns`.
+    fmt (str): 'ndjson' or 'csv'.
+    columns (list): CSV column order.
+    filename (str): Download name of CSV output, without extension.
+    chunk_size (int): Rows fetched per batch and records per written chunk.
+    """
+    if hasattr(rows, 'yield_per'):
+        rows = rows.yield_per(chunk_size)
+    # The request context (and so the database session) stays open until the last chunk is sent
+    response = Response(stream_with_context(encode_records(rows, serialize, fmt, columns, chunk_size)),
+                        mimetype=STREAM_MIMETYPES[fmt])
+    if fmt == 'csv':
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
+    return response
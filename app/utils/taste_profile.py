@@ -0,0 +1,109 @@
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy import or_
+from app import db
+from app.models import Transaction, BookCopy, BookEmbedding, UserTasteProfile
+from app.utils.embedding_index import normalize
+
+
+def decay(age, half_life_days):
+    """
+    Returns the weight of a loan issued `age` (a timedelta) before the profile's reference time.
+    """
+    return 0.5 ** (age.total_seconds() / 86400.0 / half_life_days)
+
+
+def update_taste_profile(user_id, commit=True):
+    """
+    Folds the member's transactions that are not part of their taste profile yet into it, creating the
+    profile from the full history the first time. Called with every checkout and return, so usually
+    only one new loan is read.
+
+    The profile is sum(weight_i * embedding_i) over the borrowed books, where a loan's weight halves every
+    RECOMMENDER_PROFILE_HALF_LIFE_DAYS. Weights are stored relative to the newest loan (reference_time):
+    a newer loan first decays the sum by the time elapsed since then, so nothing is ever recomputed.
+    A loan whose book has no stored embedding yet is skipped and kept in pending_transaction_ids; later
+    loans are still folded, and the pending one is folded by a later call once the book has been encoded.
+
+    Parameters:
+    user_id (int): The member.
+    commit (bool): Commit the change; False leaves it in the session's transaction for the caller.
+
+    Returns:
+    UserTasteProfile: The updated profile, or None if the member has no loans with an embedding yet.
+    """
+    half_life = current_app.config['RECOMMENDER_PROFILE_HALF_LIFE_DAYS']
+    profile = db.session.get(UserTasteProfile, user_id)
+    if profile is not None:
+        total = np.frombuffer(profile.vector, dtype=np.float32).copy()
+        reference, last_id = profile.reference_time, profile.last_transaction_id
+        pending = set(profile.pending_transaction_ids or ())
+    else:
+        total, reference, last_id, pending = None, None, 0, set()
+
+    # Loans of deleted books have no copy any more and are skipped by the inner join
+    loans = (db.session.query(Transaction.id, Transaction.date_issued, BookEmbedding.vector)
+             .join(BookCopy, BookCopy.id == Transaction.book_copy_id)
+             .outerjoin(BookEmbedding, BookEmbedding.book_id == BookCopy.book_id)
+             .filter(Transaction.user_id == user_id,
+                     or_(Transaction.id > last_id, Transaction.id.in_(pending)))
+             .order_by(Transaction.id)
+             .all())
+    # Pending loans of books deleted since are not returned and drop out
+    still_pending = set()
+    folded = 0
+    for loan in loans:
+        last_id = max(last_id, loan.id)
+        if loan.vector is None:
+            still_pending.add(loan.id)
+            continue
+        vector = np.frombuffer(loan.vector, dtype=np.float32)
+        issued = loan.date_issued or datetime.utcnow()
+        if total is None:
+            total, reference = np.zeros_like(vector), issued
+        if issued >= reference:
+            total *= decay(issued - reference, half_life)
+            total += vector
+            reference = issued
+        else:
+            # Out-of-order loan (e.g. imported history)
+            total += decay(reference - issued, half_life) * vector
+        folded += 1
+
+    if profile is None and not folded:
+        # Nothing to store: the next call reads the full history again
+        return None
+    if not folded and still_pending == pending and last_id == profile.last_transaction_id:
+        return profile
+    if profile is None:
+        profile = UserTasteProfile(user_id=user_id)
+        db.session.add(profile)
+    if folded:
+        profile.vector = total.astype(np.float32).tobytes()
+        profile.reference_time = reference
+    profile.last_transaction_id = last_id
+    profile.pending_transaction_ids = sorted(still_pending) or None
+    profile.updated_at = datetime.utcnow()
+    if commit:
+        db.session.commit()
+    return profile
+
+
+def taste_vector(profile):
+    """
+    Returns the L2-normalised taste vector of a profile. Time passing since the newest loan scales every
+    weight by the same factor, so it does not change the direction and needs no update.
+    """
+    return normalize(np.frombuffer(profile.vector, dtype=np.float32))
+
+
+def borrowed_book_ids(user_id):
+    """
+    Returns the ids of every book the member has ever borrowed (excluded from their recommendations).
+    """
+    rows = (db.session.query(BookCopy.book_id)
+            .join(Transaction, Transaction.book_copy_id == BookCopy.id)
+            .filter(Transaction.user_id == user_id)
+            .distinct())
+    return {book_id for (book_id,) in rows}
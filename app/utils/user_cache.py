@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import g
+from app import db
+from app.models import User
+
+# What require_active_membership needs to know about a user
+UserStatus = namedtuple('UserStatus', ['role', 'is_active'])
+
+
+class UserStatusCache:
+    """
+    Bounded LRU cache of UserStatus keyed on user_id, shared by the requests of a process.
+
+    Entries expire `ttl` seconds after they were stored. Endpoints that change a user's role or membership
+    status call invalidate() after committing, so changes made through this process apply at once; the TTL
+    only bounds how long other worker processes keep the old status.
+    """
+
+    def __init__(self, maxsize=4096, ttl=30, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._clock = clock
+        # Bumped by every invalidation, so a status read before it is not stored after it
+        self._generation = 0
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    def configure(self, maxsize, ttl):
+        """
+        Changes the size and TTL limits (0 entries disables the cache) and empties the cache.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._entries.clear()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, user_id):
+        """
+        Returns the cached UserStatus of a user, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if self._clock() - entry[0] > self.ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, status, generation):
+        """
+        Stores a status read from the database when the generation was `generation`. It is dropped if the
+        user may have been invalidated since.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[user_id] = (self._clock(), status)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+# Process-wide cache used by require_active_membership (configured by create_app)
+user_status_cache = UserStatusCache()
+
+
+def get_user_status(user_id):
+    """
+    Returns the UserStatus of a user, or None if there is no such user.
+
+    The status is looked up once per request (kept in flask.g), then in user_status_cache, and only read from
+    the database (role and is_active, not the whole row) on a miss.
+    """
+    statuses = g.setdefault('user_statuses', {})
+    if user_id in statuses:
+        return statuses[user_id]
+    status = user_status_cache.get(user_id)
+    if status is None:
+        generation = user_status_cache.generation
+        row = db.session.query(User.role, User.is_active).filter(User.id == user_id).first()
+        if row is not None:
+            status = UserStatus(row.role, bool(row.is_active))
+            user_status_cache.put(user_id, status, generation)
+    statuses[user_id] = status
+    return status
+
+
+def invalidate_user_status(user_id):
+    """
+    Forgets the cached status of a user. Call after committing a change to the user's role or is_active.
+    """
+    user_status_cache.invalidate(user_id)
+    g.get('user_statuses', {}).pop(user_id, None)
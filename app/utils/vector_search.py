@@ -0,0 +1,163 @@
+import numpy as np
+
+# Rows scored per matrix product when a full pass over the catalog is needed (bounds temporary memory)
+SCORE_CHUNK_ROWS = 16384
+
+
+def top_k(scores, k, threshold=None):
+    """
+    Returns the positions and values of the k highest scores (best first) of a 1-D score array,
+    dropping scores below `threshold`.
+    """
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    order = candidates[np.argsort(-scores[candidates], kind='stable')]
+    best = scores[order]
+    if threshold is not None:
+        keep = best >= threshold
+        order, best = order[keep], best[keep]
+    return order, best
+
+
+def score_rows(matrix, queries, rows):
+    """
+    Returns queries @ matrix[rows].T. Matrices that know how to score their own storage format
+    (e.g. the quantised QuantizedMatrix of app.utils.embedding_store) do so without a float32 copy.
+    """
+    if hasattr(matrix, 'score_rows'):
+        return matrix.score_rows(queries, rows)
+    return queries @ matrix[rows].T
+
+
+def score_all(matrix, queries):
+    """
+    Returns the (num_queries, num_rows) dot products between the queries and every row of the matrix.
+    """
+    scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+    for start in range(0, len(matrix), SCORE_CHUNK_ROWS):
+        stop = min(start + SCORE_CHUNK_ROWS, len(matrix))
+        scores[:, start:stop] = score_rows(matrix, queries, slice(start, stop))
+    return scores
+
+
+class ExactIndex:
+    """
+    Brute-force search: scores every row with one matrix product and selects the top k with argpartition.
+    Exact results, cost linear in the catalog size.
+    """
+    kind = 'exact'
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def search(self, queries, k, threshold=None):
+        """
+        Parameters:
+        queries (ndarray): (num_queries, dim) L2-normalised query vectors.
+        k (int): Maximum number of results per query.
+        threshold (float, optional): Minimum similarity for a result.
+
+        Returns:
+        list: One (rows, scores) pair of arrays per query, best first.
+        """
+        if len(self.matrix) == 0:
+            return [top_k(np.empty(0, dtype=np.float32), k) for _ in queries]
+        scores = score_all(self.matrix, queries)
+        return [top_k(row_scores, k, threshold) for row_scores in scores]
+
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are clustered with spherical k-means and a query only scores the rows of
+    the `nprobe` clusters whose centroids are closest to it. Cost grows with nprobe * N / nlist
+    instead of N; raising nprobe trades speed for recall (nprobe == nlist is an exact search).
+    """
+    kind = 'ivf'
+
+    def __init__(self, matrix, nlist=0, nprobe=8, iterations=10, centroids=None, seed=0):
+        self.matrix = matrix
+        self.nprobe = nprobe
+        n = len(matrix)
+        if centroids is None or centroids.shape[1] != matrix.shape[1]:
+            nlist = nlist or max(1, int(np.sqrt(n)))
+            centroids = self._train(matrix, min(nlist, n), iterations, np.random.default_rng(seed))
+        self.centroids = centroids
+        # Catalog size the centroids were trained on (build_vector_index keeps it when centroids are reused)
+        self.trained_size = n
+        assignment = self._assign(matrix, centroids)
+        # Rows grouped by cluster: rows of cluster c are order[offsets[c]:offsets[c + 1]]
+        self.order = np.argsort(assignment, kind='stable')
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))))
+
+    @staticmethod
+    def _assign(matrix, centroids):
+        assignment = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), SCORE_CHUNK_ROWS):
+            block = matrix[start:start + SCORE_CHUNK_ROWS]
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignment
+
+    @classmethod
+    def _train(cls, matrix, nlist, iterations, rng):
+        # Train on a sample; assigning the full catalog happens once afterwards
+        sample_size = min(len(matrix), max(nlist * 64, 10000))
+        sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = cls._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+            empty = counts == 0
+            # Re-seed empty clusters with random sample rows
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        return centroids
+
+    def search(self, queries, k, threshold=None):
+        """
+        Same contract as ExactIndex.search, but only rows in the nprobe nearest clusters are scored.
+        """
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        results = []
+        for query, clusters in zip(queries, probes):
+            rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in clusters])
+            positions, scores = top_k(score_rows(self.matrix, query[None, :], rows)[0], k, threshold)
+            results.append((rows[positions], scores))
+        return results
+
+
+def build_vector_index(matrix, kind='exact', nlist=0, nprobe=8, min_size=0, previous=None):
+    """
+    Builds the search structure for a matrix of L2-normalised row vectors.
+
+    Parameters:
+    kind (str): 'exact' for brute force or 'ivf' for the approximate inverted-file index.
+    nlist (int): IVF clusters (0 picks about sqrt(N)).
+    nprobe (int): IVF clusters scanned per query.
+    min_size (int): Catalogs smaller than this always use exact search.
+    previous: The index this one replaces. IVF centroids are reused while the catalog has not
+              doubled in size, so small catalog edits only cost a re-assignment, not a re-training.
+
+    Raises:
+    ValueError: If `kind` is unknown.
+    """
+    if kind not in ('exact', 'ivf'):
+        raise ValueError(f"Unknown vector index kind: {kind}")
+    if kind == 'exact' or len(matrix) < max(min_size, 1):
+        return ExactIndex(matrix)
+    centroids = None
+    trained_size = len(matrix)
+    if isinstance(previous, IVFIndex) and len(matrix) <= 2 * previous.trained_size \
+            and (not nlist or nlist == len(previous.centroids)):
+        centroids, trained_size = previous.centroids, previous.trained_size
+    index = IVFIndex(matrix, nlist=nlist, nprobe=nprobe, centroids=centroids)
+    index.trained_size = trained_size
+    return index
@@ -0,0 +1,17 @@
+from app import create_app, db
+from app.utils.book_search import rebuild_search_index
+from app.utils.fuzzy_search import rebuild_trigram_index
+from app.utils.search_cache import catalog_version
+
+# Builds (or rebuilds) the full-text and trigram indexes used by GET /books for an existing database.
+# Databases created with db.create_all() already have the full-text index and keep it in sync automatically.
+app = create_app()
+app.app_context().push()
+
+db.create_all()
+count = rebuild_search_index()
+print(f"Search index built for {count} books.")
+count = rebuild_trigram_index()
+print(f"Trigram index built for {count} books.")
+# Running servers drop their cached GET /books results
+catalog_version.bump()
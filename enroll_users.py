@@ -0,0 +1,32 @@
+import argparse
+import json
+from app import create_app
+from app.utils.bulk_enroll import enroll_users, read_enrollment_csv
+
+# Enrolls users in bulk from a CSV file (header: username,email,password[,role]) or a JSON list, e.g.:
+#   python enroll_users.py district_students.csv
+#   python enroll_users.py staff.json --workers 8
+# Passwords are hashed by a pool of worker processes; the guard below keeps them from re-running the script.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Enroll users from a CSV or JSON file.")
+    parser.add_argument('path', help="CSV file, or JSON file with a list of users (*.json)")
+    parser.add_argument('--workers', type=int, default=None, help="hashing processes (default ENROLL_HASH_WORKERS)")
+    parser.add_argument('--batch-size', type=int, default=None, help="users per transaction (default ENROLL_BATCH_SIZE)")
+    args = parser.parse_args()
+
+    with open(args.path, encoding='utf-8-sig') as f:
+        if args.path.lower().endswith('.json'):
+            records = json.load(f)
+            records = records.get('users') if isinstance(records, dict) else records
+        else:
+            records = read_enrollment_csv(f.read())
+
+    app = create_app()
+    app.app_context().push()
+
+    workers = args.workers if args.workers is not None else app.config['ENROLL_HASH_WORKERS']
+    batch_size = args.batch_size or app.config['ENROLL_BATCH_SIZE']
+    report = enroll_users(records, workers=workers, batch_size=batch_size)
+    for error in report['errors']:
+        print(f"Row {error['row']} ({error['username'] or '-'}): {error['error']}")
+    print(f"{report['created']} users enrolled, {report['failed']} rejected.")
@@ -0,0 +1,35 @@
+import argparse
+from datetime import datetime
+from app import create_app
+from app.utils.label_sheets import select_labels, write_label_sheets
+
+# Renders barcode label sheets (24 labels per A4 page) for a selection of book copies, e.g.:
+#   python print_labels.py --since 2024-05-01 -o shipment.pdf
+#   python print_labels.py --book-from 120 --book-to 180 --format png -o labels.zip
+# Pages are rendered by a pool of worker processes; the guard below keeps them from re-running the script.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render barcode label sheets for book copies.")
+    parser.add_argument('--book-from', type=int, help="first book id of the range")
+    parser.add_argument('--book-to', type=int, help="last book id of the range")
+    parser.add_argument('--copies', type=lambda value: [int(copy_id) for copy_id in value.split(',')],
+                        help="comma-separated copy ids")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="copies created at or after (ISO date/time)")
+    parser.add_argument('--format', choices=['pdf', 'png'], default='pdf', help="PDF, or a ZIP of PNG pages")
+    parser.add_argument('-o', '--output', default=None, help="output file (default labels.pdf / labels.zip)")
+    parser.add_argument('--workers', type=int, default=None, help="rendering processes (default LABEL_SHEET_WORKERS)")
+    args = parser.parse_args()
+    if all(value is None for value in (args.book_from, args.book_to, args.copies, args.since)):
+        parser.error("specify --book-from/--book-to, --copies or --since")
+
+    app = create_app()
+    app.app_context().push()
+
+    labels = select_labels(args.book_from, args.book_to, args.copies, args.since)
+    if not labels:
+        print("No book copies match the selection.")
+    else:
+        output = args.output or ('labels.pdf' if args.format == 'pdf' else 'labels.zip')
+        workers = args.workers if args.workers is not None else app.config['LABEL_SHEET_WORKERS']
+        with open(output, 'wb') as f:
+            pages = write_label_sheets(labels, f, args.format, workers=workers)
+        print(f"{len(labels)} labels on {pages} pages written to {output}.")
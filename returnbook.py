@@ -2,6 +2,7 @@ from app import create_app, db
 from app.models import Transaction, BookCopy,Reservation  # Import the Transaction and BookCopy models
 from datetime import datetime
 from app.notifications import send_email_notification
+from app.utils.search_cache import catalog_version
 
 app = create_app()
 app.app_context().push()
@@ -33,6 +34,8 @@ else:
 
     # Commit the changes to the database.
     db.session.commit()
+    # Running servers drop their cached GET /books results
+    catalog_version.bump()
     
     # Check if there is an active reservation for this book
     book_id = book_copy.book_id
@@ -1,3 +1,10 @@
+import os
+
+# The web server is the one process that should load the recommendation model up front
+os.environ.setdefault('RECOMMENDER_WARMUP', 'true')
+# ... and that brings an existing database up to the current schema (see upgrade_db.py)
+os.environ.setdefault('SCHEMA_AUTO_UPGRADE', 'true')
+
 from app import create_app
 
 app = create_app()
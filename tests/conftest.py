@@ -0,0 +1,29 @@
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from app import db
+
+
+@contextmanager
+def _count_queries():
+    """
+    Counts the SQL statements executed inside the block; the count is in the yielded list.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture
+def count_queries():
+    """
+    Context manager collecting the SQL statements run inside it: `with count_queries() as statements: ...`
+    """
+    return _count_queries
@@ -1,6 +1,22 @@
 import base64
+import json
+from datetime import date
 import pytest
-from app.utils.barcode_utils import generate_barcode_base64
+from app import create_app, db
+from app.models import Book, BookCopy, User
+from app.utils.barcode_utils import BarcodeCache, generate_barcode_base64, render_barcode
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
 
 def test_generate_barcode_base64():
     code_value = "MEMBER-1"  # Example code for a member
@@ -19,3 +35,86 @@ def test_generate_barcode_base64():
     # PNG files start with an 8-byte signature: 89 50 4E 47 0D 0A 1A 0A
     png_signature = b'\x89PNG\r\n\x1a\n'
     assert decoded_data.startswith(png_signature), "Decoded barcode image does not have a valid PNG signature."
+
+
+def test_barcode_cache_renders_each_code_once(tmp_path):
+    rendered = []
+
+    def render(code_value, fmt):
+        rendered.append(code_value)
+        return render_barcode(code_value, fmt)
+
+    cache = BarcodeCache(maxsize=2, directory=str(tmp_path), render=render)
+    png = cache.get("MEMBER-1")
+    assert png.startswith(b'\x89PNG')
+    assert cache.get("MEMBER-1") == png
+    assert rendered == ["MEMBER-1"]
+
+    # Evicted from memory (LRU of 2) but still on disk
+    cache.get("MEMBER-2")
+    cache.get("MEMBER-3")
+    assert cache.get("MEMBER-1") == png
+    assert rendered == ["MEMBER-1", "MEMBER-2", "MEMBER-3"]
+
+    # A new process (empty memory) reads the store instead of rendering
+    other = BarcodeCache(directory=str(tmp_path), render=render)
+    assert other.get("MEMBER-2") == render_barcode("MEMBER-2")
+    assert len(rendered) == 3
+
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['disk_hits'], stats['misses']) == (1, 1, 3)
+    assert stats['size'] == 2 and stats['disk_bytes'] > 0
+    assert stats['hit_rate'] == 0.4
+
+
+def test_barcode_cache_disk_limit(tmp_path):
+    cache = BarcodeCache(maxsize=0, directory=str(tmp_path), max_disk_bytes=1000, render=lambda code, fmt: b'x' * 400)
+    for number in range(5):
+        cache.get(f"MEMBER-{number}")
+    assert cache.stats()['disk_bytes'] <= 1000
+    stored = [path for path in tmp_path.rglob('*.png')]
+    assert 0 < len(stored) <= 2
+
+
+def test_barcode_endpoint_http_caching(client):
+    response = client.get("/barcodes/MEMBER-1.png")
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert response.data == base64.b64decode(generate_barcode_base64("MEMBER-1"))
+    assert "immutable" in response.headers["Cache-Control"] and "max-age=31536000" in response.headers["Cache-Control"]
+    etag = response.headers["ETag"]
+    assert not etag.startswith("W/")
+
+    revalidated = client.get("/barcodes/MEMBER-1.png", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.data == b""
+    assert revalidated.headers["ETag"] == etag
+
+    svg = client.get("/barcodes/MEMBER-1.svg")
+    assert svg.mimetype == "image/svg+xml" and b"<svg" in svg.data
+    assert svg.headers["ETag"] != etag
+
+    assert client.get("/barcodes/caf%C3%A9.png").status_code == 404
+    assert client.get("/barcodes/" + "X" * 51 + ".png").status_code == 404
+    assert client.get("/barcodes/MEMBER-1.gif").status_code == 404
+
+
+def test_json_endpoints_link_barcodes(client):
+    member = User(username="reader", email="reader@example.com", password="x", role="member")
+    book = Book(title="Dune", author="Frank Herbert", subject="science fiction",
+                publication_date=date(1965, 8, 1), rack_location="R1")
+    db.session.add_all([member, book])
+    db.session.flush()
+    db.session.add(BookCopy(book_id=book.id, unique_barcode=f"{book.id}-1"))
+    db.session.commit()
+
+    members = json.loads(client.get("/members").data)["members"]
+    assert members[0]["barcode_url"] == f"/barcodes/MEMBER-{member.id}.png"
+    assert "barcode_image" not in members[0]
+    members = json.loads(client.get("/members?barcode_images=true").data)["members"]
+    assert members[0]["barcode_image"] == generate_barcode_base64(f"MEMBER-{member.id}")
+
+    copy = json.loads(client.get(f"/books/{book.id}").data)["book"]["copies"][0]
+    assert copy["barcode_url"] == f"/barcodes/{book.id}-1.png" and "barcode_image" not in copy
+    assert client.get(copy["barcode_url"]).status_code == 200
+    copy = json.loads(client.get(f"/books/{book.id}?barcode_images=true").data)["book"]["copies"][0]
+    assert copy["barcode_image"] == generate_barcode_base64(f"{book.id}-1")
@@ -0,0 +1,161 @@
+import json
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+import pytest
+from app import create_app, db
+from app.models import Book, BookCopy, Reservation, Transaction, User
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    app.config['MAX_ACTIVE_LOANS'] = 50
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def setup_desk(client, books=3, copies=2):
+    """
+    Adds a logged-in librarian, a member and `books` books with `copies` copies each; returns the member id
+    and the book ids.
+    """
+    librarian = User(username="desk", email="desk@example.com", password="x", role="librarian")
+    member = User(username="reader", email="reader@example.com", password="x", role="member")
+    db.session.add_all([librarian, member])
+    book_ids = []
+    for number in range(books):
+        book = Book(title=f"Stack Book {number}", author="Author", subject="fiction",
+                    publication_date=date(2000, 1, 1), rack_location="R1")
+        db.session.add(book)
+        db.session.flush()
+        db.session.add_all(BookCopy(book_id=book.id, unique_barcode=f"{book.id}-{copy + 1}") for copy in range(copies))
+        book_ids.append(book.id)
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['user_id'] = librarian.id
+    return member.id, book_ids
+
+
+def batch(client, user_id, action, items):
+    response = client.post('/circulation/batch', data=json.dumps({'user_id': user_id, 'action': action, 'items': items}),
+                           content_type='application/json')
+    return response.status_code, json.loads(response.data)
+
+
+def test_batch_checkout_with_per_item_results(client):
+    member_id, (first, second, third) = setup_desk(client)
+    status, data = batch(client, member_id, 'checkout', [
+        {'book_id': first},
+        {'barcode': f"{second}-2"},
+        {'book_id': first},            # already borrowed in this batch
+        {'barcode': 'NO-SUCH-COPY'},
+        {'book_id': 999},
+        {'title': 'not an item'},
+        {'barcode': f"{third}-1"},
+    ])
+    assert status == 200
+    assert (data['succeeded'], data['failed']) == (3, 4)
+    results = data['results']
+    assert [result['status'] for result in results] == ['ok', 'ok', 'error', 'error', 'error', 'error', 'ok']
+    assert results[0]['copy_barcode'] == f"{first}-1"
+    assert results[1]['book_copy_id'] == BookCopy.query.filter_by(unique_barcode=f"{second}-2").one().id
+    assert results[2]['error'] == 'You already have an active transaction for this book.'
+    assert results[3]['error'] == 'Unknown barcode'
+    assert results[4]['error'] == 'No available copies for this book.'
+    assert results[5]['error'] == 'Item needs a book_id or a barcode'
+
+    db.session.expire_all()
+    assert Transaction.query.filter_by(user_id=member_id, date_returned=None).count() == 3
+    assert BookCopy.query.filter_by(status='checked-out').count() == 3
+
+
+def test_batch_checkout_checks_the_loan_limit_once(client):
+    client.application.config['MAX_ACTIVE_LOANS'] = 3
+    member_id, book_ids = setup_desk(client, books=5)
+    client.post('/circulation/batch', json={'user_id': member_id, 'action': 'checkout', 'items': [{'book_id': book_ids[0]}]})
+    status, data = batch(client, member_id, 'checkout', [{'book_id': book_id} for book_id in book_ids[1:]])
+    assert [result['status'] for result in data['results']] == ['ok', 'ok', 'error', 'error']
+    assert data['results'][2]['error'] == 'User has reached the maximum number of active checkouts (3).'
+
+
+def test_batch_query_count_does_not_grow_with_items(client, count_queries):
+    member_id, book_ids = setup_desk(client, books=20, copies=1)
+
+    def statements_for(action, items):
+        db.session.remove()
+        with count_queries() as statements:
+            status, data = batch(client, member_id, action, items)
+        assert status == 200 and data['failed'] == 0
+        return len(statements)
+
+    # Warm up the membership status cache of the librarian and the member
+    statements_for('checkout', [{'book_id': book_ids[0]}])
+    few = statements_for('checkout', [{'book_id': book_id} for book_id in book_ids[1:3]])
+    many = statements_for('checkout', [{'book_id': book_id} for book_id in book_ids[3:]])
+    assert few == many
+    few = statements_for('return', [{'book_id': book_id} for book_id in book_ids[:3]])
+    many = statements_for('return', [{'barcode': f"{book_id}-1"} for book_id in book_ids[3:]])
+    assert few == many
+
+
+def test_batch_checkout_without_returning_support(client):
+    member_id, (first, second, third) = setup_desk(client)
+    # Databases without UPDATE/INSERT ... RETURNING claim copies and insert loans one by one
+    with patch.object(db.engine.dialect, 'update_returning', False), \
+         patch.object(db.engine.dialect, 'insert_executemany_returning', False), \
+         patch.object(db.engine.dialect, 'insert_executemany_returning_sort_by_parameter_order', False):
+        status, data = batch(client, member_id, 'checkout', [{'book_id': first}, {'barcode': f"{second}-2"},
+                                                             {'book_id': first}])
+    assert [result['status'] for result in data['results']] == ['ok', 'ok', 'error']
+    loans = {loan.id: loan.book_copy_id for loan in Transaction.query}
+    assert {loans[result['transaction_id']] for result in data['results'][:2]} == \
+        {result['book_copy_id'] for result in data['results'][:2]}
+    assert BookCopy.query.filter_by(status='checked-out').count() == 2
+
+
+def test_batch_return_with_fines_and_reservations(client):
+    member_id, (first, second, third) = setup_desk(client)
+    batch(client, member_id, 'checkout', [{'book_id': first}, {'book_id': second}])
+    loan = Transaction.query.join(BookCopy).filter(BookCopy.book_id == second).one()
+    loan.due_date = datetime.utcnow() - timedelta(days=3, hours=1)
+    other = User(username="waiting", email="waiting@example.com", password="x", role="member")
+    db.session.add(other)
+    db.session.flush()
+    db.session.add(Reservation(user_id=other.id, book_id=first))
+    db.session.commit()
+
+    with patch('app.routes.send_email_notification') as mock_notify:
+        status, data = batch(client, member_id, 'return', [
+            {'barcode': f"{first}-1"}, {'book_id': second}, {'book_id': third}, {'book_id': second}])
+    assert status == 200
+    assert [result['status'] for result in data['results']] == ['ok', 'ok', 'error', 'error']
+    assert data['results'][1]['fine_amount'] == 3.0
+    assert data['results'][0]['fine_amount'] == 0.0
+    mock_notify.assert_called_once()
+    assert mock_notify.call_args.args[1] == "waiting@example.com"
+
+    db.session.expire_all()
+    assert Transaction.query.filter_by(date_returned=None).count() == 0
+    assert BookCopy.query.filter_by(status='available').count() == 6
+    assert Reservation.query.one().status == 'notified'
+
+
+def test_batch_request_validation(client):
+    member_id, book_ids = setup_desk(client)
+    items = [{'book_id': book_ids[0]}]
+    assert batch(client, member_id, 'renew', items)[0] == 400
+    assert batch(client, member_id, 'checkout', [])[0] == 400
+    # JSON true is not a member id, although bool is an int subclass in Python
+    assert batch(client, True, 'checkout', items)[0] == 400
+    assert batch(client, str(member_id), 'checkout', items)[0] == 400
+    assert batch(client, 999, 'checkout', items)[0] == 404
+    client.application.config['CIRCULATION_BATCH_MAX_ITEMS'] = 1
+    assert batch(client, member_id, 'checkout', items * 2)[0] == 400
+
+    client.delete(f"/members/{member_id}")
+    assert batch(client, member_id, 'checkout', items)[0] == 403
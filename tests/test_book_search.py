@@ -0,0 +1,277 @@
+import json
+import pytest
+from sqlalchemy import text
+from app import create_app, db
+from app.utils.book_search import match_expression, rebuild_search_index, search_index_exists
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        # Start from an empty catalog so that result lists are exact
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def add_book(client, title, author, subject):
+    book_data = {
+        "title": title,
+        "author": author,
+        "subject": subject,
+        "publication_date": "2000-01-01",
+        "rack_location": "R1",
+        "num_copies": 1
+    }
+    return client.post("/books", data=json.dumps(book_data), content_type="application/json")
+
+
+def search(client, query_string):
+    response = client.get("/books?" + query_string)
+    assert response.status_code == 200
+    return [book["title"] for book in json.loads(response.data)["books"]]
+
+
+def test_match_expression_quotes_user_input():
+    assert match_expression("lord of the ri") == '("lord"* "of"* "the"* "ri"*)'
+    assert match_expression(title='Dune', author='"Herbert" OR') == 'title : ("Dune"*) AND author : ("Herbert"* "OR"*)'
+    assert match_expression(q='*" ( )') is None
+
+
+def test_prefix_search_and_ranking(client):
+    add_book(client, "Dragon Tales", "Anne Smith", "fantasy")
+    add_book(client, "The Hobbit", "J.R.R. Tolkien", "fantasy dragons")
+    add_book(client, "Les Misérables", "Victor Hugo", "classic")
+
+    assert search(client, "title=hobb") == ["The Hobbit"]
+    assert search(client, "author=tolk") == ["The Hobbit"]
+    # Accents are ignored
+    assert search(client, "q=miserables") == ["Les Misérables"]
+    # A title match ranks above a subject-only match
+    assert search(client, "q=dragon") == ["Dragon Tales", "The Hobbit"]
+    # Every word must match
+    assert search(client, "q=dragon+hugo") == []
+    # FTS5 syntax in user input is treated as plain words
+    assert search(client, 'q="hobbit" OR NOT (') == []
+
+
+def test_punctuation_only_filters_match_as_substrings(client):
+    add_book(client, "Dragon Tales", "Anne Smith", "fantasy")
+    add_book(client, "Help!!!", "Anne Smith", "humour")
+
+    # No word characters for the index: the filter is a substring match, never "no filter"
+    assert search(client, "title=%21%21%21") == ["Help!!!"]
+    assert search(client, "title=%3F%3F") == []
+    assert search(client, "q=%21%21%21&author=smith") == ["Help!!!"]
+    assert search(client, "title=%21%21%21&author=tales") == []
+
+
+def test_index_follows_catalog_edits(client):
+    add_book(client, "Glimmerwood", "Ottoline Prask", "fantasy")
+    assert search(client, "title=glimmer") == ["Glimmerwood"]
+
+    client.put("/books/1", data=json.dumps({"title": "Shadowfen"}), content_type="application/json")
+    assert search(client, "title=glimmer") == []
+    assert search(client, "title=shadow") == ["Shadowfen"]
+
+    client.delete("/books/1")
+    assert search(client, "q=shadowfen") == []
+
+
+def test_backfill_for_existing_database(client):
+    """Without the index, search falls back to substring matching; the backfill indexes existing books."""
+    for name in ("books_fts_ai", "books_fts_ad", "books_fts_au"):
+        db.session.execute(text(f"DROP TRIGGER {name}"))
+    db.session.execute(text("DROP TABLE books_fts"))
+    db.session.commit()
+    add_book(client, "The Hobbit", "J.R.R. Tolkien", "fantasy")
+    assert not search_index_exists()
+    assert search(client, "title=obbi") == ["The Hobbit"]
+
+    assert rebuild_search_index() == 1
+    assert search_index_exists()
+    assert search(client, "author=tolk") == ["The Hobbit"]
+
+
+def all_pages(client, query_string, limit):
+    """Follows next_cursor until the last page and returns the titles per page."""
+    pages, cursor = [], None
+    while True:
+        url = f"/books?{query_string}&limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+        data = json.loads(client.get(url).data)
+        pages.append([book["title"] for book in data["books"]])
+        cursor = data["next_cursor"]
+        if not cursor:
+            return pages
+
+
+def test_keyset_pagination_by_id(client):
+    for i in range(7):
+        add_book(client, f"Book {i}", "Author", "fantasy")
+    pages = all_pages(client, "", limit=3)
+    assert pages == [["Book 0", "Book 1", "Book 2"], ["Book 3", "Book 4", "Book 5"], ["Book 6"]]
+
+    # Deleting a book that was already shown does not shift the next page
+    first = json.loads(client.get("/books?limit=3").data)
+    client.delete("/books/1")
+    second = json.loads(client.get(f"/books?limit=3&cursor={first['next_cursor']}").data)
+    assert [book["title"] for book in second["books"]] == ["Book 3", "Book 4", "Book 5"]
+
+
+def test_pagination_keeps_relevance_and_title_order(client):
+    add_book(client, "Dragon Tales", "Anne Smith", "fantasy")
+    add_book(client, "The Hobbit", "J.R.R. Tolkien", "fantasy dragons")
+    add_book(client, "Dragon Tales", "Bob Jones", "fantasy")
+    add_book(client, "Dragons of Autumn", "Weis", "fantasy dragons")
+
+    full = search(client, "q=dragon")
+    assert [title for page in all_pages(client, "q=dragon", limit=1) for title in page] == full
+    assert full[-1] == "The Hobbit"
+
+    assert all_pages(client, "sort=title", limit=2) == [["Dragon Tales", "Dragon Tales"], ["Dragons of Autumn", "The Hobbit"]]
+
+
+def test_pagination_parameters_are_validated(client):
+    assert client.get("/books?limit=0").status_code == 400
+    assert client.get("/books?limit=abc").status_code == 400
+    assert client.get("/books?sort=rating").status_code == 400
+    assert client.get("/books?cursor=not-a-cursor").status_code == 400
+    # Oversized pages are clamped instead of rejected
+    assert client.get("/books?limit=100000").status_code == 200
+
+
+def test_repeated_searches_come_from_cache(client):
+    from app.utils.search_cache import search_cache
+    add_book(client, "The Hobbit", "J.R.R. Tolkien", "fantasy")
+    search_cache.clear()
+    hits = search_cache.hits
+
+    assert search(client, "title=hobbit") == ["The Hobbit"]
+    # Case and spacing of the search text do not change the cache key
+    assert search(client, "title=%20HOBBIT") == ["The Hobbit"]
+    assert search_cache.hits == hits + 1
+    stats = json.loads(client.get("/books/cache_stats").data)["search_cache"]
+    assert stats["hits"] == search_cache.hits
+
+
+def test_catalog_changes_invalidate_cached_searches(client):
+    add_book(client, "The Hobbit", "J.R.R. Tolkien", "fantasy")
+    assert search(client, "q=tolkien") == ["The Hobbit"]
+
+    add_book(client, "The Silmarillion", "J.R.R. Tolkien", "fantasy")
+    assert search(client, "q=tolkien") == ["The Hobbit", "The Silmarillion"]
+
+    client.put("/books/1", data=json.dumps({"rack_location": "Z9"}), content_type="application/json")
+    response = json.loads(client.get("/books?q=tolkien").data)
+    assert response["books"][0]["rack_location"] == "Z9"
+
+    client.delete("/books/2")
+    assert search(client, "q=tolkien") == ["The Hobbit"]
+
+
+def test_copy_status_changes_bump_catalog_version(client):
+    from app.models import User
+    from app.utils.search_cache import catalog_version
+    from werkzeug.security import generate_password_hash
+    add_book(client, "The Hobbit", "J.R.R. Tolkien", "fantasy")
+    user = User(username="reader", email="reader@example.com", password=generate_password_hash("pw"),
+                role="member", is_active=True)
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+
+    before = catalog_version.current()
+    client.post("/checkout", data=json.dumps({"user_id": user.id, "book_id": 1}), content_type="application/json")
+    after_checkout = catalog_version.current()
+    assert after_checkout != before
+    client.post("/return", data=json.dumps({"user_id": user.id, "book_copy_id": 1}), content_type="application/json")
+    assert catalog_version.current() != after_checkout
+
+
+def test_catalog_version_is_shared_through_file(tmp_path):
+    """Another process bumping the shared version file invalidates this process's cache key."""
+    from app.utils.search_cache import CatalogVersion
+    path = str(tmp_path / "catalog_version")
+    ours, theirs = CatalogVersion(), CatalogVersion()
+    ours.configure(path)
+    theirs.configure(path)
+    before = ours.current()
+    theirs.bump()
+    assert ours.current() != before
+
+
+def add_dated_book(client, title, subject, publication_date, rack_location):
+    book_data = {
+        "title": title,
+        "author": "Author",
+        "subject": subject,
+        "publication_date": publication_date,
+        "rack_location": rack_location,
+        "num_copies": 1
+    }
+    return client.post("/books", data=json.dumps(book_data), content_type="application/json")
+
+
+def test_facet_counts_cover_the_filtered_set(client):
+    add_dated_book(client, "Dragon Tales", "Fantasy", "1995-03-01", "A1")
+    add_dated_book(client, "Dragon Song", "Fantasy", "2003-07-15", "A1")
+    add_dated_book(client, "Dragon Law", "Legal Thriller", "1999-01-01", "B2")
+    add_dated_book(client, "Dune", "Science Fiction", "1965-08-01", "C3")
+
+    # Counts cover every match, not only the first page
+    data = json.loads(client.get("/books?q=dragon&facets=true&limit=1").data)
+    assert len(data["books"]) == 1
+    assert data["facets"] == {
+        "subject": [{"value": "Fantasy", "count": 2}, {"value": "Legal Thriller", "count": 1}],
+        "decade": [{"value": 1990, "count": 2}, {"value": 2000, "count": 1}],
+        "rack_location": [{"value": "A1", "count": 2}, {"value": "B2", "count": 1}],
+    }
+    assert "facets" not in json.loads(client.get("/books?q=dragon").data)
+
+
+def test_facets_are_limited_in_sql(client, count_queries):
+    for number, (subject, rack) in enumerate([("Fantasy", "A1"), ("Fantasy", "A2"), ("Fantasy", "A3"),
+                                              ("Horror", "A4"), ("Horror", "A5"), ("Poetry", "A6")]):
+        add_dated_book(client, f"Book {number}", subject, "1995-03-01", rack)
+    client.application.config['BOOKS_FACET_LIMIT'] = 2
+    with count_queries() as statements:
+        facets = json.loads(client.get("/books?facets=true").data)["facets"]
+    assert facets["subject"] == [{"value": "Fantasy", "count": 3}, {"value": "Horror", "count": 2}]
+    assert facets["rack_location"] == [{"value": "A1", "count": 1}, {"value": "A2", "count": 1}]
+    assert facets["decade"] == [{"value": 1990, "count": 6}]
+    # One aggregate per facet, the top values picked by the database
+    aggregates = [statement for statement in statements if 'GROUP BY' in statement]
+    assert len(aggregates) == 3 and sum('LIMIT' in statement for statement in aggregates) == 2
+
+
+def test_narrowing_by_facet_values(client):
+    add_dated_book(client, "Dragon Tales", "Fantasy", "1995-03-01", "A1")
+    add_dated_book(client, "Dragon Song", "Fantasy", "2003-07-15", "A1")
+    add_dated_book(client, "Dragon Law", "Legal Thriller", "1999-01-01", "B2")
+
+    assert search(client, "q=dragon&decade=1990") == ["Dragon Tales", "Dragon Law"]
+    assert search(client, "decade=1990&rack_location=B2") == ["Dragon Law"]
+    data = json.loads(client.get("/books?decade=2000&facets=true").data)
+    assert data["facets"]["subject"] == [{"value": "Fantasy", "count": 1}]
+    assert client.get("/books?decade=1995").status_code == 400
+    assert client.get("/books?decade=abc").status_code == 400
+
+
+def test_subject_facet_results_agree_with_counts(client):
+    add_dated_book(client, "Cosmos", "Science", "1980-01-01", "A1")
+    add_dated_book(client, "Brief History", "Science", "1988-01-01", "A1")
+    add_dated_book(client, "SICP", "Computer Science", "1985-01-01", "B2")
+    add_dated_book(client, "Dragon Book", "Computer Science", "1986-01-01", "B2")
+    add_dated_book(client, "Dune", "Science Fiction", "1965-08-01", "C3")
+
+    facets = json.loads(client.get("/books?facets=true").data)["facets"]
+    assert {"value": "Science", "count": 2} in facets["subject"]
+    assert search(client, "subject_facet=Science") == ["Cosmos", "Brief History"]
+    assert search(client, "subject_facet=Science&q=cosmos") == ["Cosmos"]
+    # The subject text filter still matches words anywhere in the subject
+    assert len(search(client, "subject=science")) == 5
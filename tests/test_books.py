@@ -7,10 +7,8 @@ from werkzeug.security import generate_password_hash
 
 @pytest.fixture
 def client():
-    app = create_app()
-    app.config['TESTING'] = True
     # Use an in-memory database for testing
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     with app.app_context():
         db.create_all()
         yield app.test_client()
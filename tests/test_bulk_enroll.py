@@ -0,0 +1,124 @@
+import io
+import json
+from unittest.mock import patch
+import pytest
+from werkzeug.security import check_password_hash
+from app import create_app, db
+from app.models import User
+from app.utils.bulk_enroll import enroll_users, hash_passwords
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    app.config['ENROLL_HASH_WORKERS'] = 0
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client()
+        log_in(client, "registrar", "librarian")
+        yield client
+        db.session.remove()
+        db.drop_all()
+
+
+def log_in(client, username, role):
+    """
+    Adds a user with the given role and logs the client in as that user.
+    """
+    user = User(username=username, email=f"{username}@example.com", password="x", role=role)
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+        sess['username'] = user.username
+        sess['role'] = user.role
+
+
+def test_enroll_requires_a_librarian(client):
+    users = [{"username": "intruder", "email": "intruder@example.org", "password": "pw", "role": "librarian"}]
+    log_in(client, "reader", "member")
+    response = client.post("/members/bulk", json=users)
+    assert response.status_code == 403
+    with client.session_transaction() as sess:
+        sess.clear()
+    assert client.post("/members/bulk", json=users).status_code == 403
+    assert User.query.filter_by(username="intruder").count() == 0
+
+
+def test_enroll_json_with_error_report(client):
+    db.session.add(User(username="taken", email="taken@example.com", password="x", role="member"))
+    db.session.commit()
+    users = [
+        {"username": "pupil1", "email": "pupil1@school.org", "password": "pw1"},
+        {"username": "teacher", "email": "teacher@school.org", "password": "pw2", "role": "librarian"},
+        {"username": "taken", "email": "new@school.org", "password": "pw"},
+        {"username": "pupil2", "email": "pupil1@school.org", "password": "pw"},
+        {"username": "pupil3", "email": "pupil3@school.org"},
+        {"username": "pupil4", "email": "pupil4@school.org", "password": "pw", "role": "admin"},
+    ]
+    response = client.post("/members/bulk", data=json.dumps({"users": users}), content_type="application/json")
+    assert response.status_code == 200
+    report = json.loads(response.data)
+    assert report["created"] == 2 and report["failed"] == 4
+    assert [(error["row"], error["error"]) for error in report["errors"]] == [
+        (3, "User with that username or email already exists"),
+        (4, "Duplicate email in the input"),
+        (5, "Missing required fields"),
+        (6, "Invalid role 'admin'"),
+    ]
+    teacher = User.query.filter_by(username="teacher").one()
+    assert teacher.role == "librarian" and teacher.is_active
+    assert check_password_hash(User.query.filter_by(username="pupil1").one().password, "pw1")
+
+
+def test_enroll_keeps_passwords_as_given(client):
+    users = [{"username": " pupil1 ", "email": "pupil1@school.org ", "password": " secret "}]
+    report = json.loads(client.post("/members/bulk", json={"users": users}).data)
+    assert report["created"] == 1
+    pupil = User.query.filter_by(username="pupil1", email="pupil1@school.org").one()
+    assert check_password_hash(pupil.password, " secret ")
+    assert not check_password_hash(pupil.password, "secret")
+
+
+def test_enroll_csv_body_and_upload(client):
+    csv_text = "Email,Username,Password\npupil1@school.org,pupil1,pw1\npupil2@school.org,pupil2,pw2\n"
+    response = client.post("/members/bulk", data=csv_text, content_type="text/csv")
+    assert json.loads(response.data) == {"created": 2, "failed": 0, "errors": []}
+
+    upload = {"file": (io.BytesIO(b"username,email,password\npupil1,other@school.org,pw\n"), "users.csv")}
+    report = json.loads(client.post("/members/bulk", data=upload, content_type="multipart/form-data").data)
+    assert report["created"] == 0 and report["errors"][0]["row"] == 1
+    assert User.query.filter_by(role="member").count() == 2
+
+
+def test_enroll_invalid_requests(client):
+    assert client.post("/members/bulk", data=json.dumps([]), content_type="application/json").status_code == 400
+    assert client.post("/members/bulk", data="name,mail\na,b\n", content_type="text/csv").status_code == 400
+    client.application.config['ENROLL_MAX_ROWS'] = 1
+    users = [{"username": f"u{number}", "email": f"u{number}@x.org", "password": "pw"} for number in range(2)]
+    assert client.post("/members/bulk", data=json.dumps(users), content_type="application/json").status_code == 400
+
+
+def test_batches_and_conflicting_rows(client):
+    records = [{"username": f"user{number}", "email": f"user{number}@x.org", "password": "pw"} for number in range(5)]
+    report = enroll_users(records[:3], batch_size=2)
+    assert report == {"created": 3, "failed": 0, "errors": []}
+
+    # A user registered after the duplicate check: the batch holding the conflicting row falls back to row by row
+    db.session.add(User(username="user3", email="other@x.org", password="x", role="member"))
+    db.session.commit()
+    validated = ([(row, dict(record, role="member")) for row, record in enumerate(records[3:], 1)], [])
+    with patch('app.utils.bulk_enroll.validate_enrollment', return_value=validated):
+        report = enroll_users(records[3:], batch_size=2)
+    assert report["created"] == 1
+    assert report["errors"] == [{"row": 1, "username": "user3", "email": "user3@x.org",
+                                 "error": "User with that username or email already exists"}]
+    assert User.query.filter_by(role="member").count() == 5
+
+
+def test_hash_passwords_in_a_process_pool():
+    hashes = hash_passwords(["first", "second", "third"], workers=2)
+    assert [check_password_hash(password_hash, password)
+            for password_hash, password in zip(hashes, ["first", "second", "third"])] == [True, True, True]
@@ -0,0 +1,204 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+import pytest
+from sqlalchemy import event, text
+from app import create_app, db
+from app.models import Book, BookCopy, Reservation, Transaction, User
+from app.utils.circulation import claim_available_copy, claim_next_reservation, close_loan
+
+
+@pytest.fixture
+def client(tmp_path):
+    # A temporary database file: an in-memory one is a single connection, shared by all the request threads
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'library.db'}"})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def add_book(copies):
+    book = Book(title="Popular Book", author="Author", subject="fiction",
+                publication_date=date(2000, 1, 1), rack_location="R1")
+    db.session.add(book)
+    db.session.flush()
+    db.session.add_all(BookCopy(book_id=book.id, unique_barcode=f"RACE-{book.id}-{number}") for number in range(copies))
+    db.session.commit()
+    return book.id
+
+
+def add_members(count):
+    members = [User(username=f"racer{number}", email=f"racer{number}@example.com", password="x", role="member")
+               for number in range(count)]
+    db.session.add_all(members)
+    db.session.commit()
+    return [member.id for member in members]
+
+
+def post_as(app, member_id, url, data):
+    """
+    Posts as a logged-in member with a client of its own, so concurrent requests share no state.
+    """
+    member_client = app.test_client()
+    with member_client.session_transaction() as sess:
+        sess['user_id'] = member_id
+    return member_client.post(url, json=data)
+
+
+def test_concurrent_checkouts_never_share_a_copy(client):
+    app = client.application
+    copies, threads = 20, 8
+    book_id = add_book(copies)
+    member_ids = add_members(60)
+
+    def checkout(member_id):
+        return post_as(app, member_id, '/checkout', {'user_id': member_id, 'book_id': book_id}).status_code
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        statuses = list(executor.map(checkout, member_ids))
+
+    assert Counter(statuses) == {201: copies, 404: len(member_ids) - copies}
+    db.session.expire_all()
+    open_loans = Counter(copy_id for copy_id, in db.session.query(Transaction.book_copy_id)
+                         .filter(Transaction.date_returned == None))
+    assert len(open_loans) == copies and set(open_loans.values()) == {1}
+    assert BookCopy.query.filter_by(status='checked-out').count() == copies
+
+
+def test_concurrent_checkouts_keep_the_loan_limit(client):
+    app = client.application
+    app.config['MAX_ACTIVE_LOANS'] = 3
+    books = [add_book(1) for _ in range(12)]
+    member_id = add_members(1)[0]
+
+    def checkout(book_id):
+        return post_as(app, member_id, '/checkout', {'user_id': member_id, 'book_id': book_id}).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(checkout, books))
+
+    assert Counter(statuses) == {201: 3, 400: len(books) - 3}
+    db.session.expire_all()
+    assert Transaction.query.filter_by(user_id=member_id, date_returned=None).count() == 3
+    assert BookCopy.query.filter_by(status='checked-out').count() == 3
+
+
+def test_concurrent_returns_close_a_loan_once(client):
+    add_book(1)
+    member_id = add_members(1)[0]
+    copy = BookCopy.query.one()
+    copy.status = 'checked-out'
+    issued = datetime.utcnow() - timedelta(days=15)
+    db.session.add(Transaction(user_id=member_id, book_copy_id=copy.id, transaction_type='checkout',
+                               date_issued=issued, due_date=issued + timedelta(days=10)))
+    db.session.commit()
+    copy_id = copy.id
+
+    app = client.application
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(
+            lambda _: post_as(app, member_id, '/return', {'user_id': member_id, 'book_copy_id': copy_id}),
+            range(4)))
+    assert sorted(response.status_code for response in responses) == [200, 404, 404, 404]
+    assert [response.get_json()['fine_amount'] for response in responses if response.status_code == 200] == [5.0]
+    db.session.expire_all()
+    loan = Transaction.query.one()
+    assert loan.transaction_type == 'returned' and loan.date_returned is not None and loan.fine_amount == 5.0
+    assert db.session.get(BookCopy, copy_id).status == 'available'
+
+
+def test_close_loan_without_returning_support(client):
+    add_book(1)
+    member_id = add_members(1)[0]
+    copy_id = BookCopy.query.one().id
+    now = datetime.utcnow()
+    db.session.add(Transaction(user_id=member_id, book_copy_id=copy_id, transaction_type='checkout',
+                               date_issued=now - timedelta(days=12), due_date=now - timedelta(days=2)))
+    db.session.commit()
+    loan_id = Transaction.query.one().id
+
+    # Databases without UPDATE ... RETURNING read the loan, then close it with a conditional UPDATE
+    with patch.object(db.engine.dialect, 'update_returning', False):
+        assert close_loan(member_id, copy_id, now) == (loan_id, 2.0)
+        assert close_loan(member_id, copy_id, now) is None
+    db.session.commit()
+    assert Transaction.query.one().fine_amount == 2.0
+
+
+def test_checkout_throughput_with_many_threads(client, record_property):
+    app = client.application
+    books = [add_book(10) for _ in range(4)]
+    member_ids = add_members(40)
+    threads = 16
+
+    def checkout(position):
+        member_id = member_ids[position]
+        return post_as(app, member_id, '/checkout',
+                       {'user_id': member_id, 'book_id': books[position % len(books)]}).status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        statuses = list(executor.map(checkout, range(len(member_ids))))
+    rate = len(statuses) / (time.perf_counter() - started)
+    record_property('checkouts_per_second', rate)
+    assert statuses == [201] * len(member_ids)
+    db.session.expire_all()
+    assert len({loan.book_copy_id for loan in Transaction.query}) == len(member_ids)
+
+
+def test_claim_moves_on_when_a_copy_is_taken_meanwhile(client):
+    book_id = add_book(3)
+    first_copy = BookCopy.query.order_by(BookCopy.id).first().id
+
+    # Another request checks out the first candidate between the read and the conditional UPDATE
+    stolen = []
+
+    def steal(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE book_copies') and not stolen:
+            stolen.append(first_copy)
+            with db.engine.begin() as other:
+                other.execute(text("UPDATE book_copies SET status = 'checked-out' WHERE id = :id"), {'id': first_copy})
+
+    event.listen(db.engine, 'before_cursor_execute', steal)
+    try:
+        copy_id = claim_available_copy(book_id)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', steal)
+    db.session.commit()
+    assert copy_id == first_copy + 1
+    assert BookCopy.query.filter_by(status='available').count() == 1
+
+    assert claim_available_copy(book_id) == first_copy + 2
+    assert claim_available_copy(book_id) is None
+
+
+def test_each_reservation_is_fulfilled_once(client):
+    book_id = add_book(2)
+    member_ids = add_members(4)
+    now = datetime.utcnow()
+    for member_id, copy in zip(member_ids[:2], BookCopy.query.order_by(BookCopy.id)):
+        copy.status = 'checked-out'
+        db.session.add(Transaction(user_id=member_id, book_copy_id=copy.id, transaction_type='checkout',
+                                   date_issued=now, due_date=now + timedelta(days=10)))
+    db.session.add_all([Reservation(user_id=member_ids[2], book_id=book_id),
+                        Reservation(user_id=member_ids[3], book_id=book_id)])
+    db.session.commit()
+    copy_ids = [copy.id for copy in BookCopy.query.order_by(BookCopy.id)]
+
+    app = client.application
+    with patch('app.routes.send_email_notification') as mock_notify:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            statuses = list(executor.map(
+                lambda loan: post_as(app, loan[0], '/return', {'user_id': loan[0], 'book_copy_id': loan[1]}).status_code,
+                zip(member_ids[:2], copy_ids)))
+    assert statuses == [200, 200]
+    # Both reservations notified, each exactly once
+    assert sorted(call.args[1] for call in mock_notify.call_args_list) == ['racer2@example.com', 'racer3@example.com']
+    db.session.expire_all()
+    assert [reservation.status for reservation in Reservation.query.order_by(Reservation.id)] == ['notified'] * 2
+    assert claim_next_reservation(book_id) is None
@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pytest
+from app.utils.embedding_store import QuantizedMatrix, load_store, quantize, write_store
+from app.utils.vector_search import ExactIndex
+
+
+def random_unit_vectors(n, dim=64, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 1e-6), ("float16", 2e-3), ("int8", 2e-2)])
+def test_quantized_scores_match_float32(dtype, tolerance):
+    matrix = random_unit_vectors(300)
+    queries = random_unit_vectors(3, seed=1)
+    data, scales = quantize(matrix, dtype)
+    quantized = QuantizedMatrix(data, scales)
+    assert np.allclose(quantized.score_rows(queries, slice(0, 300)), queries @ matrix.T, atol=tolerance)
+    assert np.allclose(quantized[[5, 7]], matrix[[5, 7]], atol=tolerance)
+
+
+def test_int8_store_is_a_quarter_of_float32():
+    matrix = random_unit_vectors(1000)
+    data, scales = quantize(matrix, "int8")
+    assert QuantizedMatrix(data, scales).nbytes < matrix.nbytes / 3
+
+
+def test_write_and_map_store(tmp_path):
+    matrix = random_unit_vectors(200)
+    book_ids = np.arange(1, 201, dtype=np.int64)
+    assert load_store(str(tmp_path), (200, "t1"), "float16") is None
+
+    ids, stored = write_store(str(tmp_path), (200, "t1"), "float16", book_ids, matrix)
+    assert isinstance(stored.data, np.memmap)
+    assert list(ids) == list(book_ids)
+
+    # Another process (or worker) maps the same files
+    ids2, stored2 = load_store(str(tmp_path), (200, "t1"), "float16")
+    assert np.array_equal(np.asarray(stored2.data), np.asarray(stored.data))
+
+    # Exact search runs directly on the mapped store
+    query = matrix[42:43]
+    rows, _ = ExactIndex(stored2).search(query, k=1)[0]
+    assert rows[0] == 42
+
+
+def test_new_version_replaces_old_files(tmp_path):
+    matrix = random_unit_vectors(10)
+    book_ids = np.arange(10, dtype=np.int64)
+    write_store(str(tmp_path), (10, "t1"), "int8", book_ids, matrix)
+    write_store(str(tmp_path), (10, "t2"), "int8", book_ids, matrix)
+    assert load_store(str(tmp_path), (10, "t1"), "int8") is None
+    assert load_store(str(tmp_path), (10, "t2"), "int8") is not None
+    assert len(os.listdir(tmp_path)) == 4  # ids, data, scales and the completion marker
+
+
+def test_unknown_dtype():
+    with pytest.raises(ValueError):
+        quantize(random_unit_vectors(2), "int4")
@@ -0,0 +1,126 @@
+import json
+from datetime import date
+import pytest
+from app import create_app, db
+from app.models import Book, BookTrigram
+from app.utils.fuzzy_search import candidate_book_ids, normalize_words, rebuild_trigram_index, similarity
+from app.utils.search_cache import catalog_version
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        # Start from an empty catalog so that result lists are exact
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def add_book(client, title, author, subject="fiction"):
+    book_data = {
+        "title": title,
+        "author": author,
+        "subject": subject,
+        "publication_date": "2000-01-01",
+        "rack_location": "R1",
+        "num_copies": 1
+    }
+    return client.post("/books", data=json.dumps(book_data), content_type="application/json")
+
+
+def fuzzy(client, query_string):
+    response = client.get("/books?mode=fuzzy&" + query_string)
+    assert response.status_code == 200
+    return json.loads(response.data)
+
+
+def add_sample_books(client):
+    add_book(client, "The Hobbit", "J.R.R. Tolkien", "fantasy")
+    add_book(client, "Crime and Punishment", "Fyodor Dostoevsky", "classic")
+    add_book(client, "Les Misérables", "Victor Hugo", "classic")
+    add_book(client, "Dune", "Frank Herbert", "science fiction")
+
+
+def test_similarity():
+    assert similarity(["tolkien"], "J.R.R. Tolkien") == 1.0
+    assert similarity(["tolkein"], "J.R.R. Tolkien") == pytest.approx(1 / 3)
+    assert similarity(["dostoyevsky"], "Fyodor Dostoevsky") > 0.6
+    assert similarity(["herbert"], "Victor Hugo") < 0.1
+    assert normalize_words("Les Misérables!") == ["les", "miserables"]
+
+
+def test_fuzzy_search_tolerates_typos(client):
+    add_sample_books(client)
+    results = fuzzy(client, "author=Dostoyevsky")["books"]
+    assert [book["title"] for book in results] == ["Crime and Punishment"]
+    assert 0 < results[0]["similarity"] < 1
+
+    assert [book["title"] for book in fuzzy(client, "q=tolkein")["books"]] == ["The Hobbit"]
+    assert [book["title"] for book in fuzzy(client, "title=miserabels")["books"]] == ["Les Misérables"]
+    # The title field does not match author names
+    assert fuzzy(client, "title=tolkein")["books"] == []
+    # Without mode=fuzzy the typo finds nothing
+    assert json.loads(client.get("/books?author=tolkein").data)["books"] == []
+
+
+def test_fuzzy_search_combines_with_exact_filters(client):
+    add_sample_books(client)
+    add_book(client, "The Silmarillion", "J.R.R. Tolkien", "mythology")
+    titles = [book["title"] for book in fuzzy(client, "author=tolkein&subject=fantasy")["books"]]
+    assert titles == ["The Hobbit"]
+
+
+def test_candidates_come_from_trigram_index(client):
+    add_sample_books(client)
+    hobbit = Book.query.filter_by(title="The Hobbit").one()
+    # Only books sharing trigrams with the query are candidates, best overlap first
+    assert candidate_book_ids("tolkein", ("author",), limit=10)[0] == hobbit.id
+    assert candidate_book_ids("zzqx", ("author",), limit=10) == []
+
+
+def test_trigram_index_follows_catalog_edits(client):
+    add_book(client, "Glimmerwood", "Ottoline Prask")
+    assert [book["id"] for book in fuzzy(client, "title=glimerwood")["books"]] == [1]
+
+    client.put("/books/1", data=json.dumps({"title": "Shadowfen"}), content_type="application/json")
+    assert fuzzy(client, "title=glimerwood")["books"] == []
+    assert [book["id"] for book in fuzzy(client, "title=shadofen")["books"]] == [1]
+
+    client.delete("/books/1")
+    assert BookTrigram.query.filter_by(book_id=1).count() == 0
+
+
+def test_books_added_outside_the_app_need_a_rebuild(client):
+    add_book(client, "!!!", "???")
+    db.session.add(Book(title="The Name of the Wind", author="Patrick Rothfuss", subject="fantasy",
+                        publication_date=date(2007, 3, 27), rack_location="A1"))
+    db.session.commit()
+    # Searching never writes to the index
+    assert fuzzy(client, "author=rothfus")["books"] == []
+    assert BookTrigram.query.count() == 0
+
+    assert rebuild_trigram_index(batch_size=1) == 2
+    catalog_version.bump()  # as build_search_index.py does
+    assert [book["title"] for book in fuzzy(client, "author=rothfus")["books"]] == ["The Name of the Wind"]
+
+
+def test_fuzzy_results_are_paginated(client):
+    for i in range(5):
+        add_book(client, f"Chronicles {i}", "Tolkien")
+    first = fuzzy(client, "author=tolkein&limit=3")
+    second = fuzzy(client, f"author=tolkein&limit=3&cursor={first['next_cursor']}")
+    ids = [book["id"] for book in first["books"] + second["books"]]
+    assert ids == [1, 2, 3, 4, 5]
+    assert second["next_cursor"] is None
+    assert client.get("/books?mode=approximate").status_code == 400
+
+
+def test_fuzzy_search_facets(client):
+    add_sample_books(client)
+    add_book(client, "The Silmarillion", "J.R.R. Tolkien", "mythology")
+    facets = fuzzy(client, "author=tolkein&facets=true&limit=1")["facets"]
+    assert facets["subject"] == [{"value": "fantasy", "count": 1}, {"value": "mythology", "count": 1}]
@@ -0,0 +1,54 @@
+import functools
+import time
+import numpy as np
+import pytest
+from app.utils.inference_pool import InferencePool, InferencePoolBusy, InferenceTimeout
+
+
+class FakeModel:
+    """Stand-in for SentenceTransformer that runs in the pool processes (must be importable there)."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def encode(self, texts, normalize_embeddings=False):
+        time.sleep(self.delay)
+        return np.array([[len(text), text.count(' ')] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(delay=0.0, **kwargs):
+        pool = InferencePool(functools.partial(FakeModel, delay), **kwargs)
+        pools.append(pool)
+        pool.warmup.result(timeout=60)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.shutdown()
+
+
+def test_encode_runs_in_pool(make_pool):
+    pool = make_pool(workers=2)
+    vectors = pool.encode(["a book", "three word title"], normalize_embeddings=True)
+    assert vectors.tolist() == [[6, 1], [16, 2]]
+
+
+def test_pool_rejects_jobs_when_saturated(make_pool):
+    pool = make_pool(delay=0.5, workers=1, max_pending=2)
+    pending = [pool.submit(["slow"]) for _ in range(2)]
+    with pytest.raises(InferencePoolBusy):
+        pool.submit(["one too many"])
+    for future in pending:
+        future.result(timeout=10)
+    # Slots are released once jobs finish
+    assert pool.encode(["ok"]).shape == (1, 2)
+
+
+def test_encode_times_out(make_pool):
+    pool = make_pool(delay=1.0, workers=1, timeout=0.1)
+    with pytest.raises(InferenceTimeout):
+        pool.encode(["slow"])
@@ -5,10 +5,8 @@ from app.models import Book, BookCopy
 
 @pytest.fixture
 def client():
-    app = create_app()
-    app.config['TESTING'] = True
     # Use in-memory SQLite database for testing
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     with app.app_context():
         db.create_all()
         yield app.test_client()
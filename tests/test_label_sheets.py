@@ -0,0 +1,124 @@
+import io
+import re
+import zipfile
+import zlib
+from datetime import date, datetime
+import pytest
+from PIL import Image
+from app import create_app, db
+from app.models import Book, BookCopy
+from app.utils.label_sheets import LABELS_PER_PAGE, PAGE_SIZE, select_labels, write_label_sheets
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    app.config['LABEL_SHEET_WORKERS'] = 0
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def add_books(count, copies=2, created_at=None):
+    """
+    Adds `count` books with `copies` copies each; returns the books.
+    """
+    books = []
+    for _ in range(count):
+        book = Book(title=f"Label Book {len(books)}", author="Author", subject="fiction",
+                    publication_date=date(2000, 1, 1), rack_location="R1")
+        db.session.add(book)
+        db.session.flush()
+        for number in range(copies):
+            db.session.add(BookCopy(book_id=book.id, unique_barcode=f"{book.id}-{number + 1}", created_at=created_at))
+        books.append(book)
+    db.session.commit()
+    return books
+
+
+def pdf_pages(pdf):
+    """
+    Checks the cross-reference table of a PDF and returns its page count.
+    """
+    assert pdf.startswith(b'%PDF-1.4')
+    assert pdf.rstrip().endswith(b'%%EOF')
+    xref_position = int(re.search(rb'startxref\n(\d+)', pdf).group(1))
+    assert pdf[xref_position:].startswith(b'xref\n')
+    offsets = re.findall(rb'(\d{10}) 00000 n ', pdf[xref_position:])
+    for number, offset in enumerate(offsets, 1):
+        assert pdf[int(offset):].startswith(f"{number} 0 obj".encode())
+    return int(re.search(rb'/Type /Pages /Kids \[[^\]]*\] /Count (\d+)', pdf).group(1))
+
+
+def test_select_labels_by_range_copies_and_since(client):
+    books = add_books(3, created_at=datetime(2024, 1, 1))
+    new_book = add_books(1, created_at=datetime(2024, 6, 1))[0]
+
+    labels = select_labels(book_from=books[1].id, book_to=books[2].id)
+    assert [code for code, _ in labels] == [f"{books[1].id}-1", f"{books[1].id}-2",
+                                            f"{books[2].id}-1", f"{books[2].id}-2"]
+    assert labels[0][1] == "Label Book 1"
+
+    copy_id = BookCopy.query.filter_by(unique_barcode=f"{books[0].id}-2").one().id
+    assert select_labels(copy_ids=[copy_id]) == [(f"{books[0].id}-2", "Label Book 0")]
+
+    assert [code for code, _ in select_labels(since=datetime(2024, 3, 1))] == [f"{new_book.id}-1", f"{new_book.id}-2"]
+
+
+def test_pdf_sheets(client):
+    labels = [(f"COPY-{number}", f"A rather long book title number {number} that does not fit") for number in range(30)]
+    output = io.BytesIO()
+    assert write_label_sheets(labels, output) == 2
+    pdf = output.getvalue()
+    assert pdf_pages(pdf) == 2
+
+    # The page images are PNG data: per-row filter byte plus one byte per pixel
+    width, height = PAGE_SIZE
+    image = re.search(rb'/Length (\d+) >>\nstream\n', pdf)
+    data = pdf[image.end():image.end() + int(image.group(1))]
+    assert len(zlib.decompress(data)) == height * (width + 1)
+
+
+def test_png_sheets_in_a_process_pool(client):
+    labels = [(f"COPY-{number}", f"Title {number}") for number in range(LABELS_PER_PAGE * 2 + 1)]
+    output = io.BytesIO()
+    assert write_label_sheets(labels, output, 'png', workers=2) == 3
+    with zipfile.ZipFile(output) as archive:
+        assert archive.namelist() == ['labels_0001.png', 'labels_0002.png', 'labels_0003.png']
+        page = Image.open(io.BytesIO(archive.read('labels_0003.png')))
+    assert page.size == PAGE_SIZE
+    # Only the first label cell of the last page is printed
+    assert page.crop((0, 0, PAGE_SIZE[0] // 3, PAGE_SIZE[1] // 8)).getextrema()[0] == 0
+    assert page.crop((PAGE_SIZE[0] // 2, PAGE_SIZE[1] // 2, PAGE_SIZE[0], PAGE_SIZE[1])).getextrema() == (255, 255)
+
+
+def test_labels_endpoint(client):
+    books = add_books(2)
+    response = client.post('/labels', json={'book_from': books[0].id, 'book_to': books[1].id})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert 'labels.pdf' in response.headers['Content-Disposition']
+    assert pdf_pages(response.data) == 1
+
+    response = client.post('/labels', json={'copy_ids': [1, 2], 'format': 'png'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert zipfile.ZipFile(io.BytesIO(response.data)).namelist() == ['labels_0001.png']
+
+
+def test_labels_endpoint_errors(client):
+    add_books(2)
+    assert client.post('/labels', json={}).status_code == 400
+    assert client.post('/labels', json={'book_from': 1, 'format': 'gif'}).status_code == 400
+    assert client.post('/labels', json={'copy_ids': 'all'}).status_code == 400
+    assert client.post('/labels', json={'since': 'yesterday'}).status_code == 400
+    assert client.post('/labels', json={'book_from': 100}).status_code == 404
+
+    client.application.config['LABEL_SHEET_MAX_LABELS'] = 3
+    response = client.post('/labels', json={'book_from': 1})
+    assert response.status_code == 400
+    assert 'maximum is 3' in response.get_json()['error']
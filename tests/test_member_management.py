@@ -6,10 +6,8 @@ from werkzeug.security import generate_password_hash
 
 @pytest.fixture
 def client():
-    app = create_app()
-    app.config['TESTING'] = True
     # Use an in-memory SQLite database for testing
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     with app.app_context():
         db.create_all()
         yield app.test_client()
@@ -48,6 +46,49 @@ def test_get_members(client):
     assert "email" in member
     assert "is_active" in member
 
+def test_get_members_pages(client):
+    """Test following next_cursor through all members, with librarians left out."""
+    for number in range(7):
+        register_member(client, f"page{number}", f"page{number}@example.com")
+    db.session.add(User(username="librarian", email="lib@example.com", password="x", role="librarian"))
+    db.session.commit()
+
+    usernames, cursor = [], None
+    while True:
+        url = "/members?limit=3" + (f"&cursor={cursor}" if cursor else "")
+        data = json.loads(client.get(url).data)
+        assert len(data["members"]) <= 3
+        usernames += [member["username"] for member in data["members"]]
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+    assert usernames == [f"page{number}" for number in range(7)]
+
+def test_get_members_prefix_search(client):
+    """Test the case-insensitive username/email prefix search."""
+    register_member(client, "Annabel", "annabel@example.com")
+    register_member(client, "anne", "a.n@example.com")
+    register_member(client, "joanna", "ann.joanna@example.com")
+    register_member(client, "bob", "bob@example.com")
+
+    def search(q):
+        data = json.loads(client.get(f"/members?q={q}").data)
+        return sorted(member["username"] for member in data["members"])
+
+    assert search("ann") == ["Annabel", "anne", "joanna"]
+    assert search("ANNA") == ["Annabel"]
+    assert search("a.n") == ["anne"]
+    assert search("bob@") == ["bob"]
+    assert search("zz") == []
+
+def test_get_members_invalid_parameters(client):
+    """Test invalid page sizes and cursors."""
+    assert client.get("/members?limit=0").status_code == 400
+    response = client.get("/members?cursor=notacursor")
+    assert response.status_code == 400
+    # Decoder details are not exposed
+    assert json.loads(response.data) == {"error": "Invalid cursor"}
+
 def test_update_member(client):
     """Test updating a member's details."""
     # Register a member
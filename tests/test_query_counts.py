@@ -0,0 +1,79 @@
+import json
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+import pytest
+from app import create_app, db
+from app.models import Book, BookCopy, Reservation, Transaction, User
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def add_members_with_loans(members, start=0):
+    """
+    Adds `members` members, each with one overdue loan and one reservation of a different book.
+    """
+    now = datetime.utcnow()
+    for number in range(start, start + members):
+        user = User(username=f"member{number}", email=f"member{number}@example.com", password="x", role="member")
+        book = Book(title=f"Book {number}", author="Author", subject="fiction",
+                    publication_date=date(2000, 1, 1), rack_location="R1")
+        db.session.add_all([user, book])
+        db.session.flush()
+        copy = BookCopy(book_id=book.id, unique_barcode=f"COUNT-{number}", status="checked-out")
+        db.session.add(copy)
+        db.session.flush()
+        db.session.add(Transaction(user_id=user.id, book_copy_id=copy.id, transaction_type="checkout",
+                                   date_issued=now - timedelta(days=20), due_date=now - timedelta(days=10)))
+        db.session.add(Reservation(user_id=user.id, book_id=book.id, status="active"))
+    db.session.commit()
+    # Start every request from an empty identity map, as a real request would
+    db.session.expire_all()
+
+
+def queries_per_request(client, count_queries, url, rows, key):
+    db.session.remove()
+    with count_queries() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert len(json.loads(response.data)[key]) == rows
+    return len(statements)
+
+
+@pytest.mark.parametrize("url, key", [
+    ("/transactions?all=true", "transactions"),
+    ("/reservations?all=true", "reservations"),
+    ("/overdue_transactions", "overdue_transactions"),
+])
+def test_query_count_does_not_grow_with_rows(client, count_queries, url, key):
+    add_members_with_loans(2)
+    few = queries_per_request(client, count_queries, url, 2, key)
+    add_members_with_loans(10, start=2)
+    many = queries_per_request(client, count_queries, url, 12, key)
+    assert few == many == 1
+
+
+def test_borrowing_history_is_one_query(client, count_queries):
+    add_members_with_loans(1)
+    user_id = User.query.one().id
+    assert queries_per_request(client, count_queries, f"/borrowing_history?user_id={user_id}", 1, "borrowing_history") == 1
+
+
+def test_overdue_notifications_query_once(client, count_queries):
+    add_members_with_loans(5)
+    db.session.remove()
+    with patch('app.notify_overdue.send_email_notification') as mock_notify, count_queries() as statements:
+        from app.notify_overdue import notify_overdue_function
+        notify_overdue_function()
+    assert mock_notify.call_count == 5
+    assert "'Book 3'" in mock_notify.call_args_list[3].args[2]
+    assert len(statements) == 1
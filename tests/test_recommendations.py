@@ -0,0 +1,387 @@
+import json
+import hashlib
+import numpy as np
+import pytest
+from unittest.mock import patch
+from app import create_app, db
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from app.models import BookEmbedding, BookCopy, Transaction, User, UserTasteProfile
+from app.utils import model_loader
+from app.utils.inference_pool import InferencePoolBusy, InferenceTimeout
+from app.utils.prompt_cache import PromptCache, prompt_cache
+from app.utils.taste_profile import update_taste_profile, taste_vector
+
+
+class FakeModel:
+    """
+    Deterministic stand-in for SentenceTransformer: a hashed bag-of-words vector per text.
+    Counts encode calls so tests can check how much encoding a request does.
+    """
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.encode_calls = 0
+        self.encoded_texts = 0
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        self.encode_calls += 1
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        self.encoded_texts += len(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return vectors[0] if single else vectors
+
+
+@pytest.fixture
+def fake_model():
+    model = FakeModel()
+    prompt_cache.clear()
+    with patch('app.routes.get_model', return_value=model), \
+         patch('app.routes.get_loaded_model', return_value=model):
+        yield model
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def add_book(client, title, author, subject):
+    book_data = {
+        "title": title,
+        "author": author,
+        "subject": subject,
+        "publication_date": "2000-01-01",
+        "rack_location": "R1",
+        "num_copies": 1
+    }
+    return client.post("/books", data=json.dumps(book_data), content_type="application/json")
+
+
+def recommend(client, prompt):
+    return client.post("/recommend", data=json.dumps({"prompt": prompt}), content_type="application/json")
+
+
+def add_sample_books(client):
+    add_book(client, "The Hobbit", "Tolkien", "fantasy dragons")
+    add_book(client, "Dune", "Herbert", "science fiction desert")
+    add_book(client, "Gone Girl", "Flynn", "mystery thriller")
+
+
+def test_create_app_does_not_load_model():
+    """Creating the app (scripts, tests) must not import or load the transformer model."""
+    create_app()
+    assert model_loader.get_loaded_model() is None
+
+
+def test_recommend_warming_up(client):
+    """While the model is still loading, /recommend answers 503 with a Retry-After header."""
+    with patch('app.routes.get_model', return_value=None):
+        response = recommend(client, "fantasy")
+    assert response.status_code == 503
+    assert "warming up" in json.loads(response.data)["message"]
+    assert response.headers.get("Retry-After")
+
+
+def test_recommend_model_unavailable(client):
+    with patch('app.routes.get_model', side_effect=RuntimeError("no model")):
+        response = recommend(client, "fantasy")
+    assert response.status_code == 503
+    assert "unavailable" in json.loads(response.data)["error"]
+
+
+def test_recommend_inference_pool_busy(client, fake_model):
+    """A saturated inference pool answers 503 right away; catalog edits still succeed."""
+    with patch.object(fake_model, 'encode', side_effect=InferencePoolBusy("full")):
+        assert add_book(client, "Dune", "Herbert", "science fiction").status_code == 201
+        response = recommend(client, "desert planet")
+    assert response.status_code == 503
+    assert "busy" in json.loads(response.data)["message"]
+    assert response.headers.get("Retry-After")
+
+
+def test_recommend_inference_timeout(client, fake_model):
+    """Only a timed-out encode job answers 504; other timeouts are ordinary errors."""
+    add_sample_books(client)
+    with patch.object(fake_model, 'encode', side_effect=InferenceTimeout("slow")):
+        response = recommend(client, "desert planet")
+    assert response.status_code == 504
+    with patch.object(fake_model, 'encode', side_effect=TimeoutError("smtp")), pytest.raises(TimeoutError):
+        recommend(client, "space opera")
+
+
+def test_recommend_returns_best_match(client, fake_model):
+    add_sample_books(client)
+    response = recommend(client, "fantasy dragons")
+    assert response.status_code == 200
+    recs = json.loads(response.data)["recommendations"]
+    assert recs[0]["title"] == "The Hobbit"
+
+
+def test_recommend_encodes_only_prompt(client, fake_model):
+    """Book embeddings are stored when books are added; a recommendation only encodes the prompt."""
+    add_sample_books(client)
+    assert BookEmbedding.query.count() == 3
+    recommend(client, "fantasy")
+    before = fake_model.encoded_texts
+    recommend(client, "mystery")
+    assert fake_model.encoded_texts - before == 1
+
+
+def test_embedding_index_follows_catalog_edits(client, fake_model):
+    add_sample_books(client)
+    first = BookEmbedding.query.get(1).content_hash
+
+    # Changing only the rack location does not re-encode the book
+    encoded = fake_model.encoded_texts
+    client.put("/books/1", data=json.dumps({"rack_location": "Z9"}), content_type="application/json")
+    assert fake_model.encoded_texts == encoded
+    assert BookEmbedding.query.get(1).content_hash == first
+
+    # Changing the subject does
+    client.put("/books/1", data=json.dumps({"subject": "mystery detective"}), content_type="application/json")
+    assert BookEmbedding.query.get(1).content_hash != first
+
+    client.delete("/books/2")
+    assert BookEmbedding.query.get(2) is None
+    recs = json.loads(recommend(client, "science fiction desert").data).get("recommendations", [])
+    assert "Dune" not in [rec["title"] for rec in recs]
+
+
+def test_books_added_without_model_are_encoded_on_demand(client):
+    """Books added before the model is loaded are picked up by the next recommendation."""
+    with patch('app.routes.get_loaded_model', return_value=None):
+        add_sample_books(client)
+    assert BookEmbedding.query.count() == 0
+
+    model = FakeModel()
+    with patch('app.routes.get_model', return_value=model):
+        response = recommend(client, "science fiction")
+    assert response.status_code == 200
+    assert BookEmbedding.query.count() == 3
+    assert json.loads(response.data)["recommendations"][0]["title"] == "Dune"
+
+
+def recommend_batch(client, payload):
+    return client.post("/recommend/batch", data=json.dumps(payload), content_type="application/json")
+
+
+def test_recommend_batch_list(client, fake_model):
+    """All prompts of a batch are encoded with a single model call."""
+    add_sample_books(client)
+    recommend(client, "warm up")
+    calls = fake_model.encode_calls
+    response = recommend_batch(client, {"prompts": ["fantasy dragons", "", "mystery thriller"], "top_k": 1})
+    assert response.status_code == 200
+    assert fake_model.encode_calls - calls == 1
+    recs = json.loads(response.data)["recommendations"]
+    assert len(recs) == 3
+    assert recs[0][0]["title"] == "The Hobbit"
+    assert recs[1] == []
+    assert recs[2][0]["title"] == "Gone Girl"
+    assert len(recs[2]) == 1
+
+
+def test_recommend_batch_keyed(client, fake_model):
+    add_sample_books(client)
+    response = recommend_batch(client, {"prompts": {"user-1": "science fiction", "user-2": "fantasy"}})
+    assert response.status_code == 200
+    recs = json.loads(response.data)["recommendations"]
+    assert set(recs) == {"user-1", "user-2"}
+    assert recs["user-1"][0]["title"] == "Dune"
+    assert recs["user-2"][0]["title"] == "The Hobbit"
+
+
+def test_recommend_batch_validation(client, fake_model):
+    assert recommend_batch(client, {}).status_code == 400
+    assert recommend_batch(client, {"prompts": [1, 2]}).status_code == 400
+    assert recommend_batch(client, {"prompts": ["x"], "top_k": 0}).status_code == 400
+
+
+def test_repeated_prompt_skips_spellcheck_and_model(client, fake_model):
+    add_sample_books(client)
+    recommend(client, "Fantasy  dragons")
+    calls = fake_model.encode_calls
+    with patch('app.routes.correct_text') as mock_correct:
+        response = recommend(client, "fantasy dragons")
+    assert response.status_code == 200
+    assert json.loads(response.data)["recommendations"][0]["title"] == "The Hobbit"
+    mock_correct.assert_not_called()
+    assert fake_model.encode_calls == calls
+
+    stats = json.loads(client.get("/recommend/cache_stats").data)["prompt_cache"]
+    assert stats["hits"] >= 1
+    assert stats["size"] >= 1
+
+
+def test_prompt_cache_lru_and_ttl():
+    now = [0.0]
+    cache = PromptCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", "a", 1)
+    cache.put("b", "b", 2)
+    assert cache.get("A ") == ("a", 1)
+    cache.put("c", "c", 3)
+    # "b" was the least recently used entry
+    assert cache.get("b") is None
+    assert cache.get("a") == ("a", 1)
+    now[0] = 11.0
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+
+
+def test_quantized_store_with_exact_rerank(client, fake_model):
+    """With an int8 store and re-ranking, similarities are the exact float32 cosine similarities."""
+    from flask import current_app
+    current_app.config['RECOMMENDER_STORE_DTYPE'] = 'int8'
+    current_app.config['RECOMMENDER_RERANK_CANDIDATES'] = 10
+    add_sample_books(client)
+    recs = json.loads(recommend(client, "fantasy dragons").data)["recommendations"]
+    assert recs[0]["title"] == "The Hobbit"
+
+    book_vector = np.frombuffer(BookEmbedding.query.get(recs[0]["id"]).vector, dtype=np.float32)
+    prompt_vector = fake_model.encode("fantasy dragons")
+    expected = float(book_vector @ (prompt_vector / np.linalg.norm(prompt_vector)))
+    assert recs[0]["similarity"] == pytest.approx(expected, abs=1e-6)
+
+
+def login_member(client, username="reader"):
+    user = User(username=username, email=f"{username}@example.com", password=generate_password_hash("password"),
+                role="member", is_active=True)
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+        sess['username'] = user.username
+        sess['role'] = user.role
+    return user
+
+
+def checkout(client, user, book_id):
+    return client.post("/checkout", data=json.dumps({"user_id": user.id, "book_id": book_id}),
+                       content_type="application/json")
+
+
+def add_loan(user, book_id, days_ago):
+    """Inserts a (returned) loan issued `days_ago` days ago."""
+    copy = BookCopy.query.filter_by(book_id=book_id).first()
+    issued = datetime.utcnow() - timedelta(days=days_ago)
+    db.session.add(Transaction(user_id=user.id, book_copy_id=copy.id, transaction_type='returned',
+                               date_issued=issued, due_date=issued + timedelta(days=10),
+                               date_returned=issued + timedelta(days=5)))
+    db.session.commit()
+
+
+def test_recommend_for_me_uses_history_and_excludes_borrowed(client, fake_model):
+    add_book(client, "The Hobbit", "Tolkien", "fantasy dragons")
+    add_book(client, "Dune", "Herbert", "science fiction desert")
+    add_book(client, "Eragon", "Paolini", "fantasy dragons")
+    user = login_member(client)
+
+    response = client.get("/recommend/for_me")
+    assert "Borrow a few books first" in json.loads(response.data)["message"]
+
+    assert checkout(client, user, 1).status_code == 201
+    profile = UserTasteProfile.query.get(user.id)
+    assert profile.last_transaction_id == Transaction.query.first().id
+
+    recs = json.loads(client.get("/recommend/for_me").data)["recommendations"]
+    assert recs[0]["title"] == "Eragon"
+    assert "The Hobbit" not in [rec["title"] for rec in recs]
+    # No prompt is encoded at request time
+    encoded = fake_model.encoded_texts
+    client.get("/recommend/for_me")
+    assert fake_model.encoded_texts == encoded
+
+
+def test_recommend_for_me_requires_login(client):
+    assert client.get("/recommend/for_me").status_code == 403
+
+
+def test_taste_profile_weights_recent_loans(client, fake_model):
+    add_book(client, "The Hobbit", "Tolkien", "fantasy dragons")
+    add_book(client, "Dune", "Herbert", "science fiction desert")
+    user = login_member(client)
+    add_loan(user, 2, days_ago=720)
+    add_loan(user, 1, days_ago=1)
+    vector = taste_vector(update_taste_profile(user.id))
+    hobbit, dune = (np.frombuffer(BookEmbedding.query.get(i).vector, dtype=np.float32) for i in (1, 2))
+    assert vector @ hobbit > 0.9
+    assert vector @ dune < 0.2
+
+
+def test_taste_profile_incremental_matches_rebuild(client, fake_model):
+    """Folding loans one at a time (checkout by checkout) gives the same profile as a rebuild from history."""
+    add_sample_books(client)
+    user = login_member(client)
+    for book_id, days_ago in ((3, 200), (1, 30), (2, 45)):
+        add_loan(user, book_id, days_ago)
+        update_taste_profile(user.id)
+    incremental = np.frombuffer(UserTasteProfile.query.get(user.id).vector, dtype=np.float32).copy()
+
+    db.session.delete(UserTasteProfile.query.get(user.id))
+    db.session.commit()
+    rebuilt = np.frombuffer(update_taste_profile(user.id).vector, dtype=np.float32)
+    np.testing.assert_allclose(incremental, rebuilt, rtol=1e-5, atol=1e-6)
+
+
+def test_taste_profile_waits_for_missing_embeddings(client):
+    """A loan of a book without an embedding is folded in once the book has been encoded."""
+    with patch('app.routes.get_loaded_model', return_value=None):
+        add_sample_books(client)
+        user = login_member(client)
+        checkout(client, user, 1)
+    assert UserTasteProfile.query.get(user.id) is None
+
+    model = FakeModel()
+    with patch('app.routes.get_loaded_model', return_value=model):
+        recs = json.loads(client.get("/recommend/for_me").data)
+    assert UserTasteProfile.query.get(user.id).last_transaction_id == Transaction.query.first().id
+    assert "The Hobbit" not in [rec["title"] for rec in recs.get("recommendations", [])]
+
+
+def test_loans_without_embeddings_do_not_block_later_loans(client):
+    """A loan of a book without an embedding is skipped and kept pending; later loans are still folded."""
+    model = FakeModel()
+    with patch('app.routes.get_loaded_model', return_value=None):
+        add_book(client, "The Hobbit", "Tolkien", "fantasy dragons")
+    with patch('app.routes.get_loaded_model', return_value=model):
+        add_book(client, "Dune", "Herbert", "science fiction desert")
+        user = login_member(client)
+        checkout(client, user, 1)
+        checkout(client, user, 2)
+    first, second = [loan.id for loan in Transaction.query.order_by(Transaction.id)]
+    profile = UserTasteProfile.query.get(user.id)
+    assert (profile.last_transaction_id, profile.pending_transaction_ids) == (second, [first])
+
+    # Once the book is encoded the pending loan is folded in, giving the same profile as a rebuild
+    with patch('app.routes.get_loaded_model', return_value=model):
+        client.get("/recommend/for_me")
+    db.session.expire_all()
+    profile = UserTasteProfile.query.get(user.id)
+    assert (profile.last_transaction_id, profile.pending_transaction_ids) == (second, None)
+    incremental = np.frombuffer(profile.vector, dtype=np.float32).copy()
+    db.session.delete(profile)
+    db.session.commit()
+    rebuilt = np.frombuffer(update_taste_profile(user.id).vector, dtype=np.float32)
+    np.testing.assert_allclose(incremental, rebuilt, rtol=1e-5, atol=1e-6)
+
+
+def test_taste_profile_failure_does_not_undo_the_loan(client, fake_model):
+    add_sample_books(client)
+    user = login_member(client)
+    with patch('app.routes.update_taste_profile', side_effect=RuntimeError("boom")):
+        assert checkout(client, user, 1).status_code == 201
+    db.session.expire_all()
+    assert Transaction.query.filter_by(user_id=user.id).count() == 1
+    assert UserTasteProfile.query.get(user.id) is None
@@ -0,0 +1,152 @@
+from datetime import date, datetime
+import pytest
+from sqlalchemy import inspect, text
+from app import create_app, db
+from app.models import Book, BookCopy, Reservation, Transaction, User
+from app.routes import prefix_condition
+from app.utils.schema_upgrade import index_names as schema_index_names, missing_columns, missing_indexes, upgrade_schema
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def query_plan(query):
+    """
+    Returns SQLite's plan for an ORM query as one string.
+    """
+    sql = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return ' | '.join(row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+def index_names(table):
+    return schema_index_names(inspect(db.engine), table)
+
+
+def test_create_all_creates_indexes(client):
+    assert missing_indexes() == []
+    assert {'ix_transactions_open_due', 'ix_transactions_open_user_copy'} <= index_names('transactions')
+    assert 'ix_book_copies_book_status' in index_names('book_copies')
+    assert 'ix_reservations_book_status' in index_names('reservations')
+    assert {'ix_users_username_lower', 'ix_users_email_lower'} <= index_names('users')
+
+
+def test_upgrade_adds_indexes_and_keeps_data(client):
+    user = User(username="reader", email="reader@example.com", password="x", role="member")
+    book = Book(title="Dune", author="Frank Herbert", subject="science fiction",
+                publication_date=date(1965, 8, 1), rack_location="R1")
+    db.session.add_all([user, book])
+    db.session.flush()
+    copy = BookCopy(book_id=book.id, unique_barcode="UPGRADE-1", status="checked-out")
+    db.session.add(copy)
+    db.session.flush()
+    db.session.add(Transaction(user_id=user.id, book_copy_id=copy.id, transaction_type="checkout",
+                               due_date=datetime(2024, 1, 1)))
+    db.session.commit()
+
+    # A database created before the indexes and book_copies.created_at were declared
+    for index in [index for table in db.metadata.sorted_tables for index in table.indexes]:
+        db.session.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    db.session.execute(text("ALTER TABLE book_copies DROP COLUMN created_at"))
+    db.session.commit()
+    assert 'ix_transactions_open_due' in {index.name for index in missing_indexes()}
+    assert [column.name for column in missing_columns()] == ['created_at']
+
+    created = upgrade_schema()
+    assert created[0] == 'book_copies.created_at'
+    assert {'ix_transactions_open_due', 'ix_book_copies_created_at'} <= set(created)
+    assert missing_indexes() == [] and missing_columns() == []
+    assert Transaction.query.count() == 1
+    db.session.expire_all()
+    copy = BookCopy.query.one()
+    assert copy.unique_barcode == "UPGRADE-1" and copy.created_at is None
+    # Running it again does nothing
+    assert upgrade_schema() == []
+
+
+def test_upgrade_adds_and_fills_new_tables(client):
+    db.session.add(Book(title="The Hobbit", author="J.R.R. Tolkien", subject="fantasy",
+                        publication_date=date(1937, 9, 21), rack_location="A1"))
+    db.session.commit()
+    # A database created before the embedding, trigram and taste profile tables and the full-text index
+    for trigger in ('books_fts_ai', 'books_fts_ad', 'books_fts_au'):
+        db.session.execute(text(f"DROP TRIGGER {trigger}"))
+    for name in ('book_embeddings', 'book_trigrams', 'user_taste_profiles', 'books_fts'):
+        db.session.execute(text(f"DROP TABLE {name}"))
+    db.session.commit()
+
+    created = upgrade_schema()
+    assert {'book_embeddings', 'book_trigrams', 'user_taste_profiles', 'books_fts'} <= set(created)
+    assert {'book_embeddings', 'book_trigrams', 'user_taste_profiles'} <= set(inspect(db.engine).get_table_names())
+    # The existing book is found by the text and the fuzzy search
+    assert [book["title"] for book in client.get("/books?title=hobb").get_json()["books"]] == ["The Hobbit"]
+    assert [book["title"] for book in client.get("/books?mode=fuzzy&author=tolkein").get_json()["books"]] == ["The Hobbit"]
+    assert upgrade_schema() == []
+
+    response = client.post("/books", json={"title": "Dune", "author": "Frank Herbert", "subject": "science fiction",
+                                           "publication_date": "1965-08-01", "rack_location": "R1", "num_copies": 1})
+    assert response.status_code == 201
+
+
+def add_ledger(members=10, books=10, copies=5, loans_per_member=20):
+    """
+    Adds a catalog and a ledger shaped like real ones, where most loans are returned, and ANALYZEs the test
+    database so the planner sees that shape (without statistics it cannot tell the partial open-loan indexes
+    are smaller).
+    """
+    users = [User(username=f"member{number}", email=f"member{number}@example.com", password="x", role="member")
+             for number in range(members)]
+    db.session.add_all(users)
+    ledger_copies = []
+    for number in range(books):
+        book = Book(title=f"Ledger {number}", author="Author", subject="fiction",
+                    publication_date=date(2000, 1, 1), rack_location="R1")
+        db.session.add(book)
+        db.session.flush()
+        ledger_copies += [BookCopy(book_id=book.id, unique_barcode=f"LEDGER-{book.id}-{copy}")
+                          for copy in range(copies)]
+    db.session.add_all(ledger_copies)
+    db.session.flush()
+    db.session.add_all(Transaction(user_id=user.id, transaction_type="checkout", due_date=datetime(2024, 1, 1),
+                                   book_copy_id=ledger_copies[(user.id + loan) % len(ledger_copies)].id,
+                                   date_returned=None if loan == 0 else datetime(2024, 1, 1))
+                       for user in users for loan in range(loans_per_member))
+    db.session.commit()
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def test_hot_queries_use_indexes(client):
+    add_ledger()
+
+    overdue = Transaction.query.filter(Transaction.date_returned == None, Transaction.due_date < '2024-01-01')
+    assert 'USING INDEX ix_transactions_open_due' in query_plan(overdue)
+
+    open_loans = Transaction.query.filter_by(user_id=1, date_returned=None)
+    assert 'ix_transactions_open_user_copy' in query_plan(open_loans)
+    returning = Transaction.query.filter_by(user_id=1, book_copy_id=2, date_returned=None)
+    assert 'ix_transactions_open_user_copy' in query_plan(returning)
+
+    available_copy = BookCopy.query.filter_by(book_id=1, status='available')
+    assert 'USING INDEX ix_book_copies_book_status' in query_plan(available_copy)
+
+    queue = Reservation.query.filter_by(book_id=1, status='active')
+    assert 'ix_reservations_book_status' in query_plan(queue)
+
+    history = Transaction.query.filter_by(user_id=1).order_by(Transaction.date_issued.desc())
+    plan = query_plan(history)
+    assert 'ix_transactions_user_issued' in plan and 'TEMP B-TREE' not in plan
+
+    # Member prefix search (GET /members?q=): both expression indexes, no table scan
+    members = User.query.filter(db.or_(prefix_condition(db.func.lower(User.username), 'Ann'),
+                                       prefix_condition(db.func.lower(User.email), 'Ann')))
+    plan = query_plan(members)
+    assert 'ix_users_username_lower' in plan and 'ix_users_email_lower' in plan and 'SCAN users' not in plan, plan
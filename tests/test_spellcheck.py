@@ -0,0 +1,70 @@
+import json
+import pytest
+from app import create_app, db
+from app.utils import spellcheck
+from app.utils.spellcheck import SymSpellCorrector, correct_text, edit_distance, get_corrector
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def add_book(client, title, author, subject):
+    book_data = {
+        "title": title,
+        "author": author,
+        "subject": subject,
+        "publication_date": "2000-01-01",
+        "rack_location": "R1",
+        "num_copies": 1
+    }
+    return client.post("/books", data=json.dumps(book_data), content_type="application/json")
+
+
+def test_edit_distance():
+    assert edit_distance("fantasy", "fantasy", 2) == 0
+    assert edit_distance("fantsy", "fantasy", 2) == 1
+    assert edit_distance("tolkein", "tolkien", 2) == 1  # transposition
+    assert edit_distance("abc", "xyzabc", 2) == 3
+
+
+def test_symspell_lookup_prefers_distance_then_frequency():
+    corrector = SymSpellCorrector({"fantasy": 100, "fantastic": 500, "mystery": 80}, min_suggestion_frequency=0)
+    assert corrector.lookup("fantasy") == "fantasy"
+    assert corrector.lookup("fantsy") == "fantasy"
+    assert corrector.lookup("mystry") == "mystery"
+    assert corrector.lookup("qwertyuiop") is None
+
+
+def test_correct_text_fixes_common_typos():
+    assert correct_text("sciense fictoin") == "science fiction"
+    # Punctuation around a corrected word is kept, numbers are left alone
+    assert correct_text("fantsy, 1984") == "fantasy, 1984"
+
+
+def test_catalog_words_are_not_corrected(client):
+    """Author names and titles from the catalog are known words and become correction targets."""
+    add_book(client, "Zyxorian Chronicles", "Brandolf Quenthorpe", "fantasy")
+    spellcheck.load_catalog_vocabulary()
+    assert correct_text("Quenthorpe") == "Quenthorpe"
+    assert correct_text("quenthrope") == "quenthorpe"
+
+    # Deleting the book removes its words from the vocabulary again
+    client.delete("/books/1")
+    assert get_corrector().frequency("quenthorpe") is None
+
+
+def test_catalog_edits_update_vocabulary(client):
+    spellcheck.load_catalog_vocabulary()
+    add_book(client, "Glimmerwood", "Ottoline Prask", "fantasy")
+    assert get_corrector().frequency("glimmerwood")
+    client.put("/books/1", data=json.dumps({"title": "Shadowfen"}), content_type="application/json")
+    assert get_corrector().frequency("shadowfen")
+    assert get_corrector().frequency("glimmerwood") is None
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+import pytest
+from app import create_app, db
+from app.models import Book, BookCopy, Transaction, User
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    # Small chunks so the tests stream more than one
+    app.config['STREAM_CHUNK_SIZE'] = 2
+    with app.app_context():
+        # Start from an empty catalog so that result lists are exact
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def add_book(client, title, author="Author", subject="fiction"):
+    book_data = {
+        "title": title,
+        "author": author,
+        "subject": subject,
+        "publication_date": "2000-01-01",
+        "rack_location": "R1",
+        "num_copies": 1
+    }
+    return client.post("/books", data=json.dumps(book_data), content_type="application/json")
+
+
+def add_ledger(loans=5):
+    """
+    Adds a member with `loans` returned loans, one per book, and one loan by a deleted member.
+    """
+    member = User(username="reader", email="reader@example.com", password="x", role="member")
+    db.session.add(member)
+    db.session.flush()
+    issued = datetime(2024, 1, 1)
+    for number in range(loans + 1):
+        book = Book(title=f"Book {number}", author="Author", subject="fiction",
+                    publication_date=date(2000, 1, 1), rack_location="R1")
+        db.session.add(book)
+        db.session.flush()
+        copy = BookCopy(book_id=book.id, unique_barcode=f"STREAM-{number}", status="available")
+        db.session.add(copy)
+        db.session.flush()
+        db.session.add(Transaction(user_id=member.id if number < loans else 999, book_copy_id=copy.id,
+                                   transaction_type="return", date_issued=issued + timedelta(days=number),
+                                   due_date=issued + timedelta(days=number + 14),
+                                   date_returned=issued + timedelta(days=number + 7)))
+    db.session.commit()
+    return member.id
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_books_stream_as_ndjson(client):
+    for number in range(5):
+        add_book(client, f"Streamed {number}")
+    response = client.get("/books?format=ndjson&limit=1")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.is_streamed
+    # Every matching book, not one page
+    assert [book["title"] for book in ndjson(response)] == [f"Streamed {number}" for number in range(5)]
+
+    # The Accept header selects the format too, and the cursor of a page is honoured
+    page = json.loads(client.get("/books?limit=2").data)
+    response = client.get(f"/books?cursor={page['next_cursor']}", headers={"Accept": "application/x-ndjson"})
+    assert [book["title"] for book in ndjson(response)] == ["Streamed 2", "Streamed 3", "Streamed 4"]
+
+    # A regular request still returns one JSON page
+    assert json.loads(client.get("/books?limit=1").data)["next_cursor"]
+
+
+def test_books_stream_as_csv(client):
+    add_book(client, "The Hobbit", "J.R.R. Tolkien")
+    add_book(client, "Dune, Messiah", "Frank Herbert")
+    response = client.get("/books?format=csv&sort=title")
+    assert response.mimetype == "text/csv"
+    assert "attachment" in response.headers["Content-Disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row["title"] for row in rows] == ["Dune, Messiah", "The Hobbit"]
+    assert rows[1]["author"] == "J.R.R. Tolkien"
+
+    # Fuzzy matches carry their similarity
+    response = client.get("/books?format=ndjson&mode=fuzzy&author=tolkein")
+    assert [(book["title"], book["similarity"] > 0) for book in ndjson(response)] == [("The Hobbit", True)]
+
+
+def test_invalid_format(client):
+    for url in ("/books?format=xml", "/transactions?all=true&format=xml", "/borrowing_history?user_id=1&format=xml"):
+        response = client.get(url)
+        assert response.status_code == 400
+        assert "format" in json.loads(response.data)["error"]
+
+
+def test_transactions_stream(client):
+    member_id = add_ledger()
+    expected = json.loads(client.get("/transactions?all=true").data)["transactions"]
+    assert len(expected) == 6
+    assert expected[0]["username"] == "reader"
+    # The loan of the deleted member has empty user details
+    assert expected[-1]["username"] == "" and expected[-1]["membership_status"] == ""
+
+    response = client.get("/transactions?all=true&format=ndjson")
+    assert ndjson(response) == expected
+
+    response = client.get(f"/transactions?user_id={member_id}", headers={"Accept": "text/csv"})
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row["book_title"] for row in rows] == [f"Book {number}" for number in range(5)]
+    assert rows[0]["membership_status"] == "Active"
+
+
+def test_borrowing_history_stream(client):
+    member_id = add_ledger()
+    expected = json.loads(client.get(f"/borrowing_history?user_id={member_id}").data)["borrowing_history"]
+    # Latest first
+    assert [entry["book_title"] for entry in expected] == [f"Book {number}" for number in range(4, -1, -1)]
+    assert ndjson(client.get(f"/borrowing_history?user_id={member_id}&format=ndjson")) == expected
@@ -0,0 +1,100 @@
+import json
+import pytest
+from app import create_app, db
+from app.models import User
+from app.utils.user_cache import UserStatus, UserStatusCache, user_status_cache
+
+
+@pytest.fixture
+def client():
+    # Use an in-memory SQLite database for testing
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def login_member(client):
+    member = User(username="cached", email="cached@example.com", password="x", role="member", is_active=True)
+    db.session.add(member)
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['user_id'] = member.id
+        sess['role'] = 'member'
+    return member.id
+
+
+def checkout(client):
+    # Missing book_id: the handler answers 400 without a query, so only the membership check hits the database
+    return client.post('/checkout', data=json.dumps({'user_id': 1}), content_type='application/json')
+
+
+def test_membership_check_is_cached_between_requests(client, count_queries):
+    login_member(client)
+    with count_queries() as statements:
+        assert checkout(client).status_code == 400
+    assert len(statements) == 1
+    with count_queries() as statements:
+        assert checkout(client).status_code == 400
+        assert checkout(client).status_code == 400
+    assert statements == []
+
+
+@pytest.mark.parametrize("change", [
+    lambda client, member_id: client.delete(f"/members/{member_id}"),
+    lambda client, member_id: client.put(f"/members/{member_id}", data=json.dumps({'is_active': False}),
+                                         content_type='application/json'),
+])
+def test_member_endpoints_invalidate_the_cache(client, change):
+    member_id = login_member(client)
+    assert checkout(client).status_code == 400
+    assert change(client, member_id).status_code == 200
+    assert checkout(client).status_code == 403
+
+    assert client.put(f"/members/reactivate/{member_id}").status_code == 200
+    assert checkout(client).status_code == 400
+
+
+def test_cancel_own_membership_invalidates_the_cache(client):
+    member_id = login_member(client)
+    assert checkout(client).status_code == 400
+    assert client.post('/cancel_membership').status_code == 200
+    assert user_status_cache.get(member_id) is None
+
+
+def test_unknown_user_is_rejected(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 999
+    assert checkout(client).status_code == 403
+
+
+def test_entries_expire():
+    now = [0.0]
+    cache = UserStatusCache(maxsize=2, ttl=30, clock=lambda: now[0])
+    cache.put(1, UserStatus('member', True), cache.generation)
+    assert cache.get(1) == UserStatus('member', True)
+    now[0] = 31
+    assert cache.get(1) is None
+
+
+def test_lru_eviction_and_disabled_cache():
+    cache = UserStatusCache(maxsize=2)
+    for user_id in (1, 2, 3):
+        cache.put(user_id, UserStatus('member', True), cache.generation)
+    assert cache.get(1) is None and cache.get(3) is not None
+
+    cache.configure(0, 30)
+    cache.put(1, UserStatus('member', True), cache.generation)
+    assert cache.get(1) is None
+
+
+def test_status_read_before_an_invalidation_is_not_stored():
+    cache = UserStatusCache()
+    generation = cache.generation
+    # Another request cancels the membership while this one is still reading the old status
+    cache.invalidate(1)
+    cache.put(1, UserStatus('member', True), generation)
+    assert cache.get(1) is None
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from app.utils.vector_search import ExactIndex, IVFIndex, build_vector_index, top_k
+
+
+def random_unit_vectors(n, dim=32, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_top_k_orders_and_thresholds():
+    scores = np.array([0.2, 0.9, 0.05, 0.5, 0.7], dtype=np.float32)
+    rows, best = top_k(scores, 3)
+    assert list(rows) == [1, 4, 3]
+    rows, best = top_k(scores, 10, threshold=0.3)
+    assert list(rows) == [1, 4, 3]
+    assert np.all(best >= 0.3)
+
+
+def test_exact_index_matches_full_sort():
+    matrix = random_unit_vectors(500)
+    queries = random_unit_vectors(4, seed=1)
+    results = ExactIndex(matrix).search(queries, k=5)
+    for query, (rows, scores) in zip(queries, results):
+        expected = np.argsort(-(matrix @ query))[:5]
+        assert list(rows) == list(expected)
+        assert np.allclose(scores, (matrix @ query)[expected])
+
+
+def test_ivf_full_probe_is_exact():
+    """Scanning every cluster must return exactly the brute-force results."""
+    matrix = random_unit_vectors(1000)
+    queries = random_unit_vectors(5, seed=2)
+    ivf = IVFIndex(matrix, nlist=16, nprobe=16)
+    exact = ExactIndex(matrix).search(queries, k=10)
+    for (ivf_rows, _), (exact_rows, _) in zip(ivf.search(queries, k=10), exact):
+        assert list(ivf_rows) == list(exact_rows)
+
+
+def test_ivf_recall_on_clustered_data():
+    """With clustered data a few probes already find nearly all true neighbours."""
+    rng = np.random.default_rng(3)
+    centers = random_unit_vectors(20, seed=4)
+    matrix = centers[rng.integers(0, 20, 4000)] + 0.05 * rng.normal(size=(4000, 32)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    queries = matrix[rng.choice(4000, 20, replace=False)]
+    ivf = IVFIndex(matrix, nlist=20, nprobe=3)
+    exact = ExactIndex(matrix).search(queries, k=10)
+    hits = sum(len(set(a) & set(b)) for (a, _), (b, _) in zip(ivf.search(queries, k=10), exact))
+    assert hits / (10 * len(queries)) >= 0.9
+
+
+def test_build_vector_index_small_catalog_uses_exact():
+    matrix = random_unit_vectors(50)
+    assert isinstance(build_vector_index(matrix, kind='ivf', min_size=100), ExactIndex)
+    assert isinstance(build_vector_index(matrix, kind='ivf'), IVFIndex)
+    with pytest.raises(ValueError):
+        build_vector_index(matrix, kind='hnsw')
+
+
+def test_build_vector_index_reuses_centroids():
+    matrix = random_unit_vectors(400)
+    first = build_vector_index(matrix, kind='ivf', nlist=8)
+    second = build_vector_index(np.vstack([matrix, random_unit_vectors(10, seed=5)]), kind='ivf', nlist=8,
+                                previous=first)
+    assert second.centroids is first.centroids
@@ -0,0 +1,15 @@
+from app import create_app
+from app.utils.schema_upgrade import upgrade_schema
+
+# Upgrades an existing database (instance/library.db) to the current schema in place: adds new tables,
+# new columns (e.g. book_copies.created_at) and the indexes on hot query columns, and fills the new full-text
+# and trigram search indexes for the existing books. Existing rows are kept; running it again does nothing.
+# run.py does the same at start-up (SCHEMA_AUTO_UPGRADE).
+app = create_app()
+app.app_context().push()
+
+created = upgrade_schema()
+if created:
+    print(f"Added {len(created)} tables, columns and indexes: {', '.join(created)}")
+else:
+    print("Schema is up to date.")